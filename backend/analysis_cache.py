@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# 默认缓存 7 天，最多保留 5 万条，超出时按最近使用时间淘汰
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 50000
+
+
+def normalize_title(title):
+    """标题归一化：去掉首尾空白、合并连续空白、转小写"""
+    return re.sub(r"\s+", " ", str(title or "")).strip().lower()
+
+
+def normalize_price(price):
+    try:
+        return f"{float(price):.2f}"
+    except (TypeError, ValueError):
+        return str(price or "").strip()
+
+
+def fingerprint(item, model, prompt_version):
+    """
+    商品指纹：归一化标题 + 价格 + 模型 + 提示词版本，任一变化都会重新分析
+    想要人数、卖家、地区、重复发布次数等其他字段有意不计入（想要人数经常变化，计入后缓存几乎不会命中），
+    这些字段变化时仍使用缓存的结论
+    """
+    raw = "\x1f".join([normalize_title(item.get("title")), normalize_price(item.get("price")), model, prompt_version])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """
+    Gemini 分析结果缓存（SQLite）
+    每条商品一条记录：被推荐时保存模型给出的推荐内容，未被推荐时保存 null，两者都算命中
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS analysis_cache (
+                key TEXT PRIMARY KEY,
+                result TEXT,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_analysis_cache_last_used ON analysis_cache(last_used)")
+        self._conn.commit()
+
+    def get_many(self, keys):
+        """批量查询，返回 {key: 结果}（结果为 None 表示该商品未被推荐），过期记录视为未命中"""
+        if not keys:
+            return {}
+        now = time.time()
+        found = {}
+        with self._lock:
+            unique = list(set(keys))
+            for i in range(0, len(unique), 500):
+                batch = unique[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, result FROM analysis_cache WHERE key IN ({','.join('?' * len(batch))}) AND created_at > ?",
+                    batch + [now - self.ttl]
+                ).fetchall()
+                for key, result in rows:
+                    found[key] = json.loads(result) if result is not None else None
+            if found:
+                self._conn.executemany(
+                    "UPDATE analysis_cache SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, entries):
+        """批量写入 {key: 结果}，写入后按容量淘汰"""
+        if not entries:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO analysis_cache (key, result, created_at, last_used) VALUES (?, ?, ?, ?)",
+                [
+                    (key, json.dumps(result, ensure_ascii=False) if result is not None else None, now, now)
+                    for key, result in entries.items()
+                ]
+            )
+            self._conn.commit()
+            self._evict(now)
+
+    def _evict(self, now):
+        """删除过期记录；超过容量时删除最久未使用的记录（LRU）"""
+        cur = self._conn.execute("DELETE FROM analysis_cache WHERE created_at <= ?", (now - self.ttl,))
+        removed = cur.rowcount
+        count = self._conn.execute("SELECT COUNT(*) FROM analysis_cache").fetchone()[0]
+        if count > self.max_entries:
+            cur = self._conn.execute(
+                "DELETE FROM analysis_cache WHERE key IN (SELECT key FROM analysis_cache ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,)
+            )
+            removed += cur.rowcount
+        if removed:
+            self._conn.commit()
+            self.evictions += removed
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM analysis_cache").fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                "entries": entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "evictions": self.evictions,
+                "ttl": self.ttl,
+                "max_entries": self.max_entries
+            }
@@ -0,0 +1,349 @@
+import asyncio
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from analysis_cache import fingerprint
+from gemini_quota import OUTPUT_TOKEN_RESERVE, backoff_delay, is_rate_limit_error, parse_retry_after
+from prompt_codec import COLUMNS, RESPONSE_SCHEMA, decode_results, encode_batch, encode_row
+
+GEMINI_MODEL = "gemini-2.5-flash"
+# 每个分片的 token 预算（只算商品数据部分，提示词本身另计）
+CHUNK_TOKEN_BUDGET = 6000
+# 商品以表格行发送（每行约几十个 token），一个分片可以放更多商品
+MAX_ITEMS_PER_CHUNK = 150
+MAX_WORKERS = 4
+MAX_RETRIES = 3
+# 限流（429）单独计数，等待配额恢复后可以多重试几次
+MAX_RATE_LIMIT_RETRIES = 6
+
+PROMPT_TEMPLATE = """
+        任务：从以下闲鱼商品数据中，识别出高性价比的商品（评分 > 8分）。
+        排除：商家/经销商发布的商品。
+        商品数据是制表符分隔的表格，第一行是表头，第一列 id 是商品编号。
+        输出格式：JSON数组，每个推荐商品包含 id（商品编号）、reason（推荐理由）、score（评分1-10），不需要复述标题和价格。
+
+        商品数据：
+        {data}
+
+        请只返回JSON数组，不要其他文字说明。
+        """
+# 提示词版本：提示词或商品表的列改动后缓存自动失效
+PROMPT_VERSION = hashlib.sha1((PROMPT_TEMPLATE + "\t".join(COLUMNS)).encode("utf-8")).hexdigest()[:8]
+
+
+class RegionError(Exception):
+    """Gemini 地区限制错误（重试无效，需要重新初始化客户端或改用本地分析）"""
+
+
+def is_region_error(error_str):
+    return "FAILED_PRECONDITION" in error_str or "location is not supported" in error_str.lower()
+
+
+def estimate_tokens(text):
+    """粗略估算 token 数：中文约每字 1 个 token，其他字符约每 4 个 1 个 token"""
+    cjk = sum(1 for ch in text if '一' <= ch <= '鿿')
+    return cjk + (len(text) - cjk) // 4 + 1
+
+
+def chunk_listings(listings, token_budget=CHUNK_TOKEN_BUDGET, max_items=MAX_ITEMS_PER_CHUNK):
+    """按 token 预算把商品列表切成若干分片"""
+    chunks = []
+    current = []
+    current_tokens = 0
+    for item in listings:
+        tokens = estimate_tokens(encode_row(item, len(current)))
+        if current and (current_tokens + tokens > token_budget or len(current) >= max_items):
+            chunks.append(current)
+            current = []
+            current_tokens = 0
+        current.append(item)
+        current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def build_prompt(chunk):
+    return PROMPT_TEMPLATE.format(data=encode_batch(chunk))
+
+
+def request_config():
+    return {"response_mime_type": "application/json", "response_schema": RESPONSE_SCHEMA}
+
+
+def parse_response(response):
+    result = json.loads(response.text)
+    if isinstance(result, dict):
+        result = [result]
+    return result
+
+
+def used_tokens(response):
+    """响应中的实际 token 用量，没有用量信息时返回 None"""
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None)
+
+
+class RetryState:
+    """一个分片的重试计数：普通错误和限流分开计数"""
+
+    def __init__(self, label, quota=None):
+        self.label = label
+        self.quota = quota
+        self.errors = 0
+        self.rate_limits = 0
+
+    def delay(self, error):
+        """
+        记录一次失败，返回重试前需要等待的秒数，不能再重试时返回 None；地区限制直接抛出 RegionError
+        限流时由配额管理器暂停该 Key（下次 acquire 会等待），不使用配额管理器时在这里按退避等待
+        """
+        error_str = str(error)
+        if is_region_error(error_str):
+            print(f"[ANALYZE] {self.label}失败: {error_str}")
+            raise RegionError(error_str)
+        if is_rate_limit_error(error_str):
+            self.rate_limits += 1
+            print(f"[ANALYZE] {self.label}触发限流 {self.rate_limits}/{MAX_RATE_LIMIT_RETRIES}: {error_str}")
+            if self.rate_limits >= MAX_RATE_LIMIT_RETRIES:
+                return None
+            retry_after = parse_retry_after(error_str)
+            if self.quota is not None:
+                self.quota.report_rate_limit(retry_after)
+                return 0.0
+            return backoff_delay(self.rate_limits - 1, retry_after)
+        self.errors += 1
+        print(f"[ANALYZE] {self.label}尝试 {self.errors}/{MAX_RETRIES} 失败: {error_str}")
+        if self.errors >= MAX_RETRIES:
+            return None
+        return backoff_delay(self.errors - 1)
+
+
+def analyze_chunk(client, chunk, label="", quota=None):
+    """
+    分析一个分片，返回 {分片内下标: 推荐内容}；失败时按指数退避重试，遇到地区限制直接抛出 RegionError
+    quota: 可选的配额句柄（QuotaSlot），每次请求前等待 RPM/TPM 配额
+    """
+    prompt = build_prompt(chunk)
+    tokens = estimate_tokens(prompt) + OUTPUT_TOKEN_RESERVE
+    retry = RetryState(label, quota)
+    while True:
+        if quota is not None:
+            quota.acquire(tokens)
+        try:
+            response = client.models.generate_content(
+                model=GEMINI_MODEL,
+                contents=prompt,
+                config=request_config()
+            )
+        except Exception as e:
+            delay = retry.delay(e)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            continue
+        if quota is not None:
+            quota.record(tokens, used_tokens(response))
+            quota.report_success()
+        return decode_results(chunk, parse_response(response))
+
+
+async def analyze_chunk_async(client, chunk, label="", quota=None):
+    """analyze_chunk 的异步版本：使用客户端的 aio 接口，等待配额和重试都不占用线程"""
+    prompt = build_prompt(chunk)
+    tokens = estimate_tokens(prompt) + OUTPUT_TOKEN_RESERVE
+    retry = RetryState(label, quota)
+    while True:
+        if quota is not None:
+            await quota.acquire_async(tokens)
+        try:
+            response = await client.aio.models.generate_content(
+                model=GEMINI_MODEL,
+                contents=prompt,
+                config=request_config()
+            )
+        except Exception as e:
+            delay = retry.delay(e)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            continue
+        if quota is not None:
+            quota.record(tokens, used_tokens(response))
+            quota.report_success()
+        return decode_results(chunk, parse_response(response))
+
+
+def score_of(item):
+    try:
+        return float(item.get("score", 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def price_of(item):
+    try:
+        return float(item.get("price", 0))
+    except (TypeError, ValueError):
+        return float("inf")
+
+
+def listing_key(item):
+    """商品在分析缓存中的键"""
+    return fingerprint(item, GEMINI_MODEL, PROMPT_VERSION)
+
+
+def merge_results(chunk_results, top_n):
+    """
+    合并各分片的推荐结果：同一商品保留评分最高的一条，按评分从高到低、价格从低到高排序
+    商品按 key 区分（见 decode_results），没有 key 时按链接，链接也没有时按标题+价格
+    """
+    best = {}
+    for results in chunk_results:
+        for item in results:
+            if not isinstance(item, dict):
+                continue
+            key = item.get("key") or item.get("url") or (str(item.get("title", "")).strip(), str(item.get("price", "")))
+            if key not in best or score_of(item) > score_of(best[key]):
+                best[key] = item
+    merged = sorted(best.values(), key=lambda x: (-score_of(x), price_of(x)))
+    return merged[:top_n] if top_n else merged
+
+
+def split_cached(listings, cache):
+    """
+    查询缓存，返回 (需要发给模型的商品, 缓存中的推荐结果)
+    缓存按标题+价格命中，可能是另一条（如重新发布的）商品的结论：只沿用理由和评分，
+    title / price / url / key 取自本次的商品
+    """
+    if cache is None:
+        return listings, []
+    keys = [listing_key(item) for item in listings]
+    cached = cache.get_many(keys)
+    pending = [item for item, key in zip(listings, keys) if key not in cached]
+    print(f"[ANALYZE] 缓存命中 {len(listings) - len(pending)} 条，需要发送给模型 {len(pending)} 条")
+    results = []
+    for item, key in zip(listings, keys):
+        result = cached.get(key)
+        if result:
+            result = dict(result, title=item.get("title", ""), price=str(item.get("price", "")), url=item.get("url") or "")
+            result.pop("key", None)
+            if item.get("key"):
+                result["key"] = item["key"]
+            results.append(result)
+    return pending, results
+
+
+def record_chunk(chunk, matched, cache):
+    """分片中每个商品都写入缓存：被推荐的保存推荐内容，未被推荐的保存 None"""
+    if cache is not None:
+        cache.put_many({listing_key(item): matched.get(i) for i, item in enumerate(chunk)})
+
+
+def summarize(listings, pending, chunks, errors, analyzed):
+    # 所有分片都失败时才算分析失败，部分失败时返回已有结果
+    if errors and not analyzed:
+        raise errors[0]
+    return {
+        "total": len(listings),
+        "cache_hits": len(listings) - len(pending),
+        "sent_to_model": len(pending),
+        "chunks": len(chunks),
+        "failed_chunks": len(errors)
+    }
+
+
+def analyze_listings(client, listings, top_n=20, max_workers=MAX_WORKERS, on_chunk=None, cache=None, quota=None):
+    """
+    分片并发分析商品列表，返回 (合并、重新排序后的前 top_n 个推荐, 统计信息)
+    on_chunk(index, total, results): 每个分片分析完成时回调（按完成顺序）
+    cache: 可选的 AnalysisCache，已分析过且未变化的商品直接使用缓存结果，只把新商品发给模型
+    quota: 可选的配额句柄（QuotaSlot），并发的分片共用同一个 Key 的 RPM/TPM 配额
+    任何一个分片遇到地区限制都会抛出 RegionError
+    """
+    pending, cached_results = split_cached(listings, cache)
+    chunks = chunk_listings(pending)
+    total = len(chunks)
+    print(f"[ANALYZE] {len(pending)} 条商品切分为 {total} 个分片，并发数 {min(max_workers, total)}")
+
+    chunk_results = [cached_results] if cached_results else []
+    analyzed = 0
+    errors = []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, total))) as executor:
+        futures = {
+            executor.submit(analyze_chunk, client, chunk, f"分片 {i + 1}/{total} ", quota): i
+            for i, chunk in enumerate(chunks)
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                matched = future.result()
+            except RegionError:
+                for f in futures:
+                    f.cancel()
+                raise
+            except Exception as e:
+                errors.append(e)
+                print(f"[ANALYZE] 分片 {index + 1}/{total} 分析失败: {e}")
+                continue
+            record_chunk(chunks[index], matched, cache)
+            results = list(matched.values())
+            chunk_results.append(results)
+            analyzed += 1
+            print(f"[ANALYZE] 分片 {index + 1}/{total} 完成，推荐 {len(results)} 个")
+            if on_chunk is not None:
+                on_chunk(index, total, results)
+
+    info = summarize(listings, pending, chunks, errors, analyzed)
+    return merge_results(chunk_results, top_n), info
+
+
+async def analyze_listings_async(client, listings, top_n=20, max_workers=MAX_WORKERS, on_chunk=None, cache=None,
+                                 quota=None):
+    """
+    analyze_listings 的异步版本：各分片作为协程并发请求（同时最多 max_workers 个），不占用线程
+    分析缓存是同步的 SQLite 操作，读写放到线程中执行，不阻塞事件循环
+    参数和返回值与 analyze_listings 相同
+    """
+    pending, cached_results = await asyncio.to_thread(split_cached, listings, cache)
+    chunks = chunk_listings(pending)
+    total = len(chunks)
+    print(f"[ANALYZE] {len(pending)} 条商品切分为 {total} 个分片，并发数 {min(max_workers, total)}")
+
+    semaphore = asyncio.Semaphore(max(1, max_workers))
+
+    async def run(index, chunk):
+        async with semaphore:
+            try:
+                return index, await analyze_chunk_async(client, chunk, f"分片 {index + 1}/{total} ", quota), None
+            except RegionError:
+                raise
+            except Exception as e:
+                return index, None, e
+
+    chunk_results = [cached_results] if cached_results else []
+    analyzed = 0
+    errors = []
+    tasks = [asyncio.ensure_future(run(i, chunk)) for i, chunk in enumerate(chunks)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            index, matched, error = await next_done
+            if error is not None:
+                errors.append(error)
+                print(f"[ANALYZE] 分片 {index + 1}/{total} 分析失败: {error}")
+                continue
+            await asyncio.to_thread(record_chunk, chunks[index], matched, cache)
+            results = list(matched.values())
+            chunk_results.append(results)
+            analyzed += 1
+            print(f"[ANALYZE] 分片 {index + 1}/{total} 完成，推荐 {len(results)} 个")
+            if on_chunk is not None:
+                on_chunk(index, total, results)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    info = summarize(listings, pending, chunks, errors, analyzed)
+    return merge_results(chunk_results, top_n), info
@@ -1,76 +1,376 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory
 from flask_cors import CORS
 import os
+import sys
 import json
 import time
 import subprocess
 import threading
+import tempfile
 import requests
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from google import genai
 
 app = Flask(__name__)
 CORS(app)  # 允许跨域请求
 
 # 配置
-CRAWLER_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(__file__)), "crawler_enhanced.py")
-DATA_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "temp_data.json")
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CRAWLER_SCRIPT = os.path.join(ROOT_DIR, "crawler_enhanced.py")
+# 爬虫运行方式：pool = 进程内常驻浏览器池（默认），subprocess = 每次搜索启动一个爬虫进程，
+# fixture = 不打开浏览器，直接返回 CRAWLER_FIXTURE 文件中的商品（离线压测用）
+CRAWLER_MODE = os.environ.get("CRAWLER_MODE", "pool")
+CRAWLER_FIXTURE = os.environ.get("CRAWLER_FIXTURE") or os.path.join(ROOT_DIR, "temp_data.json")
+CRAWLER_TIMEOUT = 300
+# 单个关键词的抓取深度上限（防止请求过大的数量拖垮浏览器池）
+MAX_ITEMS_LIMIT = 5000
+MAX_PAGES_LIMIT = 100
+# 事件流：心跳间隔和无事件自动断开的时间（秒）
+SSE_KEEPALIVE = 15
+SSE_IDLE_TIMEOUT = 600
+# 分析结果默认返回的推荐数量
+ANALYZE_TOP_N = 20
+# 商品查询接口每页默认/最大条数
+LISTINGS_PAGE_SIZE = 100
+LISTINGS_PAGE_LIMIT = 1000
 
-# 全局变量存储爬虫状态
-crawler_status = {
-    "running": False,
-    "keyword": "",
-    "data": [],
-    "error": None
-}
+# 访问 Gemini 使用的本地代理
+PROXY_URL = "http://127.0.0.1:7890"
+# Gemini 接口地址：可指向本地模拟服务（benchmarks/mock_gemini.py），不需要真实的 API Key 和网络
+GEMINI_BASE_URL = os.environ.get("GEMINI_BASE_URL")
+# 是否通过代理访问 Gemini 并检测代理；GEMINI_USE_PROXY=0 时关闭，设置了 GEMINI_BASE_URL 时默认关闭
+GEMINI_USE_PROXY = os.environ.get("GEMINI_USE_PROXY", "0" if GEMINI_BASE_URL else "1").lower() in ("1", "true", "yes")
 
-# Gemini客户端（延迟初始化）
-gemini_client = None
+# 本地数据目录（缓存、数据库）
+DATA_DIR = os.path.join(ROOT_DIR, "data")
 
-def simple_local_analyze(data):
-    """简单的本地分析（当Gemini不可用时的备选方案）"""
-    if not data:
-        return []
+# 让后端可以直接导入项目根目录下的爬虫模块
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from jobs import JobScheduler, MAX_RETAINED_JOBS, MAX_RETAINED_ITEMS
+from analyzer import analyze_listings, RegionError
+from analysis_cache import AnalysisCache
+from listing_store import ListingStore, item_key
+from watches import WatchScheduler, parse_interval
+from local_scoring import rank_listings, valid_price_count, MIN_SAMPLES
+from prefilter import prefilter, DEFAULT_TOP_K
+from gemini_clients import ClientRegistry, ProxyHealth
+from gemini_quota import QuotaManager
+from resource_policy import get_policy
+from json_capture import EXTRACTION_MODES
+from session_store import get_session_store
+
+# Gemini客户端按 API Key 缓存在注册表中复用，每个请求使用自己的 Key 对应的客户端
+def create_gemini_client(api_key):
+    if GEMINI_BASE_URL:
+        return genai.Client(api_key=api_key, http_options={"base_url": GEMINI_BASE_URL})
+    return genai.Client(api_key=api_key)
+
+gemini_clients = ClientRegistry(create_gemini_client)
+
+# Gemini配额：每个 API Key 的 RPM/TPM 令牌桶，所有任务共用，限流时自动退避（GEMINI_RPM / GEMINI_TPM 可调整）
+quota_manager = QuotaManager()
+
+# Gemini分析结果缓存：相同的商品（标题+价格）不会重复发送给模型
+analysis_cache = AnalysisCache(
+    os.path.join(DATA_DIR, "analysis_cache.db"),
+    ttl=int(os.environ.get("ANALYSIS_CACHE_TTL", str(7 * 24 * 3600))),
+    max_entries=int(os.environ.get("ANALYSIS_CACHE_MAX_ENTRIES", "50000"))
+)
+
+# 商品库：所有抓取结果按商品去重保存，并记录每次抓取的快照
+listing_store = ListingStore(os.path.join(DATA_DIR, "listings.db"))
+
+def get_crawler_pool():
+    """获取常驻浏览器池（首次使用时才导入Playwright并启动浏览器）"""
+    from browser_pool import get_pool
+    return get_pool()
+
+def crawl_timeout(options):
+    """多页抓取按页数放宽超时"""
+    return CRAWLER_TIMEOUT * max(1, options.get("max_pages", 1) // 5 + 1)
+
+def crawl_with_pool(keyword, on_item=None, on_event=None, **options):
+    """
+    派发到常驻浏览器池抓取，返回商品列表；on_item / on_event 在浏览器池线程中被回调
+    超时后设置取消标记（爬虫在下一页开始前停止），之后浏览器池线程的回调一律忽略，
+    调用方（任务调度器）可以安全地结束任务，不会与仍在运行的抓取同时修改任务数据
+    """
+    print(f"[CRAWLER] 派发到浏览器池，关键词: {keyword}")
+    cancel = threading.Event()
+    callback_lock = threading.Lock()
+
+    def guarded(callback):
+        if callback is None:
+            return None
+        def wrapper(*args, **kwargs):
+            with callback_lock:
+                if not cancel.is_set():
+                    callback(*args, **kwargs)
+        return wrapper
+
+    future = get_crawler_pool().submit(
+        keyword, on_item=guarded(on_item), on_event=guarded(on_event), cancel=cancel, **options
+    )
+    try:
+        return future.result(timeout=crawl_timeout(options))
+    except FutureTimeoutError:
+        # 持锁设置取消标记：返回后不会再有回调正在执行或开始执行
+        with callback_lock:
+            cancel.set()
+        future.cancel()
+        print("[CRAWLER] 爬虫执行超时")
+        raise Exception("爬虫执行超时（超过5分钟）")
+
+def crawl_with_fixture(keyword, on_item=None, on_event=None, **options):
+    """离线压测用：不打开浏览器，返回 CRAWLER_FIXTURE 中的商品（爬虫的商品列表或录制样本的基准结果）"""
+    with open(CRAWLER_FIXTURE, encoding="utf-8") as f:
+        data = json.load(f)
+    items = data["items"] if isinstance(data, dict) else data
+    items = [dict(item) for item in items[:options.get("max_items") or len(items)]]
+    if on_item is not None:
+        for item in items:
+            on_item(item)
+    if on_event is not None:
+        on_event("crawl_finished", reason="fixture", count=len(items))
+    print(f"[CRAWLER] 离线样本 {CRAWLER_FIXTURE}，关键词: {keyword}，{len(items)} 条")
+    return items
+
+def drain_crawler_output(proc):
+    """爬虫进程在数据输出完后还会保存状态、关闭浏览器，后台读完剩余日志并回收进程"""
+    for line in proc.stdout:
+        print(f"[CRAWLER] {line.rstrip()}")
+    proc.wait()
+    print(f"[CRAWLER] 爬虫进程已退出，返回码: {proc.returncode}")
+
+def crawl_with_subprocess(keyword, on_item=None, on_event=None, **options):
+    """
+    启动独立爬虫进程抓取，返回商品列表
+    爬虫以 NDJSON 逐行输出商品，边抓取边读取；收到 done 事件即返回，不等待浏览器关闭
+    """
+    # 创建无代理环境
+    no_proxy_env = os.environ.copy()
+    keys_to_remove = ["http_proxy", "https_proxy", "all_proxy", "HTTP_PROXY", "HTTPS_PROXY"]
+    for key in keys_to_remove:
+        no_proxy_env.pop(key, None)
+    no_proxy_env["PYTHONUNBUFFERED"] = "1"
     
-    results = []
-    for item in data:
-        try:
-            price = float(item.get("price", "0"))
-            title = item.get("title", "")
-            
-            # 简单的评分逻辑
-            score = 7.0  # 基础分
-            
-            # 根据价格判断（假设价格越低性价比越高，这里需要根据实际情况调整）
-            # 可以根据商品类型调整评分逻辑
-            
-            # 根据标题关键词判断
-            title_lower = title.lower()
-            if any(kw in title_lower for kw in ["全新", "未拆", "正品", "包邮"]):
-                score += 1.0
-            if any(kw in title_lower for kw in ["二手", "使用", "旧"]):
-                score += 0.5
-            
-            if score >= 8.0:
-                results.append({
-                    "title": title,
-                    "price": str(price),
-                    "reason": "价格合理，商品描述清晰",
-                    "score": round(score, 1)
-                })
-        except:
-            continue
-    
-    # 按价格排序
-    results.sort(key=lambda x: float(x.get("price", "999999")))
-    return results[:10]  # 返回前10个
+    print(f"[CRAWLER] 启动爬虫: {CRAWLER_SCRIPT}")
+    print(f"[CRAWLER] 关键词: {keyword}")
+    
+    cmd = ["python", CRAWLER_SCRIPT, keyword, "--ndjson"]
+    if "max_items" in options:
+        cmd += ["--max-items", str(options["max_items"])]
+    if "max_pages" in options:
+        cmd += ["--max-pages", str(options["max_pages"])]
+    if options.get("resource_policy"):
+        cmd += ["--resource-policy", options["resource_policy"]]
+    if options.get("extraction"):
+        cmd += ["--extraction", options["extraction"]]
+    known_file = None
+    if options.get("known"):
+        # 已知商品可能很多，通过临时文件传给爬虫进程
+        with tempfile.NamedTemporaryFile("w", suffix=".json", encoding="utf-8", delete=False) as f:
+            json.dump(options["known"], f, ensure_ascii=False)
+            known_file = f.name
+        cmd += ["--known", known_file]
+    
+    # 修复Windows编码问题
+    proc = subprocess.Popen(
+        cmd,
+        env=no_proxy_env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        encoding='utf-8',
+        errors='replace',  # 遇到编码错误时替换而不是报错
+        cwd=ROOT_DIR  # 设置工作目录
+    )
+    
+    # 超时后结束进程，读取循环随之结束
+    timed_out = threading.Event()
+    def kill_on_timeout():
+        timed_out.set()
+        proc.kill()
+    timer = threading.Timer(crawl_timeout(options), kill_on_timeout)
+    timer.daemon = True
+    timer.start()
+    
+    data = []
+    finished = False
+    try:
+        for line in proc.stdout:
+            line = line.rstrip()
+            if line.startswith('{"event"'):
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    print(f"[CRAWLER] {line}")
+                    continue
+                if event.get("event") == "item":
+                    data.append(event["data"])
+                    if on_item is not None:
+                        on_item(event["data"])
+                elif event.get("event") == "done":
+                    finished = True
+                    break
+                elif on_event is not None:
+                    on_event(event.pop("event"), **event)
+            else:
+                print(f"[CRAWLER] {line}")
+    finally:
+        if finished:
+            threading.Thread(target=drain_crawler_output, args=(proc,), daemon=True).start()
+        else:
+            proc.wait()
+        timer.cancel()
+        if known_file:
+            try:
+                os.remove(known_file)
+            except OSError:
+                pass
+    
+    if not finished:
+        print(f"[CRAWLER] 返回码: {proc.returncode}")
+        if timed_out.is_set():
+            print("[CRAWLER] 爬虫执行超时")
+            raise Exception("爬虫执行超时（超过5分钟）")
+        if proc.returncode != 0:
+            raise Exception(f"爬虫执行失败 (返回码: {proc.returncode})")
+    
+    print(f"[CRAWLER] 成功抓取 {len(data)} 条数据")
+    return data
+
+# 抓取任务调度器：每个关键词一个任务，并发数不超过浏览器池大小
+# 子进程模式下数据通过标准输出实时传回，不再读取共用的数据文件，也可以并发运行
+CRAWLERS = {"pool": crawl_with_pool, "subprocess": crawl_with_subprocess, "fixture": crawl_with_fixture}
+job_scheduler = JobScheduler(
+    CRAWLERS.get(CRAWLER_MODE, crawl_with_pool),
+    max_concurrency=int(os.environ.get("CRAWLER_POOL_SIZE", "2")),
+    store=listing_store,
+    max_jobs=int(os.environ.get("JOB_MAX_RETAINED", str(MAX_RETAINED_JOBS))),
+    max_items=int(os.environ.get("JOB_MAX_ITEMS", str(MAX_RETAINED_ITEMS)))
+)
+
+def parse_crawl_options(data):
+    """
+    从请求中读取抓取深度参数（max_items / max_pages），超出上限时截断
+    incremental 为真时只抓取相对上次的新商品和变化，遇到连续的已知商品即停止
+    resource_policy: 请求拦截策略（none / lean / strict），未指定时按是否无界面模式选择默认策略
+    extraction: 提取方式（auto / json / dom），默认优先解析搜索接口的响应
+    """
+    options = {}
+    try:
+        if data.get('max_items'):
+            options["max_items"] = max(1, min(int(data['max_items']), MAX_ITEMS_LIMIT))
+        if data.get('max_pages'):
+            options["max_pages"] = max(1, min(int(data['max_pages']), MAX_PAGES_LIMIT))
+    except (TypeError, ValueError):
+        raise ValueError("max_items / max_pages 必须是整数")
+    if data.get('incremental'):
+        options["incremental"] = True
+    if data.get('resource_policy'):
+        options["resource_policy"] = get_policy(data['resource_policy']).name
+    if data.get('extraction'):
+        if data['extraction'] not in EXTRACTION_MODES:
+            raise ValueError(f"extraction 必须是 {' / '.join(EXTRACTION_MODES)} 之一")
+        options["extraction"] = data['extraction']
+    return options
+
+def watch_local_analyze(listings, keyword):
+    """
+    监控的本地评分：增量抓取的变化商品通常只有几个，价格分布按商品库中该关键词的商品计算；
+    有效价格不足 MIN_SAMPLES 个时评分没有意义，不产生评分提醒
+    """
+    reference = listing_store.query(keyword=keyword, limit=MAX_ITEMS_LIMIT, collapse=True) if keyword else []
+    if valid_price_count(reference) < MIN_SAMPLES:
+        reference = listings
+    if valid_price_count(reference) < MIN_SAMPLES:
+        print(f"[WATCH] 关键词 {keyword} 的有效价格不足 {MIN_SAMPLES} 个，跳过本地评分提醒")
+        return []
+    return rank_listings(listings, top_n=None, reference=reference)
+
+def analyze_for_watch(listings, keyword=None, api_key=None):
+    """
+    监控的评分提醒：监控保存了 API Key 时用该 Key 的客户端（走分析缓存），
+    否则用本地评分（按该关键词在商品库中的价格分布，见 watch_local_analyze）
+    """
+    listings = analysis_listings(listings)
+    if api_key:
+        client, message = get_gemini_client(api_key)
+        if client is None:
+            print(f"[WATCH] Gemini 客户端不可用，改用本地分析: {message}")
+        else:
+            try:
+                results, _ = analyze_listings(
+                    client, listings, top_n=None, cache=analysis_cache,
+                    quota=quota_manager.for_key(api_key, "watch")
+                )
+                return results
+            except Exception as e:
+                print(f"[WATCH] Gemini 分析失败，改用本地分析: {e}")
+    return watch_local_analyze(listings, keyword)
+
+# 关键词监控：定时增量抓取，有新的低价或高分商品时提醒
+watch_scheduler = WatchScheduler(
+    os.path.join(DATA_DIR, "watches.db"),
+    job_scheduler,
+    analyze_fn=analyze_for_watch,
+    max_concurrency=int(os.environ.get("WATCH_MAX_CONCURRENCY", "1")),
+    webhook=os.environ.get("WATCH_WEBHOOK_URL") or None
+)
+
+def parse_listing_filters(data):
+    """从请求中读取商品查询条件：keyword、min_price / max_price、since（时间戳，只看此后出现过的商品）"""
+    filters = {"keyword": (data.get('keyword') or '').strip() or None}
+    try:
+        for name in ("min_price", "max_price", "since"):
+            value = data.get(name)
+            filters[name] = float(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        raise ValueError("min_price / max_price / since 必须是数字")
+    return filters
+
+def get_job(job_id=None):
+    """按ID取任务，未指定任务时使用最近的任务"""
+    return job_scheduler.get(job_id) if job_id else job_scheduler.latest()
+
+def warn_status_without_job_id():
+    """/api/status 未指定 job_id 时仍返回最近的任务（多用户时可能是别人的任务），该用法已弃用"""
+    print("[STATUS] 警告: 未指定 job_id 的 /api/status 已弃用，请改用 /api/status/<job_id> 或 ?job_id=")
+
+def analysis_fields(item):
+    """去掉商品库附加的字段，只保留爬虫原有的商品字段和商品主键 key（分析结果按 key 对应回商品）"""
+    fields = {k: v for k, v in item.items()
+              if k not in ("key", "item_id", "first_seen", "last_seen", "cluster_id", "seller_id", "published_at")}
+    fields["key"] = item.get("key") or item_key(item)[0]
+    return fields
+
+def analysis_listings(items):
+    """要分析的商品列表：key 重复时（没有商品ID和链接、标题和价格相同）加序号区分，各商品的分析结果不会互相覆盖"""
+    listings = []
+    counts = {}
+    for item in items:
+        fields = analysis_fields(item)
+        key = fields["key"]
+        counts[key] = counts.get(key, 0) + 1
+        if counts[key] > 1:
+            fields["key"] = f"{key}#{counts[key]}"
+        listings.append(fields)
+    return listings
+
+def simple_local_analyze(data):
+    """本地分析（当Gemini不可用时的备选方案）：按价格相对同类商品的位置和标题特征评分，返回前10个"""
+    return rank_listings(data, top_n=10)
 
 def check_proxy_status():
     """检查代理是否正常工作"""
     try:
         # 使用代理测试IP地址
         proxies = {
-            'http': 'http://127.0.0.1:7890',
-            'https': 'http://127.0.0.1:7890'
+            'http': PROXY_URL,
+            'https': PROXY_URL
         }
         resp = requests.get("http://ip-api.com/json/", proxies=proxies, timeout=5)
         if resp.status_code == 200:
@@ -83,40 +383,72 @@ def check_proxy_status():
         print(f"[PROXY] 代理检测失败: {e}")
     return False, "Unknown", "Unknown"
 
-def init_gemini_client(api_key):
-    """初始化Gemini客户端"""
-    global gemini_client
+# 代理检测结果缓存：在后台定期检测，初始化客户端时只读取最近一次的结果
+proxy_health = ProxyHealth(check_proxy_status, ttl=int(os.environ.get("PROXY_CHECK_TTL", "300")))
+
+def configure_proxy():
+    """设置代理环境变量（只在值不同时写入）"""
+    if os.environ.get("HTTPS_PROXY") == PROXY_URL:
+        return
+    for name in ("http_proxy", "https_proxy", "HTTP_PROXY", "HTTPS_PROXY", "all_proxy", "ALL_PROXY"):
+        os.environ[name] = PROXY_URL
+    print(f"[GEMINI] 设置代理: {PROXY_URL}")
+
+def get_gemini_client(api_key, force=False):
+    """
+    取 API Key 对应的 Gemini 客户端，返回 (客户端, 消息)，失败时客户端为 None
+    同一个 API Key 复用已有的客户端；代理状态取自后台检测的缓存结果，不在请求中等待网络检测
+    force: 遇到地区限制等错误后重建客户端，并等待一次新的代理检测
+    不使用代理时（GEMINI_USE_PROXY=0）跳过代理设置和检测
+    """
     try:
-        # 强制设置代理环境变量
-        proxy_url = "http://127.0.0.1:7890"
-        os.environ["http_proxy"] = proxy_url
-        os.environ["https_proxy"] = proxy_url
-        os.environ["HTTP_PROXY"] = proxy_url
-        os.environ["HTTPS_PROXY"] = proxy_url
-        os.environ["all_proxy"] = proxy_url
-        os.environ["ALL_PROXY"] = proxy_url
+        if force:
+            gemini_clients.invalidate(api_key)
+        if not GEMINI_USE_PROXY:
+            return gemini_clients.get(api_key), "初始化成功"
         
-        print(f"[GEMINI] 设置代理: {proxy_url}")
+        configure_proxy()
         
-        # 检查代理状态
-        proxy_ok, country, ip = check_proxy_status()
-        if not proxy_ok:
-            return False, "代理连接失败，请检查代理是否运行在 127.0.0.1:7890"
+        if force:
+            proxy = proxy_health.refresh(wait=True)
+        else:
+            proxy = proxy_health.status()
         
-        if country == "China":
-            return False, f"代理未生效，当前IP仍在 {country} ({ip})。请确保代理软件（如Clash）已开启并设置为全局模式\n\n注意：即使代理IP正常，如果API Key在受限地区注册，Gemini API仍可能不可用。"
+        # 只根据已有的检测结果拒绝；尚未检测完成时不等待，直接创建客户端
+        if proxy["ok"] is False:
+            return None, f"代理连接失败，请检查代理是否运行在 {PROXY_URL.replace('http://', '')}"
         
-        print(f"[GEMINI] 代理正常，IP位置: {country} ({ip})")
+        if proxy["country"] == "China":
+            return None, f"代理未生效，当前IP仍在 {proxy['country']} ({proxy['ip']})。请确保代理软件（如Clash）已开启并设置为全局模式\n\n注意：即使代理IP正常，如果API Key在受限地区注册，Gemini API仍可能不可用。"
         
-        # 使用最简单的初始化方式，代理通过环境变量自动配置
-        gemini_client = genai.Client(api_key=api_key)
-        print("[GEMINI] 客户端初始化成功")
-        return True, "初始化成功"
+        if proxy["ok"]:
+            print(f"[GEMINI] 代理正常，IP位置: {proxy['country']} ({proxy['ip']})")
+        
+        # 代理通过环境变量自动配置
+        return gemini_clients.get(api_key), "初始化成功"
     except Exception as e:
         error_msg = str(e)
         if "FAILED_PRECONDITION" in error_msg or "location is not supported" in error_msg.lower():
-            return False, "地区限制错误：请确保：1) 代理已开启并设置为全局模式 2) 代理IP不在受限地区 3) 重启服务器后重试"
-        return False, f"初始化失败: {error_msg}"
+            return None, "地区限制错误：请确保：1) 代理已开启并设置为全局模式 2) 代理IP不在受限地区 3) 重启服务器后重试"
+        return None, f"初始化失败: {error_msg}"
+
+def init_gemini_client(api_key, force=False):
+    """初始化Gemini客户端，返回 (是否成功, 消息)"""
+    client, message = get_gemini_client(api_key, force=force)
+    if client is None:
+        return False, message
+    return True, message
+
+def start_background():
+    """后台检测代理、预热浏览器池、启动监控调度器（Flask 开发服务器和 ASGI 服务启动时调用）"""
+    if GEMINI_USE_PROXY:
+        proxy_health.refresh()
+    if CRAWLER_MODE == "pool":
+        try:
+            get_crawler_pool()
+        except Exception as e:
+            print(f"[POOL] 浏览器池启动失败，将在首次搜索时重试: {e}")
+    watch_scheduler.start()
 
 @app.route('/')
 def index():
@@ -139,15 +471,13 @@ def init_api():
     
     success, message = init_gemini_client(api_key)
     if success:
-        return jsonify({"success": True, "message": message})
+        return jsonify({"success": True, "message": message, "proxy": proxy_health.status(refresh=False)})
     else:
         return jsonify({"success": False, "message": message}), 500
 
 @app.route('/api/search', methods=['POST'])
 def search():
     """搜索商品"""
-    global crawler_status
-    
     data = request.json
     keyword = data.get('keyword', '')
     api_key = data.get('api_key', '')
@@ -158,217 +488,459 @@ def search():
     if not api_key:
         return jsonify({"success": False, "message": "请先设置Gemini API Key"}), 400
     
-    # 初始化Gemini客户端
-    if not gemini_client:
-        success, message = init_gemini_client(api_key)
-        if not success:
-            return jsonify({"success": False, "message": f"Gemini初始化失败: {message}"}), 500
-    
-    # 更新状态
-    crawler_status = {
-        "running": True,
-        "keyword": keyword,
-        "data": [],
-        "error": None
-    }
+    # 初始化Gemini客户端（按 API Key 复用）
+    client, message = get_gemini_client(api_key)
+    if client is None:
+        return jsonify({"success": False, "message": f"Gemini初始化失败: {message}"}), 500
+    
+    # 运行爬虫
+    if CRAWLER_MODE == "subprocess" and not os.path.exists(CRAWLER_SCRIPT):
+        return jsonify({"success": False, "message": "爬虫脚本不存在"}), 500
+    
+    try:
+        options = parse_crawl_options(data)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
     
     try:
-        # 运行爬虫
-        if not os.path.exists(CRAWLER_SCRIPT):
-            return jsonify({"success": False, "message": "爬虫脚本不存在"}), 500
-        
-        # 创建无代理环境
-        no_proxy_env = os.environ.copy()
-        keys_to_remove = ["http_proxy", "https_proxy", "all_proxy", "HTTP_PROXY", "HTTPS_PROXY"]
-        for key in keys_to_remove:
-            no_proxy_env.pop(key, None)
-        
         # 异步运行爬虫
-        def run_crawler():
-            try:
-                print(f"[CRAWLER] 启动爬虫: {CRAWLER_SCRIPT}")
-                print(f"[CRAWLER] 关键词: {keyword}")
-                print(f"[CRAWLER] 数据文件: {DATA_FILE}")
-                
-                # 修复Windows编码问题
-                result = subprocess.run(
-                    ["python", CRAWLER_SCRIPT, keyword],
-                    env=no_proxy_env,
-                    capture_output=True,
-                    text=True,
-                    encoding='utf-8',
-                    errors='replace',  # 遇到编码错误时替换而不是报错
-                    timeout=300,
-                    cwd=os.path.dirname(os.path.dirname(__file__))  # 设置工作目录
-                )
-                
-                print(f"[CRAWLER] 返回码: {result.returncode}")
-                if result.stdout:
-                    print(f"[CRAWLER] 标准输出:\n{result.stdout}")
-                if result.stderr:
-                    print(f"[CRAWLER] 错误输出:\n{result.stderr}")
-                
-                # 检查数据文件
-                if os.path.exists(DATA_FILE):
-                    print(f"[CRAWLER] 找到数据文件: {DATA_FILE}")
-                    try:
-                        with open(DATA_FILE, "r", encoding="utf-8") as f:
-                            data = json.load(f)
-                            crawler_status["data"] = data
-                            print(f"[CRAWLER] 成功加载 {len(data)} 条数据")
-                    except Exception as e:
-                        print(f"[CRAWLER] 读取数据文件失败: {e}")
-                        crawler_status["error"] = f"读取数据文件失败: {str(e)}"
-                else:
-                    print(f"[CRAWLER] 数据文件不存在: {DATA_FILE}")
-                    crawler_status["error"] = "爬虫未生成数据文件，可能未成功抓取数据"
-                
-                if result.returncode != 0:
-                    crawler_status["error"] = f"爬虫执行失败 (返回码: {result.returncode})\n{result.stderr}"
-                
-                crawler_status["running"] = False
-            except subprocess.TimeoutExpired:
-                print("[CRAWLER] 爬虫执行超时")
-                crawler_status["error"] = "爬虫执行超时（超过5分钟）"
-                crawler_status["running"] = False
-            except Exception as e:
-                print(f"[CRAWLER] 异常: {e}")
-                import traceback
-                traceback.print_exc()
-                crawler_status["error"] = str(e)
-                crawler_status["running"] = False
-        
-        thread = threading.Thread(target=run_crawler)
-        thread.daemon = True
-        thread.start()
-        
+        job = job_scheduler.submit(keyword, options)
         return jsonify({
             "success": True,
             "message": "爬虫已启动，请在弹出的浏览器窗口中登录闲鱼",
-            "status": "running"
+            "status": "running",
+            "job_id": job.id
         })
-        
     except Exception as e:
-        crawler_status["running"] = False
-        crawler_status["error"] = str(e)
         return jsonify({"success": False, "message": str(e)}), 500
 
+@app.route('/api/jobs', methods=['POST'])
+def create_jobs():
+    """批量提交关键词，每个关键词一个独立任务"""
+    data = request.json or {}
+    keywords = [kw.strip() for kw in data.get('keywords', []) if kw and kw.strip()]
+    
+    if not keywords:
+        return jsonify({"success": False, "message": "关键词列表不能为空"}), 400
+    
+    try:
+        options = parse_crawl_options(data)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    
+    jobs = job_scheduler.submit_batch(keywords, options)
+    return jsonify({
+        "success": True,
+        "jobs": [job.to_dict() for job in jobs]
+    })
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """列出所有任务"""
+    return jsonify({
+        "stats": job_scheduler.stats(),
+        "jobs": [job.to_dict() for job in job_scheduler.list()]
+    })
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_detail(job_id):
+    """获取单个任务的状态和结果"""
+    job = job_scheduler.get(job_id)
+    if job:
+        return jsonify(job.to_dict(include_data=True))
+    # 服务重启后内存中的任务已不存在，从商品库读取
+    crawl = listing_store.get_crawl(job_id)
+    if not crawl:
+        return jsonify({"success": False, "message": "任务不存在"}), 404
+    crawl["data"] = listing_store.crawl_items(job_id)
+    return jsonify(crawl)
+
+@app.route('/api/events/<job_id>', methods=['GET'])
+def job_events(job_id):
+    """
+    任务生命周期事件流（Server-Sent Events）
+    抓取开始、需要登录、页面加载、每页抓取数量、分析结果等事件会立即推送，前端无需轮询
+    断线重连时浏览器会带上 Last-Event-ID，从断点继续推送
+    """
+    job = job_scheduler.get(job_id)
+    if not job:
+        return jsonify({"success": False, "message": "任务不存在"}), 404
+    
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or request.args.get('since') or 0)
+    except ValueError:
+        last_id = 0
+    
+    def stream():
+        index = last_id
+        idle_since = time.time()
+        while True:
+            events, closed = job.wait_events(index, timeout=SSE_KEEPALIVE)
+            for event in events:
+                index = event["id"]
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+            if events:
+                idle_since = time.time()
+            elif closed or time.time() - idle_since > SSE_IDLE_TIMEOUT:
+                break
+            else:
+                # 心跳，防止代理或浏览器断开空闲连接
+                yield ": keepalive\n\n"
+            if closed and index >= len(job.events):
+                break
+    
+    return Response(stream(), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
 @app.route('/api/status', methods=['GET'])
-def get_status():
-    """获取爬虫状态"""
-    status = {
-        "running": crawler_status["running"],
-        "keyword": crawler_status["keyword"],
-        "data_count": len(crawler_status["data"]),
-        "error": crawler_status["error"]
-    }
+@app.route('/api/status/<job_id>', methods=['GET'])
+def get_status(job_id=None):
+    """获取爬虫状态（/api/status/<job_id> 或 ?job_id= 指定任务，都未指定时为最近一次搜索的任务，该用法已弃用）"""
+    job_id = job_id or request.args.get('job_id')
+    if not job_id:
+        warn_status_without_job_id()
+    job = get_job(job_id)
+    if job is None and job_id:
+        # 任务已从内存中淘汰或服务已重启，从商品库读取
+        crawl = listing_store.get_crawl(job_id)
+        if not crawl:
+            return jsonify({"success": False, "message": "任务不存在"}), 404
+        return jsonify(crawl)
+    if job is None:
+        print("[STATUS] 爬虫状态: 未运行，数据: 0 条")
+        return jsonify({"running": False, "keyword": "", "data_count": 0, "error": None})
+    
+    status = job.to_dict()
     # 添加调试信息
-    if crawler_status["running"]:
-        print(f"[STATUS] 爬虫运行中，关键词: {crawler_status['keyword']}, 已抓取: {len(crawler_status['data'])} 条")
-    elif crawler_status["error"]:
-        print(f"[STATUS] 爬虫已停止，错误: {crawler_status['error']}")
-    elif len(crawler_status["data"]) > 0:
-        print(f"[STATUS] 爬虫已完成，成功抓取 {len(crawler_status['data'])} 条数据")
+    if job.running:
+        print(f"[STATUS] 爬虫运行中，关键词: {job.keyword}, 已抓取: {len(job.data)} 条")
+    elif job.error:
+        print(f"[STATUS] 爬虫已停止，错误: {job.error}")
+    elif len(job.data) > 0:
+        print(f"[STATUS] 爬虫已完成，成功抓取 {len(job.data)} 条数据")
     else:
-        print(f"[STATUS] 爬虫状态: 未运行，数据: {len(crawler_status['data'])} 条")
+        print(f"[STATUS] 爬虫状态: 未运行，数据: {len(job.data)} 条")
     return jsonify(status)
 
+@app.route('/api/pool', methods=['GET'])
+def get_pool_status():
+    """获取浏览器池占用情况"""
+    if CRAWLER_MODE != "pool":
+        return jsonify({"mode": CRAWLER_MODE, "size": 0})
+    stats = get_crawler_pool().stats()
+    stats["mode"] = CRAWLER_MODE
+    return jsonify(stats)
+
+@app.route('/api/session', methods=['GET'])
+def get_session_status():
+    """保存的登录状态：是否有效、过期时间、登录账号（只检查保存的 cookie，不打开页面）"""
+    return jsonify(get_session_store().status())
+
+@app.route('/api/quota', methods=['GET'])
+def get_quota():
+    """各 API Key 最近一分钟的 Gemini 请求数、token 用量、排队和限流情况"""
+    return jsonify(quota_manager.utilization())
+
+@app.route('/api/cache', methods=['GET'])
+def get_cache_stats():
+    """分析缓存的命中情况"""
+    return jsonify(analysis_cache.stats())
+
+@app.route('/api/listings', methods=['GET'])
+def list_listings():
+    """
+    从商品库分页查询商品，不会把整库读入内存
+    参数：keyword、min_price、max_price、since、order（recent / price / price_desc）、limit、offset，
+    collapse=1 时每个近似重复簇只返回价格最低的一条（附重复发布次数 reposts）
+    """
+    try:
+        filters = parse_listing_filters(request.args)
+        limit = max(1, min(int(request.args.get('limit') or LISTINGS_PAGE_SIZE), LISTINGS_PAGE_LIMIT))
+        offset = max(0, int(request.args.get('offset') or 0))
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    
+    collapse = request.args.get('collapse') in ('1', 'true')
+    items = listing_store.query(
+        limit=limit, offset=offset, order=request.args.get('order', 'recent'), collapse=collapse, **filters
+    )
+    return jsonify({
+        "success": True,
+        "total": listing_store.count(collapse=collapse, **filters),
+        "limit": limit,
+        "offset": offset,
+        "data": items
+    })
+
+@app.route('/api/watches', methods=['POST'])
+def create_watch():
+    """
+    注册关键词监控
+    请求体：keyword、interval（秒，或 30m / 2h / 1d）、max_price（低于该价格提醒）、
+    min_score（分析评分达到该值提醒）、webhook（提醒推送地址，可选）、
+    api_key（评分提醒使用的 Gemini API Key，可选，不提供时用本地分析）以及 max_items / max_pages
+    """
+    data = request.json or {}
+    keyword = (data.get('keyword') or '').strip()
+    if not keyword:
+        return jsonify({"success": False, "message": "监控关键词不能为空"}), 400
+    
+    try:
+        interval = parse_interval(data.get('interval', '1h'))
+        options = parse_crawl_options(data)
+        max_price = float(data['max_price']) if data.get('max_price') not in (None, '') else None
+        min_score = float(data['min_score']) if data.get('min_score') not in (None, '') else None
+    except (TypeError, ValueError) as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    
+    options.pop("incremental", None)
+    watch = watch_scheduler.add(
+        keyword, interval, options, max_price=max_price, min_score=min_score,
+        webhook=data.get('webhook') or None, api_key=(data.get('api_key') or '').strip() or None
+    )
+    watch_scheduler.start()
+    return jsonify({"success": True, "watch": watch})
+
+@app.route('/api/watches', methods=['GET'])
+def list_watches():
+    """列出所有监控"""
+    return jsonify({"watches": watch_scheduler.list()})
+
+@app.route('/api/watches/<watch_id>', methods=['DELETE'])
+def delete_watch(watch_id):
+    """删除监控"""
+    if not watch_scheduler.remove(watch_id):
+        return jsonify({"success": False, "message": "监控不存在"}), 404
+    return jsonify({"success": True})
+
+@app.route('/api/watches/<watch_id>/run', methods=['POST'])
+def run_watch(watch_id):
+    """立即运行一次监控"""
+    if not watch_scheduler.run_now(watch_id):
+        return jsonify({"success": False, "message": "监控不存在"}), 404
+    watch_scheduler.start()
+    return jsonify({"success": True})
+
+@app.route('/api/alerts', methods=['GET'])
+def list_alerts():
+    """最近的监控提醒（最新的在前）；?since= 时按编号顺序返回该编号之后的提醒（最早的在前）"""
+    try:
+        since = int(request.args.get('since') or 0)
+        limit = max(1, min(int(request.args.get('limit') or 100), 1000))
+    except ValueError:
+        return jsonify({"success": False, "message": "since / limit 必须是整数"}), 400
+    return jsonify({"alerts": watch_scheduler.alerts(since, limit)})
+
+def prepare_analysis(data):
+    """
+    解析分析请求并确定要分析的商品，返回 (上下文, None)；请求有误时返回 (None, (响应内容, HTTP状态码))
+    商品来源：job_id 指定的任务（内存中没有时从商品库读取该次抓取），
+    或按 keyword / min_price / max_price / since 从商品库查询，两者必须指定其一（不会分析其他用户的任务）
+    增量任务默认只分析变化部分（新商品和降价商品），mode=full 时分析全部抓取结果
+    """
+    job_id = data.get('job_id')
+    
+    try:
+        top_n = int(data.get('top_n') or ANALYZE_TOP_N)
+        top_k = int(data.get('prefilter_top_k') or DEFAULT_TOP_K)
+    except (TypeError, ValueError):
+        return None, ({"success": False, "message": "top_n / prefilter_top_k 必须是整数"}, 400)
+    
+    try:
+        filters = parse_listing_filters(data)
+    except ValueError as e:
+        return None, ({"success": False, "message": str(e)}, 400)
+    
+    if not job_id and not filters["keyword"]:
+        return None, ({"success": False, "message": "请指定 job_id 或 keyword"}, 400)
+    
+    job = job_scheduler.get(job_id) if job_id else None
+    delta = None
+    if job and job.incremental and data.get('mode') != 'full':
+        delta = job.delta
+    elif not job and job_id and data.get('mode') == 'delta':
+        delta = listing_store.crawl_delta(job_id)
+    
+    if delta is not None:
+        listings = analysis_listings(delta["new"] + delta["price_drops"])
+        print(f"[ANALYZE] 增量分析：新商品 {len(delta['new'])} 个，降价 {len(delta['price_drops'])} 个，"
+              f"下架 {len(delta['removed'])} 个")
+    elif job:
+        listings = analysis_listings(job.data)
+    elif job_id:
+        listings = analysis_listings(listing_store.crawl_items(job_id, limit=MAX_ITEMS_LIMIT))
+    elif filters["keyword"]:
+        listings = analysis_listings(listing_store.query(limit=MAX_ITEMS_LIMIT, collapse=True, **filters))
+    else:
+        listings = []
+    
+    # 本地预筛：去掉价格离群、求购/商家/配件帖和近似重复，只把前 top_k 个候选发给模型（prefilter=false 时关闭）
+    prefilter_stats = None
+    if listings and data.get('prefilter', True):
+        keyword = job.keyword if job else (filters["keyword"] or "")
+        listings, prefilter_stats = prefilter(listings, keyword=keyword, top_k=top_k)
+        print(f"[ANALYZE] 预筛：{prefilter_stats['input']} 条商品保留 {prefilter_stats['output']} 条")
+    
+    context = {
+        "api_key": data.get('api_key', ''),
+        "job": job,
+        "source": job_id or filters["keyword"],  # 配额排队时按任务（或关键词）轮流放行
+        "listings": listings,
+        "delta": delta,
+        "prefilter": prefilter_stats,
+        "top_n": top_n
+    }
+    return context, None
+
+def begin_analysis(context):
+    """推送 analysis_started，返回每个分片完成时推送到任务事件流的回调"""
+    job = context["job"]
+    if not job:
+        return None
+    job.publish("analysis_started", count=len(context["listings"]))
+    def on_chunk(index, total, results):
+        job.publish("analysis_chunk", index=index, total=total, data=results)
+    return on_chunk
+
+def unchanged_payload(context):
+    """增量分析时与上次相比没有变化，不需要调用模型"""
+    if context["delta"] is not None and not context["listings"]:
+        return {"success": True, "data": [], "message": "与上次抓取相比没有新商品或降价商品"}, 200
+    return None
+
+def finish_analysis(context, payload):
+    """补充预筛和增量统计，并把结果推送到任务事件流"""
+    delta = context["delta"]
+    job = context["job"]
+    if context["prefilter"] is not None:
+        payload["prefilter"] = context["prefilter"]
+    if delta is not None:
+        payload["delta"] = {
+            "new": len(delta["new"]),
+            "price_drops": len(delta["price_drops"]),
+            "removed": [analysis_fields(item) for item in delta["removed"]],
+            "complete": delta["complete"]
+        }
+    if job:
+        if payload.get("success") or payload.get("fallback_available"):
+            job.publish("analysis_done", data=payload.get("data", []), fallback=not payload.get("success"))
+        else:
+            job.publish("analysis_error", error=payload.get("message"))
+    return payload
+
 @app.route('/api/analyze', methods=['POST'])
-def analyze():
-    """使用Gemini分析商品数据"""
-    global gemini_client
+@app.route('/api/analyze/<job_id>', methods=['POST'])
+def analyze(job_id=None):
+    """使用Gemini分析商品数据（商品来源见 prepare_analysis，/api/analyze/<job_id> 分析指定任务）"""
+    data = dict(request.json or {})
+    if job_id:
+        data['job_id'] = job_id
+    context, error = prepare_analysis(data)
+    if error:
+        payload, status_code = error
+        return jsonify(payload), status_code
     
-    data = request.json
-    api_key = data.get('api_key', '')
+    on_chunk = begin_analysis(context)
+    payload, status_code = unchanged_payload(context) or run_analysis(
+        context["listings"], context["api_key"], top_n=context["top_n"], on_chunk=on_chunk, source=context["source"]
+    )
+    return jsonify(finish_analysis(context, payload)), status_code
+
+def analysis_precheck(listings, api_key):
+    """
+    分析前检查 API Key 和数据，返回 (客户端, None)；不能开始分析时返回 (None, (响应内容, HTTP状态码))
+    每个请求使用自己的 API Key 对应的客户端，不会用到其他用户初始化的客户端
+    """
+    if not api_key:
+        return None, ({"success": False, "message": "请先设置Gemini API Key"}, 400)
     
-    if not gemini_client and api_key:
-        success, message = init_gemini_client(api_key)
-        if not success:
-            return jsonify({"success": False, "message": f"Gemini初始化失败: {message}"}), 500
+    client, message = get_gemini_client(api_key)
+    if client is None:
+        return None, ({"success": False, "message": f"Gemini初始化失败: {message}"}, 500)
     
-    if not gemini_client:
-        return jsonify({"success": False, "message": "请先设置Gemini API Key"}), 400
+    if not listings:
+        return None, ({"success": False, "message": "没有可分析的数据，请先搜索商品"}, 400)
     
-    if not crawler_status["data"]:
-        return jsonify({"success": False, "message": "没有可分析的数据，请先搜索商品"}), 400
+    print(f"[ANALYZE] 开始分析 {len(listings)} 条商品数据")
+    return client, None
+
+def region_error_payload(listings, msg=None):
+    """
+    地区限制时的响应，附带本地分析结果作为备选
+    msg: 重新初始化客户端失败时的详细错误
+    """
+    local_results = simple_local_analyze(listings)
+    if msg is not None:
+        message = f"Gemini API 地区限制错误。\n\n根据 Google 官方文档，Gemini API 在部分地区不可用（包括中国大陆）。\n\n可能原因：\n1. API Key 在受限地区注册\n2. 即使使用代理，Gemini 可能通过 API Key 注册地区判断\n\n解决方案：\n1. 使用在支持地区（如美国、日本、新加坡等）注册的 API Key\n2. 使用 Vertex AI Gemini API（需要 GCP 账号）\n3. 使用本地简单分析（已自动应用，见下方结果）\n\n参考：https://ai.google.dev/gemini-api/docs/available-regions\n\n详细错误: {msg}"
+    else:
+        message = "Gemini API 地区限制错误。\n\n根据 Google 官方文档，Gemini API 在部分地区不可用（包括中国大陆）。\n\n即使代理IP正常，Gemini可能通过API Key注册地区判断位置。\n\n建议：\n1. 使用在支持地区（如美国、日本、新加坡等）注册的API Key\n2. 或使用本地简单分析（已自动应用，见下方结果）\n\n参考：https://ai.google.dev/gemini-api/docs/available-regions"
+    return {
+        "success": False,
+        "message": message,
+        "fallback_available": True,
+        "data": local_results
+    }, 500
+
+def analysis_error_payload(e):
+    error_str = str(e)
+    print(f"[ANALYZE] 分析失败: {error_str}")
+    return {"success": False, "message": f"分析失败: {error_str}"}, 500
+
+def run_analysis(listings, api_key, top_n=ANALYZE_TOP_N, on_chunk=None, source=None):
+    """
+    分析商品列表，返回 (响应内容, HTTP状态码)
+    商品按 token 预算切片后并发发送给 Gemini，合并后返回评分最高的 top_n 个
+    on_chunk(index, total, results): 每个分片完成时回调
+    source: 任务ID或关键词，同一个 Key 的配额在不同来源之间轮流分配
+    """
+    client, error = analysis_precheck(listings, api_key)
+    if error:
+        return error
     
     try:
-        prompt = f"""
-        任务：从以下闲鱼商品数据中，识别出高性价比的商品（评分 > 8分）。
-        排除：商家/经销商发布的商品。
-        输出格式：JSON数组，每个商品包含 title（标题）、price（价格）、reason（推荐理由）、score（评分1-10）。
-        
-        商品数据：
-        {json.dumps(crawler_status["data"], ensure_ascii=False)}
-        
-        请只返回JSON数组，不要其他文字说明。
-        """
-        
-        print(f"[ANALYZE] 开始分析 {len(crawler_status['data'])} 条商品数据")
-        
-        max_retries = 3
-        for attempt in range(max_retries):
+        for attempt in range(2):
             try:
-                response = gemini_client.models.generate_content(
-                    model="gemini-2.5-flash",
-                    contents=prompt,
-                    config={"response_mime_type": "application/json"}
+                result, info = analyze_listings(
+                    client, listings, top_n=top_n, on_chunk=on_chunk, cache=analysis_cache,
+                    quota=quota_manager.for_key(api_key, source)
                 )
-                
-                result = json.loads(response.text)
                 print(f"[ANALYZE] 分析成功，找到 {len(result)} 个推荐商品")
-                return jsonify({
+                return {
                     "success": True,
-                    "data": result
-                })
-                
-            except Exception as e:
-                error_str = str(e)
-                print(f"[ANALYZE] 尝试 {attempt + 1}/{max_retries} 失败: {error_str}")
+                    "data": result,
+                    "stats": info
+                }, 200
                 
+            except RegionError:
                 # 如果是地区限制错误，可能是API Key注册地区的问题
-                if "FAILED_PRECONDITION" in error_str or "location is not supported" in error_str.lower():
+                if attempt == 0:
                     # 重新初始化客户端（可能代理配置有问题）
-                    if attempt == 0:
-                        print("[ANALYZE] 检测到地区限制，尝试重新初始化客户端...")
-                        success, msg = init_gemini_client(api_key)
-                        if not success:
-                            # 提供本地分析作为备选
-                            local_results = simple_local_analyze(crawler_status["data"])
-                            return jsonify({
-                                "success": False, 
-                                "message": f"Gemini API 地区限制错误。\n\n根据 Google 官方文档，Gemini API 在部分地区不可用（包括中国大陆）。\n\n可能原因：\n1. API Key 在受限地区注册\n2. 即使使用代理，Gemini 可能通过 API Key 注册地区判断\n\n解决方案：\n1. 使用在支持地区（如美国、日本、新加坡等）注册的 API Key\n2. 使用 Vertex AI Gemini API（需要 GCP 账号）\n3. 使用本地简单分析（已自动应用，见下方结果）\n\n参考：https://ai.google.dev/gemini-api/docs/available-regions\n\n详细错误: {msg}",
-                                "fallback_available": True,
-                                "data": local_results
-                            }), 500
-                        # 重试一次
-                        continue
-                    else:
+                    print("[ANALYZE] 检测到地区限制，尝试重新初始化客户端...")
+                    client, msg = get_gemini_client(api_key, force=True)
+                    if client is None:
                         # 提供本地分析作为备选
-                        local_results = simple_local_analyze(crawler_status["data"])
-                        return jsonify({
-                            "success": False,
-                            "message": f"Gemini API 地区限制错误。\n\n根据 Google 官方文档，Gemini API 在部分地区不可用（包括中国大陆）。\n\n即使代理IP正常，Gemini可能通过API Key注册地区判断位置。\n\n建议：\n1. 使用在支持地区（如美国、日本、新加坡等）注册的API Key\n2. 或使用本地简单分析（已自动应用，见下方结果）\n\n参考：https://ai.google.dev/gemini-api/docs/available-regions",
-                            "fallback_available": True,
-                            "data": local_results
-                        }), 500
-                
-                if attempt < max_retries - 1:
-                    time.sleep(2)
+                        return region_error_payload(listings, msg)
+                    # 重试一次
                     continue
-                else:
-                    raise e
+                
+                # 提供本地分析作为备选
+                return region_error_payload(listings)
                     
     except Exception as e:
-        error_str = str(e)
-        print(f"[ANALYZE] 分析失败: {error_str}")
-        return jsonify({"success": False, "message": f"分析失败: {error_str}"}), 500
+        return analysis_error_payload(e)
 
 if __name__ == '__main__':
     # 设置代理环境变量
-    os.environ["http_proxy"] = "http://127.0.0.1:7890"
-    os.environ["https_proxy"] = "http://127.0.0.1:7890"
-    os.environ["all_proxy"] = "http://127.0.0.1:7890"
+    if GEMINI_USE_PROXY:
+        os.environ["http_proxy"] = "http://127.0.0.1:7890"
+        os.environ["https_proxy"] = "http://127.0.0.1:7890"
+        os.environ["all_proxy"] = "http://127.0.0.1:7890"
+    
+    # debug模式下只在实际提供服务的子进程中启动后台服务
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background()
     
     print("🚀 后端服务器启动中...")
     print("📡 API地址: http://localhost:5000")
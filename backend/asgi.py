@@ -0,0 +1,200 @@
+"""
+ASGI 入口：分析、状态查询和事件流用异步路由处理，其余接口交给原来的 Flask 应用
+Gemini 请求以协程并发，SSE 连接只占用一个等待中的协程，不会各自占住一个工作线程
+抓取仍在任务调度器的线程池中运行，不经过请求线程
+
+运行：cd backend && uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+import app as backend
+from analyzer import analyze_listings_async, RegionError
+
+
+async def run_analysis_async(listings, api_key, top_n=backend.ANALYZE_TOP_N, on_chunk=None, source=None):
+    """
+    backend.run_analysis 的异步版本，返回值相同
+    创建客户端（可能等待代理检测）和本地分析（地区限制时的备选结果）是同步的，放到线程中执行
+    """
+    client, error = await asyncio.to_thread(backend.analysis_precheck, listings, api_key)
+    if error:
+        return error
+
+    try:
+        for attempt in range(2):
+            try:
+                result, info = await analyze_listings_async(
+                    client, listings, top_n=top_n, on_chunk=on_chunk, cache=backend.analysis_cache,
+                    quota=backend.quota_manager.for_key(api_key, source)
+                )
+                print(f"[ANALYZE] 分析成功，找到 {len(result)} 个推荐商品")
+                return {
+                    "success": True,
+                    "data": result,
+                    "stats": info
+                }, 200
+
+            except RegionError:
+                if attempt == 0:
+                    # 重建客户端需要等待一次代理检测，放到线程中执行
+                    print("[ANALYZE] 检测到地区限制，尝试重新初始化客户端...")
+                    client, msg = await asyncio.to_thread(backend.get_gemini_client, api_key, True)
+                    if client is None:
+                        return await asyncio.to_thread(backend.region_error_payload, listings, msg)
+                    continue
+
+                return await asyncio.to_thread(backend.region_error_payload, listings)
+
+    except Exception as e:
+        return backend.analysis_error_payload(e)
+
+
+async def analyze(request):
+    """使用Gemini分析商品数据（参数与 Flask 的 /api/analyze、/api/analyze/<job_id> 相同）"""
+    try:
+        data = dict(await request.json() or {})
+    except ValueError:
+        data = {}
+    if request.path_params.get('job_id'):
+        data['job_id'] = request.path_params['job_id']
+    # 从商品库读取和预筛是同步的数据库操作，放到线程中执行
+    context, error = await asyncio.to_thread(backend.prepare_analysis, data)
+    if error:
+        payload, status_code = error
+        return JSONResponse(payload, status_code=status_code)
+
+    on_chunk = backend.begin_analysis(context)
+    payload, status_code = backend.unchanged_payload(context) or await run_analysis_async(
+        context["listings"], context["api_key"], top_n=context["top_n"], on_chunk=on_chunk, source=context["source"]
+    )
+    return JSONResponse(backend.finish_analysis(context, payload), status_code=status_code)
+
+
+async def get_status(request):
+    """获取爬虫状态（/api/status/{job_id} 或 ?job_id= 指定任务，都未指定时为最近一次搜索的任务，该用法已弃用）"""
+    job_id = request.path_params.get('job_id') or request.query_params.get('job_id')
+    if not job_id:
+        backend.warn_status_without_job_id()
+    job = backend.get_job(job_id)
+    if job is None and job_id:
+        crawl = await asyncio.to_thread(backend.listing_store.get_crawl, job_id)
+        if not crawl:
+            return JSONResponse({"success": False, "message": "任务不存在"}, status_code=404)
+        return JSONResponse(crawl)
+    if job is None:
+        return JSONResponse({"running": False, "keyword": "", "data_count": 0, "error": None})
+    return JSONResponse(job.to_dict())
+
+
+async def job_detail(request):
+    """获取单个任务的状态和结果，内存中没有时从商品库读取"""
+    job_id = request.path_params['job_id']
+    job = backend.job_scheduler.get(job_id)
+    if job:
+        return JSONResponse(job.to_dict(include_data=True))
+
+    def load():
+        crawl = backend.listing_store.get_crawl(job_id)
+        if crawl:
+            crawl["data"] = backend.listing_store.crawl_items(job_id)
+        return crawl
+
+    crawl = await asyncio.to_thread(load)
+    if not crawl:
+        return JSONResponse({"success": False, "message": "任务不存在"}, status_code=404)
+    return JSONResponse(crawl)
+
+
+async def job_events(request):
+    """
+    任务生命周期事件流（Server-Sent Events），格式与 Flask 的 /api/events/<job_id> 相同
+    任务发布事件时通过 call_soon_threadsafe 唤醒事件循环，等待期间不占用线程
+    """
+    job = backend.job_scheduler.get(request.path_params['job_id'])
+    if not job:
+        return JSONResponse({"success": False, "message": "任务不存在"}, status_code=404)
+
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or request.query_params.get('since') or 0)
+    except ValueError:
+        last_id = 0
+
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+
+    def on_event(event):
+        loop.call_soon_threadsafe(changed.set)
+
+    async def stream():
+        job.subscribe(on_event)
+        try:
+            index = last_id
+            idle_since = time.time()
+            while True:
+                changed.clear()
+                events, closed = job.wait_events(index, timeout=0)
+                if not events and not closed:
+                    try:
+                        await asyncio.wait_for(changed.wait(), backend.SSE_KEEPALIVE)
+                    except asyncio.TimeoutError:
+                        pass
+                    events, closed = job.wait_events(index, timeout=0)
+                for event in events:
+                    index = event["id"]
+                    yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+                if events:
+                    idle_since = time.time()
+                elif closed or time.time() - idle_since > backend.SSE_IDLE_TIMEOUT:
+                    break
+                else:
+                    # 心跳，防止代理或浏览器断开空闲连接
+                    yield ": keepalive\n\n"
+                if closed and index >= len(job.events):
+                    break
+        finally:
+            job.unsubscribe(on_event)
+
+    return StreamingResponse(stream(), media_type='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    await asyncio.to_thread(backend.start_background)
+    yield
+
+
+app = Starlette(
+    routes=[
+        Route('/api/analyze', analyze, methods=['POST']),
+        Route('/api/analyze/{job_id}', analyze, methods=['POST']),
+        Route('/api/status', get_status, methods=['GET']),
+        Route('/api/status/{job_id}', get_status, methods=['GET']),
+        Route('/api/jobs/{job_id}', job_detail, methods=['GET']),
+        Route('/api/events/{job_id}', job_events, methods=['GET']),
+        # 其余接口（初始化、搜索、商品库、监控等）和前端页面仍由 Flask 处理
+        Mount('/', app=WSGIMiddleware(backend.app))
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])],
+    lifespan=lifespan
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print("🚀 后端服务器启动中（ASGI）...")
+    print("📡 API地址: http://localhost:5000")
+    uvicorn.run(app, host='0.0.0.0', port=5000)
@@ -0,0 +1,90 @@
+import threading
+import time
+
+# 代理检测结果的有效期（秒），过期后在后台重新检测，请求不会等待检测完成
+PROXY_CHECK_TTL = 300
+
+
+class ProxyHealth:
+    """
+    代理健康状态缓存：check_fn() -> (ok, country, ip) 在后台线程中运行
+    status() 立即返回最近一次的检测结果（从未检测过时 checked_at 为 None），结果过期时顺带触发一次后台检测
+    """
+
+    def __init__(self, check_fn, ttl=PROXY_CHECK_TTL):
+        self.check_fn = check_fn
+        self.ttl = ttl
+        self.ok = None
+        self.country = "Unknown"
+        self.ip = "Unknown"
+        self.checked_at = None
+        self._lock = threading.Lock()
+        self._checking = False
+        self._done = threading.Event()
+
+    def _check(self):
+        try:
+            ok, country, ip = self.check_fn()
+        except Exception as e:
+            print(f"[PROXY] 后台代理检测异常: {e}")
+            ok, country, ip = False, "Unknown", "Unknown"
+        with self._lock:
+            self.ok, self.country, self.ip = ok, country, ip
+            self.checked_at = time.time()
+            self._checking = False
+            self._done.set()
+
+    def refresh(self, wait=False, timeout=10):
+        """触发一次检测；wait 为 True 时等待检测完成（最多 timeout 秒）"""
+        with self._lock:
+            if not self._checking:
+                self._checking = True
+                self._done.clear()
+                threading.Thread(target=self._check, name="proxy-check", daemon=True).start()
+        if wait:
+            self._done.wait(timeout)
+        return self.status(refresh=False)
+
+    def status(self, refresh=True):
+        with self._lock:
+            stale = self.checked_at is None or time.time() - self.checked_at > self.ttl
+            result = {
+                "ok": self.ok,
+                "country": self.country,
+                "ip": self.ip,
+                "checked_at": self.checked_at,
+                "checking": self._checking
+            }
+        if refresh and stale:
+            self.refresh()
+        return result
+
+
+class ClientRegistry:
+    """
+    Gemini 客户端注册表：每个 API Key 只创建一个客户端并复用（客户端内部的 HTTP 连接池随之复用）
+    factory(api_key) -> 客户端
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get(self, api_key):
+        with self._lock:
+            client = self._clients.get(api_key)
+            if client is None:
+                client = self.factory(api_key)
+                self._clients[api_key] = client
+                print(f"[GEMINI] 为 API Key ...{api_key[-4:]} 创建客户端，当前共 {len(self._clients)} 个")
+            return client
+
+    def invalidate(self, api_key):
+        """丢弃某个 Key 的客户端（如遇到地区限制后需要重建）"""
+        with self._lock:
+            self._clients.pop(api_key, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._clients)
@@ -0,0 +1,281 @@
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+
+# 每个 API Key 每分钟的请求数和 token 数上限（按所用套餐调整，默认是 gemini-2.5-flash 免费档）
+DEFAULT_RPM = int(os.environ.get("GEMINI_RPM", "10"))
+DEFAULT_TPM = int(os.environ.get("GEMINI_TPM", "250000"))
+# 预估 token 时为模型输出预留的数量，请求完成后按实际用量修正
+OUTPUT_TOKEN_RESERVE = 1024
+# 指数退避：第 n 次重试等待约 BACKOFF_BASE * 2^n 秒（带随机抖动），不超过 BACKOFF_MAX
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+# 自适应限速：收到 429 时把可用速率减半，之后每次成功恢复一点，直到回到配置的上限
+MIN_RATE_FACTOR = 0.1
+RATE_RECOVERY_STEP = 0.05
+# 令牌桶和用量统计的时间窗口（秒）
+WINDOW = 60.0
+
+_RETRY_AFTER_PATTERNS = [
+    re.compile(r"retryDelay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s", re.IGNORECASE),
+    re.compile(r"retry in (\d+(?:\.\d+)?)\s*s", re.IGNORECASE),
+    re.compile(r"retry[- ]after['\"]?\s*[:=]?\s*(\d+(?:\.\d+)?)", re.IGNORECASE),
+]
+
+
+def is_rate_limit_error(error_str):
+    return "429" in error_str or "RESOURCE_EXHAUSTED" in error_str
+
+
+def parse_retry_after(error_str):
+    """从错误信息中读取服务端建议的等待秒数（RetryInfo.retryDelay / Retry-After），没有时返回 None"""
+    for pattern in _RETRY_AFTER_PATTERNS:
+        match = pattern.search(error_str)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+def backoff_delay(attempt, retry_after=None):
+    """第 attempt 次（从 0 开始）重试前的等待秒数：指数退避加随机抖动，服务端给出 retry_after 时不少于它"""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+    delay = delay / 2 + random.uniform(0, delay / 2)
+    if retry_after is not None:
+        delay = max(delay, retry_after + random.uniform(0, 1))
+    return delay
+
+
+class TokenBucket:
+    """令牌桶：容量为每分钟上限，按秒匀速补充；rate_factor 缩放实际可用速率"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    def refill(self, now, factor=1.0):
+        capacity = self.capacity * factor
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * capacity / WINDOW)
+        self.updated = now
+
+    def wait_time(self, amount, factor=1.0):
+        """取出 amount 个令牌还需要等待的秒数（调用前先 refill）"""
+        amount = min(amount, self.capacity * factor)  # 超过桶容量的请求等桶满即可放行
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) * WINDOW / (self.capacity * factor)
+
+    def take(self, amount):
+        self.tokens -= amount
+
+
+class KeyQuota:
+    """单个 API Key 的配额状态：请求数和 token 两个令牌桶、429 后的暂停时间、按任务排队的等待者"""
+
+    def __init__(self, rpm, tpm):
+        self.requests = TokenBucket(rpm)
+        self.token_bucket = TokenBucket(tpm)
+        self.rate_factor = 1.0
+        self.blocked_until = 0.0
+        self.rate_limited = 0  # 连续收到 429 的次数
+        self.history = deque()  # 最近一分钟放行的请求 (时间, token 数)
+        self.queues = {}  # 任务 -> 等待中的票据（先进先出）
+        self.turns = deque()  # 有等待者的任务，轮流放行
+        self.total_requests = 0
+        self.total_rate_limited = 0
+
+    def refill(self, now):
+        self.requests.refill(now, self.rate_factor)
+        self.token_bucket.refill(now, self.rate_factor)
+        while self.history and now - self.history[0][0] > WINDOW:
+            self.history.popleft()
+
+
+class QuotaManager:
+    """
+    Gemini 配额管理：按 API Key 统计每分钟请求数（RPM）和 token 数（TPM），请求前等待令牌，
+    收到 429 时按 retry-after 或指数退避暂停该 Key 并降低速率，多个任务同时等待时轮流放行
+    """
+
+    def __init__(self, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._keys = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    def for_key(self, api_key, job=None):
+        """某个 Key、某个任务使用的配额句柄，传给 analyzer"""
+        return QuotaSlot(self, api_key, job or "default")
+
+    def _quota(self, api_key):
+        quota = self._keys.get(api_key)
+        if quota is None:
+            quota = KeyQuota(self.rpm, self.tpm)
+            self._keys[api_key] = quota
+        return quota
+
+    def _enqueue(self, api_key, job):
+        with self._lock:
+            quota = self._quota(api_key)
+            ticket = object()
+            if job not in quota.queues:
+                quota.queues[job] = deque()
+                quota.turns.append(job)
+            quota.queues[job].append(ticket)
+            return ticket
+
+    def _try_acquire(self, api_key, job, ticket, tokens):
+        """
+        轮到这个票据且配额足够时放行，返回 0；否则返回建议的等待秒数
+        只有轮转队首任务的第一个票据可以放行，保证各任务交替使用配额
+        """
+        with self._lock:
+            quota = self._quota(api_key)
+            now = time.monotonic()
+            quota.refill(now)
+            if quota.turns[0] != job or quota.queues[job][0] is not ticket:
+                return 0.5
+            wait = max(
+                quota.blocked_until - now,
+                quota.requests.wait_time(1, quota.rate_factor),
+                quota.token_bucket.wait_time(tokens, quota.rate_factor)
+            )
+            if wait > 0:
+                return wait
+            quota.requests.take(1)
+            quota.token_bucket.take(tokens)
+            quota.history.append((now, tokens))
+            quota.total_requests += 1
+            quota.queues[job].popleft()
+            quota.turns.popleft()
+            if quota.queues[job]:
+                quota.turns.append(job)
+            else:
+                del quota.queues[job]
+            self._changed.notify_all()
+            return 0.0
+
+    def _cancel(self, api_key, job, ticket):
+        with self._lock:
+            quota = self._quota(api_key)
+            queue = quota.queues.get(job)
+            if not queue or ticket not in queue:
+                return
+            queue.remove(ticket)
+            if not queue:
+                del quota.queues[job]
+                quota.turns.remove(job)
+            self._changed.notify_all()
+
+    def acquire(self, api_key, tokens, job="default"):
+        """阻塞直到可以发送一个约 tokens 个 token 的请求"""
+        ticket = self._enqueue(api_key, job)
+        try:
+            while True:
+                wait = self._try_acquire(api_key, job, ticket, tokens)
+                if wait <= 0:
+                    return
+                with self._changed:
+                    self._changed.wait(min(wait, 1.0))
+        except BaseException:
+            self._cancel(api_key, job, ticket)
+            raise
+
+    async def acquire_async(self, api_key, tokens, job="default"):
+        """acquire 的异步版本，等待期间不占用线程"""
+        ticket = self._enqueue(api_key, job)
+        try:
+            while True:
+                wait = self._try_acquire(api_key, job, ticket, tokens)
+                if wait <= 0:
+                    return
+                await asyncio.sleep(min(wait, 0.25))
+        except BaseException:
+            self._cancel(api_key, job, ticket)
+            raise
+
+    def record(self, api_key, estimated, actual):
+        """请求完成后用实际 token 用量修正预估值"""
+        if actual is None:
+            return
+        with self._lock:
+            quota = self._quota(api_key)
+            quota.token_bucket.take(actual - estimated)
+            for i in range(len(quota.history) - 1, -1, -1):
+                at, tokens = quota.history[i]
+                if tokens == estimated:
+                    quota.history[i] = (at, actual)
+                    break
+
+    def report_success(self, api_key):
+        with self._lock:
+            quota = self._quota(api_key)
+            quota.rate_limited = 0
+            quota.rate_factor = min(1.0, quota.rate_factor + RATE_RECOVERY_STEP)
+
+    def report_rate_limit(self, api_key, retry_after=None):
+        """收到 429：暂停该 Key（优先按服务端的 retry-after），并把可用速率减半"""
+        with self._lock:
+            quota = self._quota(api_key)
+            delay = backoff_delay(quota.rate_limited, retry_after)
+            quota.rate_limited += 1
+            quota.total_rate_limited += 1
+            quota.rate_factor = max(MIN_RATE_FACTOR, quota.rate_factor / 2)
+            quota.blocked_until = max(quota.blocked_until, time.monotonic() + delay)
+            print(f"[QUOTA] API Key ...{api_key[-4:]} 触发限流，暂停 {delay:.1f} 秒，速率降至 {quota.rate_factor:.0%}")
+            return delay
+
+    def utilization(self):
+        """各 Key 最近一分钟的用量和限流状态（Key 只显示后 4 位）"""
+        result = []
+        with self._lock:
+            now = time.monotonic()
+            for api_key, quota in self._keys.items():
+                quota.refill(now)
+                used_requests = len(quota.history)
+                used_tokens = sum(tokens for _, tokens in quota.history)
+                result.append({
+                    "key": f"...{api_key[-4:]}",
+                    "rpm_limit": self.rpm,
+                    "tpm_limit": self.tpm,
+                    "rate_factor": round(quota.rate_factor, 2),
+                    "requests_last_minute": used_requests,
+                    "tokens_last_minute": used_tokens,
+                    "rpm_utilization": round(used_requests / (self.rpm * quota.rate_factor), 2),
+                    "tpm_utilization": round(used_tokens / (self.tpm * quota.rate_factor), 2),
+                    "waiting": sum(len(queue) for queue in quota.queues.values()),
+                    "waiting_jobs": len(quota.queues),
+                    "blocked_for": round(max(0.0, quota.blocked_until - now), 1),
+                    "total_requests": quota.total_requests,
+                    "total_rate_limited": quota.total_rate_limited
+                })
+        return {"rpm": self.rpm, "tpm": self.tpm, "keys": result}
+
+
+class QuotaSlot:
+    """绑定了 API Key 和任务的配额句柄"""
+
+    def __init__(self, manager, api_key, job):
+        self.manager = manager
+        self.api_key = api_key
+        self.job = job
+
+    def acquire(self, tokens):
+        self.manager.acquire(self.api_key, tokens, self.job)
+
+    async def acquire_async(self, tokens):
+        await self.manager.acquire_async(self.api_key, tokens, self.job)
+
+    def record(self, estimated, actual):
+        self.manager.record(self.api_key, estimated, actual)
+
+    def report_success(self):
+        self.manager.report_success(self.api_key)
+
+    def report_rate_limit(self, retry_after=None):
+        return self.manager.report_rate_limit(self.api_key, retry_after)
@@ -0,0 +1,286 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# 收到这些事件后任务的事件流结束（抓取失败，或分析已经给出最终结果）
+TERMINAL_EVENTS = ("crawl_error", "analysis_done", "analysis_error")
+# 抓取结果每攒够这么多条批量写入一次商品库
+STORE_BATCH_SIZE = 50
+# 爬虫因这些原因停止时说明搜索结果已经全部抓完，可以判断哪些商品已下架
+COMPLETE_REASONS = ("no_next_page", "no_new_items", "page_unchanged")
+# 内存中最多保留的任务数和商品总数，超出时从最早结束的任务开始淘汰（已持久化的任务仍可从商品库查询）
+MAX_RETAINED_JOBS = 200
+MAX_RETAINED_ITEMS = 200000
+
+
+class CrawlJob:
+    """一个关键词的抓取任务，拥有独立的ID、状态和结果"""
+
+    def __init__(self, keyword, options=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.keyword = keyword
+        self.options = options or {}  # 抓取参数，如 max_items / max_pages
+        self.status = "queued"  # queued / running / done / error
+        self.data = []
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.events = []  # 生命周期事件，按顺序编号，供 SSE 推送
+        self.delta = None  # 增量抓取时相对上次的变化：{"new", "price_drops", "removed", "complete"}
+        self.crawl_stats = {}  # 爬虫汇报的页面就绪时间（ready_ms）、请求拦截统计（resources）和提取方式统计（extraction）
+        self.closed = False
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._listeners = []  # publish 后在锁外回调，供异步事件流（ASGI）唤醒事件循环
+
+    def publish(self, event_type, **data):
+        """记录一个生命周期事件并唤醒所有等待中的事件流"""
+        with self._changed:
+            event = {"id": len(self.events) + 1, "type": event_type, "time": time.time()}
+            event.update(data)
+            self.events.append(event)
+            if event_type in TERMINAL_EVENTS:
+                self.closed = True
+            self._changed.notify_all()
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                print(f"[JOB] 事件回调异常: {e}")
+        return event
+
+    def subscribe(self, listener):
+        """注册事件回调 listener(event)，回调在发布事件的线程中执行，不能阻塞"""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def wait_events(self, after_id, timeout=15):
+        """
+        返回编号大于 after_id 的事件，没有新事件时最多等待 timeout 秒
+        返回 (events, closed)
+        """
+        with self._changed:
+            if len(self.events) <= after_id and not self.closed:
+                self._changed.wait(timeout)
+            return self.events[after_id:], self.closed
+
+    def add_item(self, item):
+        """爬虫每提取到一个商品就追加一次，状态查询和分析可以看到实时的部分结果"""
+        with self._lock:
+            self.data.append(item)
+
+    @property
+    def running(self):
+        return self.status in ("queued", "running")
+
+    @property
+    def incremental(self):
+        return bool(self.options.get("incremental"))
+
+    def delta_counts(self):
+        if self.delta is None:
+            return None
+        return {
+            "new": len(self.delta["new"]),
+            "price_drops": len(self.delta["price_drops"]),
+            "removed": len(self.delta["removed"]),
+            "complete": self.delta["complete"]
+        }
+
+    def to_dict(self, include_data=False):
+        result = {
+            "job_id": self.id,
+            "keyword": self.keyword,
+            "options": self.options,
+            "status": self.status,
+            "running": self.running,
+            "data_count": len(self.data),
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "delta": self.delta_counts(),
+            "crawl_stats": self.crawl_stats
+        }
+        if include_data:
+            result["data"] = self.data
+            if self.delta is not None:
+                result["delta_data"] = self.delta
+        return result
+
+
+class JobScheduler:
+    """
+    抓取任务调度器：同时运行的任务数受限（每个任务占用一个浏览器标签页），其余任务排队
+    """
+
+    def __init__(self, crawl_fn, max_concurrency=2, store=None,
+                 max_jobs=MAX_RETAINED_JOBS, max_items=MAX_RETAINED_ITEMS):
+        self.crawl_fn = crawl_fn  # crawl_fn(keyword, on_item=回调, on_event=回调, **options) -> 商品列表
+        self.max_concurrency = max_concurrency
+        self.store = store  # 可选的 ListingStore，抓取结果和任务状态会持久化，重启后仍可查询
+        self.max_jobs = max_jobs
+        self.max_items = max_items
+        self.evicted = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="crawl-job")
+        self._jobs = {}
+        self._order = []
+        self._lock = threading.Lock()
+
+    def submit(self, keyword, options=None):
+        """提交一个关键词，立即返回任务"""
+        job = CrawlJob(keyword, options)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._order.append(job.id)
+            self._evict()
+        job.publish("queued", keyword=keyword)
+        self._executor.submit(self._run, job)
+        print(f"[JOBS] 任务 {job.id} 已排队，关键词: {keyword}")
+        return job
+
+    def submit_batch(self, keywords, options=None):
+        """批量提交关键词（共用同一组抓取参数）"""
+        return [self.submit(kw, options) for kw in keywords]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def latest(self):
+        """最近提交的任务"""
+        with self._lock:
+            if not self._order:
+                return None
+            return self._jobs[self._order[-1]]
+
+    def list(self):
+        with self._lock:
+            return [self._jobs[job_id] for job_id in self._order]
+
+    def stats(self):
+        jobs = self.list()
+        counts = {"queued": 0, "running": 0, "done": 0, "error": 0}
+        for job in jobs:
+            counts[job.status] = counts.get(job.status, 0) + 1
+        counts["max_concurrency"] = self.max_concurrency
+        counts["retained"] = len(jobs)
+        counts["retained_items"] = sum(len(job.data) for job in jobs)
+        counts["evicted"] = self.evicted
+        return counts
+
+    def _evict(self):
+        """
+        任务数或商品总数超出上限时，按提交顺序淘汰已结束的任务（排队和运行中的任务不淘汰）
+        调用方需持有 self._lock
+        """
+        total_items = sum(len(self._jobs[job_id].data) for job_id in self._order)
+        for job_id in list(self._order):
+            if len(self._order) <= self.max_jobs and total_items <= self.max_items:
+                break
+            job = self._jobs[job_id]
+            if job.running:
+                continue
+            self._order.remove(job_id)
+            del self._jobs[job_id]
+            total_items -= len(job.data)
+            self.evicted += 1
+            print(f"[JOBS] 任务 {job_id} 已从内存中淘汰（{len(job.data)} 条数据）")
+
+    def _store_call(self, method, *args, **kwargs):
+        """写入商品库失败只打印日志，不影响抓取任务本身"""
+        if self.store is None:
+            return
+        try:
+            getattr(self.store, method)(*args, **kwargs)
+        except Exception as e:
+            print(f"[JOBS] 写入商品库失败 ({method}): {e}")
+
+    def _run(self, job):
+        job.status = "running"
+        job.started_at = time.time()
+        print(f"[JOBS] 任务 {job.id} 开始运行，关键词: {job.keyword}")
+        self._store_call("start_crawl", job.id, job.keyword, job.options)
+        job.publish("crawl_started", keyword=job.keyword)
+
+        # 增量抓取：把该关键词以前见过的商品交给爬虫，遇到连续的已知商品即停止
+        options = {k: v for k, v in job.options.items() if k != "incremental"}
+        if job.incremental and self.store is not None:
+            try:
+                options["known"] = self.store.known_items(job.keyword)
+                print(f"[JOBS] 任务 {job.id} 增量抓取，已知商品 {len(options['known'])} 个")
+            except Exception as e:
+                print(f"[JOBS] 读取已知商品失败，改为完整抓取: {e}")
+
+        pending = []
+        saved = [0]
+        finish = {}
+        items = []  # 按收到的顺序，item_updated 事件的 index 指向其中的商品
+        stale = {}  # 已写入商品库后 reposts 又增加的商品，下次写入时一并更新
+
+        def flush():
+            batch = pending[:]
+            del pending[:]
+            self._store_call("save_items", job.id, batch, start_position=saved[0])
+            saved[0] += len(batch)
+            if stale:
+                updated = list(stale.values())
+                stale.clear()
+                self._store_call("update_reposts", updated)
+
+        def on_item(item):
+            items.append(item)
+            job.add_item(item)
+            if self.store is not None:
+                pending.append(item)
+                if len(pending) >= STORE_BATCH_SIZE:
+                    flush()
+
+        def on_event(event_type, **data):
+            if event_type == "item_updated":
+                # 爬虫合并了已发出商品的重复发布：还没写入的商品直接改字典，已写入的记下来随下一批更新
+                index = data.get("index")
+                if isinstance(index, int) and 0 <= index < len(items):
+                    item = items[index]
+                    item["reposts"] = max(item.get("reposts") or 1, data.get("reposts") or 1)
+                    if self.store is not None and index < saved[0]:
+                        stale[index] = item
+                return
+            if event_type == "crawl_finished":
+                finish.update(data)
+                job.crawl_stats = {k: data[k] for k in ("ready_ms", "resources", "extraction") if k in data}
+            job.publish(event_type, **data)
+
+        try:
+            data = self.crawl_fn(job.keyword, on_item=on_item, on_event=on_event, **options)
+            if data is not None:
+                job.data = data
+            flush()
+            if job.incremental and self.store is not None:
+                try:
+                    job.delta = self.store.crawl_delta(job.id, complete=finish.get("reason") in COMPLETE_REASONS)
+                except Exception as e:
+                    print(f"[JOBS] 计算增量变化失败: {e}")
+            job.status = "done"
+            job.finished_at = time.time()
+            self._store_call("finish_crawl", job.id, "done")
+            print(f"[JOBS] 任务 {job.id} 完成，抓取 {len(job.data)} 条数据")
+            job.publish("crawl_done", count=len(job.data), delta=job.delta_counts())
+        except Exception as e:
+            print(f"[JOBS] 任务 {job.id} 失败: {e}")
+            flush()
+            job.error = str(e)
+            job.status = "error"
+            job.finished_at = time.time()
+            self._store_call("finish_crawl", job.id, "error", error=job.error)
+            job.publish("crawl_error", error=job.error)
+        with self._lock:
+            self._evict()
@@ -0,0 +1,478 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from near_dup import MAX_DISTANCE, bands, hamming, model_tokens, nearby_buckets, price_bucket, simhash
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    key TEXT PRIMARY KEY,
+    item_id TEXT,
+    url TEXT,
+    title TEXT NOT NULL,
+    price REAL,
+    price_text TEXT,
+    want INTEGER,
+    seller TEXT,
+    location TEXT,
+    image TEXT,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    cluster_id TEXT,
+    reposts INTEGER NOT NULL DEFAULT 1,
+    seller_id TEXT,
+    published_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_listings_last_seen ON listings(last_seen);
+CREATE INDEX IF NOT EXISTS idx_listings_price ON listings(price);
+CREATE INDEX IF NOT EXISTS idx_listings_cluster ON listings(cluster_id);
+
+-- 近似重复簇：标题近似、价格相近的商品（包括不同抓取中的重复发布）归为一簇
+CREATE TABLE IF NOT EXISTS clusters (
+    id TEXT PRIMARY KEY,
+    simhash INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    size INTEGER NOT NULL DEFAULT 0,
+    reposts INTEGER NOT NULL DEFAULT 1,
+    first_seen REAL NOT NULL,
+    models TEXT
+);
+-- SimHash 分段索引（LSH）：近似重复的两条商品至少有一段相同，只需比较同段同档位的簇
+CREATE TABLE IF NOT EXISTS cluster_bands (
+    band INTEGER NOT NULL,
+    value INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    cluster_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_cluster_bands ON cluster_bands(band, value, bucket);
+
+CREATE TABLE IF NOT EXISTS crawls (
+    id TEXT PRIMARY KEY,
+    keyword TEXT NOT NULL,
+    options TEXT,
+    status TEXT NOT NULL,
+    error TEXT,
+    item_count INTEGER NOT NULL DEFAULT 0,
+    started_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_crawls_keyword ON crawls(keyword, started_at);
+
+CREATE TABLE IF NOT EXISTS crawl_items (
+    crawl_id TEXT NOT NULL,
+    listing_key TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    price REAL,
+    price_text TEXT,
+    PRIMARY KEY (crawl_id, listing_key)
+);
+CREATE INDEX IF NOT EXISTS idx_crawl_items_listing ON crawl_items(listing_key);
+"""
+
+LISTING_COLUMNS = ("key, item_id, url, title, price, price_text, want, seller, location, image, first_seen, last_seen, "
+                   "seller_id, published_at")
+SELECT_COLUMNS = LISTING_COLUMNS + ", cluster_id, reposts"
+# 旧版本数据库缺少的列，启动时补上
+MIGRATIONS = {
+    "listings": [("cluster_id", "TEXT"), ("reposts", "INTEGER NOT NULL DEFAULT 1"),
+                 ("seller_id", "TEXT"), ("published_at", "REAL")],
+    "clusters": [("models", "TEXT")],
+}
+# 近似重复索引的版本（PRAGMA user_version）：分段方式或匹配规则改变后，启动时按新规则重建 cluster_bands
+LSH_VERSION = 2
+
+
+def to_signed(value):
+    """64 位无符号整数转为 SQLite 可以保存的有符号整数"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def from_signed(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+def parse_price(price):
+    try:
+        return float(str(price).replace(",", ""))
+    except (TypeError, ValueError):
+        return None
+
+
+def item_key(item):
+    """
+    商品主键：优先使用商品ID，其次是商品链接，都没有时（文本解析的商品）用标题+价格的哈希
+    """
+    item_id = item.get("item_id")
+    url = item.get("url") or ""
+    if not item_id and url:
+        match = re.search(r"[?&]id=(\d+)", url)
+        if match:
+            item_id = match.group(1)
+    if item_id:
+        return f"id:{item_id}", str(item_id)
+    if url:
+        return f"url:{url}", None
+    raw = f"{item.get('title', '')}\x1f{item.get('price', '')}"
+    return "hash:" + hashlib.sha1(raw.encode("utf-8")).hexdigest(), None
+
+
+def row_to_item(row):
+    """数据库记录转回与爬虫输出相同格式的商品字典"""
+    return {
+        "key": row["key"],
+        "item_id": row["item_id"],
+        "title": row["title"],
+        "price": row["price_text"] if row["price_text"] is not None else row["price"],
+        "want": row["want"],
+        "seller": row["seller"] or "",
+        "location": row["location"] or "",
+        "url": row["url"] or "",
+        "image": row["image"] or "",
+        "first_seen": row["first_seen"],
+        "last_seen": row["last_seen"],
+        "cluster_id": row["cluster_id"],
+        "reposts": row["reposts"] or 1,
+        "seller_id": row["seller_id"],
+        "published_at": row["published_at"]
+    }
+
+
+class ListingStore:
+    """
+    商品存储（SQLite，WAL 模式）
+    listings 表按商品去重并记录首次/最近出现时间，crawls / crawl_items 表保存每次抓取的快照
+    每个线程使用独立连接，读写互不阻塞
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        self._migrate(conn)
+        conn.executescript(SCHEMA)
+        conn.commit()
+        self._rebuild_bands(conn)
+
+    def _migrate(self, conn):
+        for table, columns in MIGRATIONS.items():
+            existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if not existing:
+                continue
+            for name, definition in columns:
+                if name not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+    def _rebuild_bands(self, conn):
+        """旧版本的分段索引与当前的分段方式不兼容，按簇的 SimHash 重建，并补上簇代表商品的型号词"""
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= LSH_VERSION:
+            return
+        rows = conn.execute("""
+            SELECT c.id, c.simhash, c.bucket, COALESCE(
+                (SELECT title FROM listings WHERE key = c.id),
+                (SELECT title FROM listings WHERE cluster_id = c.id LIMIT 1)
+            ) FROM clusters c
+        """).fetchall()
+        with conn:
+            conn.execute("DELETE FROM cluster_bands")
+            for cluster_id, value, bucket, title in rows:
+                conn.executemany(
+                    "INSERT INTO cluster_bands (band, value, bucket, cluster_id) VALUES (?, ?, ?, ?)",
+                    [(band, band_value, bucket, cluster_id) for band, band_value in bands(from_signed(value))]
+                )
+                conn.execute("UPDATE clusters SET models = ? WHERE id = ?", (model_tokens(title), cluster_id))
+            conn.execute(f"PRAGMA user_version = {LSH_VERSION}")
+        if rows:
+            print(f"[STORE] 近似重复索引已按新规则重建，共 {len(rows)} 个簇")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def start_crawl(self, crawl_id, keyword, options=None):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO crawls (id, keyword, options, status, started_at) VALUES (?, ?, ?, 'running', ?)",
+            (crawl_id, keyword, json.dumps(options or {}, ensure_ascii=False), time.time())
+        )
+        conn.commit()
+
+    def _find_cluster(self, conn, value, bucket, models):
+        """在 LSH 索引中查找与 SimHash 近似、型号词相同的簇，没有时返回 None"""
+        checked = set()
+        buckets = nearby_buckets(bucket)
+        for band, band_value in bands(value):
+            rows = conn.execute(f"""
+                SELECT c.id, c.simhash, c.models FROM cluster_bands b JOIN clusters c ON c.id = b.cluster_id
+                WHERE b.band = ? AND b.value = ? AND b.bucket IN ({','.join('?' * len(buckets))})
+            """, [band, band_value] + buckets)
+            for cluster_id, cluster_hash, cluster_models in rows:
+                if cluster_id in checked:
+                    continue
+                checked.add(cluster_id)
+                if (cluster_models or "") == models and hamming(from_signed(cluster_hash), value) <= MAX_DISTANCE:
+                    return cluster_id
+        return None
+
+    def _assign_clusters(self, conn, items, keys, previous, now):
+        """
+        把新写入的商品归入近似重复簇，更新簇的重复发布次数，并回写到商品字典的 reposts
+        previous: 写入前各商品已有的簇 {key: cluster_id}
+        簇的重复发布次数在整批处理完后按簇回写一次，不再每个商品回写一次
+        """
+        touched = {}  # 簇编号 -> 本批属于该簇的商品
+        for item, key in zip(items, keys):
+            cluster_id = previous.get(key)
+            is_member = cluster_id is not None
+            if cluster_id is None:
+                value = simhash(item.get("title"))
+                bucket = price_bucket(item.get("price"))
+                models = model_tokens(item.get("title"))
+                cluster_id = self._find_cluster(conn, value, bucket, models)
+                if cluster_id is None:
+                    cluster_id = key
+                    conn.execute(
+                        "INSERT OR IGNORE INTO clusters (id, simhash, bucket, first_seen, models) VALUES (?, ?, ?, ?, ?)",
+                        (cluster_id, to_signed(value), bucket, now, models)
+                    )
+                    conn.executemany(
+                        "INSERT INTO cluster_bands (band, value, bucket, cluster_id) VALUES (?, ?, ?, ?)",
+                        [(band, band_value, bucket, cluster_id) for band, band_value in bands(value)]
+                    )
+                conn.execute("UPDATE listings SET cluster_id = ? WHERE key = ?", (cluster_id, key))
+            # 重复发布次数：簇内不同商品数，与爬虫在单次抓取中合并的次数取较大值
+            conn.execute(
+                "UPDATE clusters SET size = size + ?, reposts = MAX(reposts, size + ?, ?) WHERE id = ?",
+                (0 if is_member else 1, 0 if is_member else 1, item.get("reposts") or 1, cluster_id)
+            )
+            touched.setdefault(cluster_id, []).append(item)
+
+        for cluster_id, members in touched.items():
+            reposts = conn.execute("SELECT reposts FROM clusters WHERE id = ?", (cluster_id,)).fetchone()[0]
+            conn.execute("UPDATE listings SET reposts = ? WHERE cluster_id = ?", (reposts, cluster_id))
+            for item in members:
+                item["reposts"] = reposts
+
+    def update_reposts(self, items):
+        """
+        已写入的商品在爬虫中又合并了重复发布（reposts 增加）时调用：簇的重复发布次数取较大值，
+        回写到簇内所有商品和商品字典
+        """
+        conn = self._conn()
+        with conn:
+            for item in items:
+                key, _ = item_key(item)
+                row = conn.execute("SELECT cluster_id FROM listings WHERE key = ?", (key,)).fetchone()
+                if row is None or row[0] is None:
+                    continue
+                cluster_id = row[0]
+                conn.execute(
+                    "UPDATE clusters SET reposts = MAX(reposts, ?) WHERE id = ?", (item.get("reposts") or 1, cluster_id)
+                )
+                reposts = conn.execute("SELECT reposts FROM clusters WHERE id = ?", (cluster_id,)).fetchone()[0]
+                conn.execute("UPDATE listings SET reposts = ? WHERE cluster_id = ?", (reposts, cluster_id))
+                item["reposts"] = reposts
+
+    def save_items(self, crawl_id, items, start_position=0):
+        """
+        批量写入一批商品：更新 listings、归入近似重复簇，并记录到本次抓取的快照中
+        写入后商品字典的 reposts 会更新为跨抓取累计的重复发布次数
+        """
+        if not items:
+            return
+        now = time.time()
+        listing_rows = []
+        snapshot_rows = []
+        keys = []
+        for offset, item in enumerate(items):
+            key, item_id = item_key(item)
+            keys.append(key)
+            price = parse_price(item.get("price"))
+            listing_rows.append((
+                key, item_id, item.get("url") or None, item.get("title", ""), price,
+                str(item.get("price", "")), item.get("want"), item.get("seller") or None,
+                item.get("location") or None, item.get("image") or None, now, now,
+                item.get("seller_id") or None, item.get("published_at")
+            ))
+            snapshot_rows.append((crawl_id, key, start_position + offset, price, str(item.get("price", ""))))
+
+        conn = self._conn()
+        with conn:
+            previous = {}
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                previous.update(conn.execute(
+                    f"SELECT key, cluster_id FROM listings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall())
+            conn.executemany(f"""
+                INSERT INTO listings ({LISTING_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    item_id = COALESCE(excluded.item_id, item_id),
+                    url = COALESCE(excluded.url, url),
+                    title = excluded.title,
+                    price = excluded.price,
+                    price_text = excluded.price_text,
+                    want = COALESCE(excluded.want, want),
+                    seller = COALESCE(excluded.seller, seller),
+                    location = COALESCE(excluded.location, location),
+                    image = COALESCE(excluded.image, image),
+                    last_seen = excluded.last_seen,
+                    seller_id = COALESCE(excluded.seller_id, seller_id),
+                    published_at = COALESCE(excluded.published_at, published_at)
+            """, listing_rows)
+            self._assign_clusters(conn, items, keys, previous, now)
+            conn.executemany(
+                "INSERT OR IGNORE INTO crawl_items (crawl_id, listing_key, position, price, price_text) VALUES (?, ?, ?, ?, ?)",
+                snapshot_rows
+            )
+            conn.execute(
+                "UPDATE crawls SET item_count = (SELECT COUNT(*) FROM crawl_items WHERE crawl_id = ?) WHERE id = ?",
+                (crawl_id, crawl_id)
+            )
+
+    def finish_crawl(self, crawl_id, status, error=None):
+        conn = self._conn()
+        conn.execute(
+            "UPDATE crawls SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+            (status, error, time.time(), crawl_id)
+        )
+        conn.commit()
+
+    def get_crawl(self, crawl_id):
+        row = self._conn().execute("SELECT * FROM crawls WHERE id = ?", (crawl_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row["id"],
+            "keyword": row["keyword"],
+            "options": json.loads(row["options"] or "{}"),
+            "status": row["status"],
+            "running": row["status"] in ("queued", "running"),
+            "data_count": row["item_count"],
+            "error": row["error"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"]
+        }
+
+    def crawl_items(self, crawl_id, limit=None, offset=0):
+        """某次抓取的商品（按抓取顺序，价格为抓取当时的价格）"""
+        columns = [c.strip() for c in SELECT_COLUMNS.split(',') if c.strip() not in ("price", "price_text")]
+        sql = f"""
+            SELECT {', '.join('l.' + c for c in columns)}, ci.price, ci.price_text
+            FROM crawl_items ci JOIN listings l ON l.key = ci.listing_key
+            WHERE ci.crawl_id = ? ORDER BY ci.position
+        """
+        params = [crawl_id]
+        if limit:
+            sql += " LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        return [row_to_item(row) for row in self._conn().execute(sql, params)]
+
+    def known_items(self, keyword):
+        """
+        某关键词以前抓到过的商品 {商品身份: 价格}，供增量抓取判断商品是否见过
+        商品身份与爬虫一致：商品ID > 链接 > 标题
+        """
+        rows = self._conn().execute("""
+            SELECT item_id, url, title, price_text FROM listings WHERE key IN (
+                SELECT ci.listing_key FROM crawl_items ci JOIN crawls c ON c.id = ci.crawl_id WHERE c.keyword = ?
+            )
+        """, (keyword,))
+        return {row["item_id"] or row["url"] or row["title"]: row["price_text"] for row in rows}
+
+    def crawl_delta(self, crawl_id, complete=False):
+        """
+        本次抓取相对同一关键词以前的抓取的变化：
+        new 以前没出现过的商品，price_drops 比上次抓到时降价的商品（附 previous_price），
+        removed 上一次完整抓取中有、本次没有的商品（只有本次抓取完整时才能判断，否则为空）
+        """
+        crawl = self._conn().execute("SELECT keyword, started_at FROM crawls WHERE id = ?", (crawl_id,)).fetchone()
+        if crawl is None:
+            return None
+        keyword, started_at = crawl["keyword"], crawl["started_at"]
+        previous = """
+            FROM crawl_items p JOIN crawls c ON c.id = p.crawl_id
+            WHERE p.listing_key = ci.listing_key AND c.keyword = ? AND c.id != ? AND c.started_at <= ?
+            ORDER BY c.started_at DESC LIMIT 1
+        """
+        rows = self._conn().execute(f"""
+            SELECT {', '.join('l.' + c.strip() for c in SELECT_COLUMNS.split(','))},
+                   ci.price AS snapshot_price, ci.price_text AS snapshot_price_text,
+                   (SELECT p.crawl_id {previous}) AS previous_crawl,
+                   (SELECT p.price_text {previous}) AS previous_price_text,
+                   (SELECT p.price {previous}) AS previous_price
+            FROM crawl_items ci JOIN listings l ON l.key = ci.listing_key
+            WHERE ci.crawl_id = ? ORDER BY ci.position
+        """, [keyword, crawl_id, started_at] * 3 + [crawl_id]).fetchall()
+
+        new, price_drops = [], []
+        for row in rows:
+            item = row_to_item(row)
+            item["price"] = row["snapshot_price_text"]
+            if row["previous_crawl"] is None:
+                new.append(item)
+            elif (row["previous_price"] is not None and row["snapshot_price"] is not None
+                  and row["snapshot_price"] < row["previous_price"] - 0.005):
+                item["previous_price"] = row["previous_price_text"]
+                price_drops.append(item)
+
+        removed = []
+        if complete:
+            last = self._conn().execute("""
+                SELECT id FROM crawls WHERE keyword = ? AND id != ? AND status = 'done' AND started_at <= ?
+                ORDER BY started_at DESC LIMIT 1
+            """, (keyword, crawl_id, started_at)).fetchone()
+            if last is not None:
+                current = {row["key"] for row in rows}
+                removed = [item for item in self.crawl_items(last["id"]) if item["key"] not in current]
+        return {"new": new, "price_drops": price_drops, "removed": removed, "complete": complete}
+
+    def _filters(self, keyword=None, min_price=None, max_price=None, since=None):
+        where = []
+        params = []
+        if keyword:
+            where.append("""key IN (
+                SELECT ci.listing_key FROM crawl_items ci JOIN crawls c ON c.id = ci.crawl_id WHERE c.keyword = ?
+            )""")
+            params.append(keyword)
+        if min_price is not None:
+            where.append("price >= ?")
+            params.append(min_price)
+        if max_price is not None:
+            where.append("price <= ?")
+            params.append(max_price)
+        if since is not None:
+            where.append("last_seen >= ?")
+            params.append(since)
+        return (" WHERE " + " AND ".join(where)) if where else "", params
+
+    def query(self, keyword=None, min_price=None, max_price=None, since=None, limit=100, offset=0, order="recent",
+              collapse=False):
+        """
+        按关键词、价格区间、最近出现时间查询商品（分页，只取需要的行）
+        collapse: 每个近似重复簇只返回价格最低的一条（reposts 为该簇的重复发布次数）
+        """
+        where, params = self._filters(keyword, min_price, max_price, since)
+        order_by = {"recent": "last_seen DESC", "price": "price ASC", "price_desc": "price DESC"}.get(order, "last_seen DESC")
+        # SQLite 中与 MIN() 一起查询的其他列取自价格最低的那一行
+        group_by = ", MIN(price) FROM listings{} GROUP BY COALESCE(cluster_id, key)" if collapse else " FROM listings{}"
+        rows = self._conn().execute(
+            f"SELECT {SELECT_COLUMNS}{group_by.format(where)} ORDER BY {order_by} LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        )
+        return [row_to_item(row) for row in rows]
+
+    def count(self, keyword=None, min_price=None, max_price=None, since=None, collapse=False):
+        where, params = self._filters(keyword, min_price, max_price, since)
+        counted = "COUNT(DISTINCT COALESCE(cluster_id, key))" if collapse else "COUNT(*)"
+        return self._conn().execute(f"SELECT {counted} FROM listings{where}", params).fetchone()[0]
@@ -0,0 +1,193 @@
+import numpy as np
+
+# 本地评分：价格相对同组商品的位置 + 标题关键词 + 想要人数，一次向量化计算完所有商品
+BASE_SCORE = 6.5
+MIN_SCORE = 8.0
+# 稳健 z 分数低于 -UNDERVALUED_Z 视为低估（价格明显低于同组中位数）
+UNDERVALUED_Z = 1.0
+# 价格低于中位数的这个比例视为异常低价（多为配件、引流或骗局），不算低估
+MIN_PRICE_RATIO = 0.2
+PRICE_WEIGHT = 0.8
+WANT_WEIGHT = 0.2
+# 标题关键词总分的上下限，避免堆砌关键词的标题得分过高
+TITLE_SCORE_RANGE = (-4.0, 1.5)
+# 估计价格分布（中位数、四分位距）至少需要的有效价格数，更少时 z 分数没有意义
+MIN_SAMPLES = 5
+
+# 标题关键词权重（正数加分，负数减分）
+TITLE_KEYWORDS = {
+    "全新": 1.0,
+    "未拆": 1.0,
+    "未使用": 0.8,
+    "正品": 0.5,
+    "包邮": 0.5,
+    "自用": 0.5,
+    "个人": 0.5,
+    "发票": 0.5,
+    "保修": 0.5,
+    "二手": 0.2,
+    "求购": -4.0,
+    "回收": -4.0,
+    "租": -2.0,
+    "批发": -2.0,
+    "代购": -1.0,
+    "维修": -2.0,
+    "故障": -2.0,
+    "配件": -1.5,
+}
+_KEYWORDS = np.array(list(TITLE_KEYWORDS.keys()))
+_WEIGHTS = np.array(list(TITLE_KEYWORDS.values()))
+
+
+def parse_prices(listings):
+    """商品价格转为浮点数组，无法解析的为 NaN"""
+    def parse(item):
+        try:
+            return float(str(item.get("price", "")).replace(",", ""))
+        except (TypeError, ValueError):
+            return np.nan
+    return np.fromiter((parse(item) for item in listings), dtype=float, count=len(listings))
+
+
+def want_of(item):
+    want = item.get("want")
+    return float(want) if isinstance(want, (int, float)) else 0.0
+
+
+def group_price_stats(prices, groups):
+    """
+    按分组（如关键词）计算价格中位数和四分位距，返回与商品一一对应的 (median, iqr) 数组
+    groups 为 None 时所有商品同一组
+    """
+    n = len(prices)
+    median = np.full(n, np.nan)
+    iqr = np.full(n, np.nan)
+    if groups is None:
+        labels = np.zeros(n, dtype=int)
+    else:
+        _, labels = np.unique(np.asarray(groups, dtype=str), return_inverse=True)
+    for label in np.unique(labels):
+        mask = labels == label
+        valid = prices[mask]
+        valid = valid[~np.isnan(valid) & (valid > 0)]
+        if valid.size == 0:
+            continue
+        q1, q2, q3 = np.percentile(valid, [25, 50, 75])
+        median[mask] = q2
+        iqr[mask] = q3 - q1
+    return median, iqr
+
+
+def reference_price_stats(n, reference):
+    """用参考商品（如商品库中同一关键词的商品）的价格计算中位数和四分位距，n 个商品共用"""
+    prices = parse_prices(reference)
+    valid = prices[~np.isnan(prices) & (prices > 0)]
+    if valid.size == 0:
+        return np.full(n, np.nan), np.full(n, np.nan)
+    q1, q2, q3 = np.percentile(valid, [25, 50, 75])
+    return np.full(n, q2), np.full(n, q3 - q1)
+
+
+def valid_price_count(listings):
+    prices = parse_prices(listings)
+    return int(np.count_nonzero(~np.isnan(prices) & (prices > 0)))
+
+
+def title_scores(titles):
+    """标题关键词得分：商品 × 关键词的命中矩阵乘以权重"""
+    if len(titles) == 0:
+        return np.zeros(0)
+    lowered = np.char.lower(np.asarray(titles, dtype=str))
+    hits = np.char.find(lowered[:, None], _KEYWORDS[None, :]) >= 0
+    return hits.astype(float) @ _WEIGHTS
+
+
+def score_listings(listings, groups=None, reference=None):
+    """
+    为一批商品打分，返回各项指标的数组（与 listings 顺序一致）：
+    price、median、iqr、z（稳健 z 分数，负数表示比中位数便宜）、undervalued、outlier_low、title、score
+    reference: 可选的参考商品列表，提供时价格分布按参考商品计算（忽略 groups），用于给少量商品打分
+    """
+    n = len(listings)
+    prices = parse_prices(listings)
+    if reference is not None:
+        median, iqr = reference_price_stats(n, reference)
+    else:
+        median, iqr = group_price_stats(prices, groups)
+
+    # 稳健 z 分数：用 IQR/1.349 估计标准差；IQR 为 0 时退回到中位数的 10%
+    scale = iqr / 1.349
+    scale = np.where((scale > 0) & ~np.isnan(scale), scale, median * 0.1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = (prices - median) / scale
+    z = np.where(np.isfinite(z), z, 0.0)
+
+    valid_price = ~np.isnan(prices) & (prices > 0)
+    outlier_low = valid_price & (prices < median * MIN_PRICE_RATIO)
+    undervalued = valid_price & ~outlier_low & (z <= -UNDERVALUED_Z)
+
+    titles = [str(item.get("title", "")) for item in listings]
+    title = np.clip(title_scores(titles), *TITLE_SCORE_RANGE)
+    want = np.fromiter((want_of(item) for item in listings), dtype=float, count=n)
+
+    score = BASE_SCORE + np.clip(-z, -2.0, 3.0) * PRICE_WEIGHT + title + np.log1p(want) * WANT_WEIGHT
+    # 价格无法解析或异常低价的商品不参与推荐
+    score = np.where(valid_price & ~outlier_low, score, 0.0)
+    score = np.clip(score, 0.0, 10.0)
+
+    return {
+        "price": prices,
+        "median": median,
+        "iqr": iqr,
+        "z": z,
+        "undervalued": undervalued,
+        "outlier_low": outlier_low,
+        "title": title,
+        "score": score
+    }
+
+
+def rank_indices(scores, top_n=None, min_score=None):
+    """按评分从高到低返回商品下标，可选只保留评分达到 min_score 的前 top_n 个"""
+    order = np.argsort(-scores, kind="stable")
+    if min_score is not None:
+        order = order[scores[order] >= min_score]
+    if top_n:
+        order = order[:top_n]
+    return order
+
+
+def build_reason(stats, i):
+    reasons = []
+    median = stats["median"][i]
+    if stats["undervalued"][i] and median > 0:
+        reasons.append(f"价格比同类中位数 ¥{median:.0f} 低 {(1 - stats['price'][i] / median) * 100:.0f}%")
+    elif stats["z"][i] < 0:
+        reasons.append("价格低于同类中位数")
+    if stats["title"][i] > 0:
+        reasons.append("标题显示成色或交易条件较好")
+    return "，".join(reasons) or "价格合理，商品描述清晰"
+
+
+def rank_listings(listings, top_n=10, min_score=MIN_SCORE, groups=None, reference=None):
+    """
+    本地推荐：返回评分最高的商品，格式与 Gemini 分析结果相同（title / price / reason / score），
+    另附 undervalued 和 z 供前端展示；reference 见 score_listings
+    """
+    if not listings:
+        return []
+    stats = score_listings(listings, groups, reference)
+    results = []
+    for i in rank_indices(stats["score"], top_n, min_score):
+        item = listings[i]
+        results.append({
+            "title": item.get("title", ""),
+            "price": str(item.get("price", "")),
+            "reason": build_reason(stats, i),
+            "score": round(float(stats["score"][i]), 1),
+            "undervalued": bool(stats["undervalued"][i]),
+            "z": round(float(stats["z"][i]), 2)
+        })
+        if item.get("key"):
+            results[-1]["key"] = item["key"]
+    return results
@@ -0,0 +1,114 @@
+import os
+
+import numpy as np
+
+from local_scoring import parse_prices, score_listings, rank_indices
+from near_dup import NearDupIndex
+
+# 发给模型之前的本地预筛：价格离群、求购/商家/配件帖、近似重复，最后按本地评分保留前 K 个候选
+DEFAULT_TOP_K = int(os.environ.get("PREFILTER_TOP_K", "200"))
+# 价格带：[Q1 - k*IQR, Q3 + k*IQR] 之外视为离群（k 取得较宽，明显低于中位数的捡漏商品仍会保留）
+DEFAULT_IQR_FACTOR = float(os.environ.get("PREFILTER_IQR_FACTOR", "3"))
+# 商品数少于这个数时不做价格带过滤（样本太少，四分位数不可靠）
+MIN_SAMPLES_FOR_BAND = 8
+# 同一商品（近似标题、相近价格）重复发布达到这个次数视为商家
+DEALER_REPOSTS = int(os.environ.get("PREFILTER_DEALER_REPOSTS", "3"))
+
+WANTED_KEYWORDS = ["求购", "收购", "回收", "高价收", "求一个", "想收", "蹲一个"]
+# 不含“支持验货”等个人卖家也常写的词，避免误删正常商品
+DEALER_KEYWORDS = ["商家", "批发", "工作室", "实体店", "店铺", "量大从优", "一件代发", "招代理", "代理价",
+                   "多台", "现货秒发", "专业回收", "租赁", "出租"]
+ACCESSORY_KEYWORDS = ["手机壳", "保护壳", "钢化膜", "贴膜", "保护套", "数据线", "充电器", "充电头", "包装盒",
+                      "空盒", "说明书", "配件", "模型机", "展示机"]
+
+
+def classify_title(title, keyword=""):
+    """
+    按标题关键词判断商品类别，返回 wanted / dealer / accessory，正常商品返回 None
+    搜索词本身就是配件（如“手机壳”）时不过滤配件
+    """
+    text = str(title or "")
+    if any(kw in text for kw in WANTED_KEYWORDS):
+        return "wanted"
+    if any(kw in text for kw in DEALER_KEYWORDS):
+        return "dealer"
+    if any(kw in text for kw in ACCESSORY_KEYWORDS) and not any(kw in (keyword or "") for kw in ACCESSORY_KEYWORDS):
+        return "accessory"
+    return None
+
+
+def price_band(prices, factor=DEFAULT_IQR_FACTOR):
+    """有效价格的 (下限, 上限)，样本太少时返回 None"""
+    valid = prices[~np.isnan(prices) & (prices > 0)]
+    if valid.size < MIN_SAMPLES_FOR_BAND:
+        return None
+    q1, q3 = np.percentile(valid, [25, 75])
+    iqr = q3 - q1
+    return max(0.0, q1 - factor * iqr), q3 + factor * iqr
+
+
+def prefilter(listings, keyword="", top_k=DEFAULT_TOP_K, iqr_factor=DEFAULT_IQR_FACTOR):
+    """
+    预筛商品，返回 (候选商品, 统计信息)
+    依次去掉：无法解析价格或价格带外的商品、求购/商家/配件帖、重复发布次数达到 DEALER_REPOSTS 的商品、
+    标题近似重复（SimHash，保留价格最低的一条），剩余的按本地评分保留前 top_k 个
+    """
+    stats = {
+        "input": len(listings),
+        "invalid_price": 0,
+        "price_outlier": 0,
+        "wanted": 0,
+        "dealer": 0,
+        "accessory": 0,
+        "duplicate": 0,
+        "over_top_k": 0,
+        "output": 0
+    }
+    if not listings:
+        return [], stats
+
+    prices = parse_prices(listings)
+    keep = ~np.isnan(prices) & (prices > 0)
+    stats["invalid_price"] = int((~keep).sum())
+
+    band = price_band(prices, iqr_factor)
+    if band is not None:
+        with np.errstate(invalid="ignore"):
+            in_band = (prices >= band[0]) & (prices <= band[1])
+        stats["price_outlier"] = int((keep & ~in_band).sum())
+        keep &= in_band
+        stats["price_band"] = [round(float(band[0]), 2), round(float(band[1]), 2)]
+
+    dedup = NearDupIndex()
+    best_in_cluster = {}
+    for i in np.flatnonzero(keep):
+        item = listings[i]
+        category = classify_title(item.get("title"), keyword)
+        if category is None and (item.get("reposts") or 1) >= DEALER_REPOSTS:
+            category = "dealer"
+        if category is not None:
+            stats[category] += 1
+            keep[i] = False
+            continue
+        cluster_id, is_new = dedup.add(item)
+        if is_new:
+            best_in_cluster[cluster_id] = i
+            continue
+        stats["duplicate"] += 1
+        previous = best_in_cluster[cluster_id]
+        if prices[i] < prices[previous]:
+            keep[previous] = False
+            best_in_cluster[cluster_id] = i
+        else:
+            keep[i] = False
+
+    indices = np.flatnonzero(keep)
+    candidates = [listings[i] for i in indices]
+    if top_k and len(candidates) > top_k:
+        scores = score_listings(candidates)["score"]
+        order = np.sort(rank_indices(scores, top_k))  # 保持原来的先后顺序
+        stats["over_top_k"] = len(candidates) - len(order)
+        candidates = [candidates[i] for i in order]
+
+    stats["output"] = len(candidates)
+    return candidates, stats
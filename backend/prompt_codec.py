@@ -0,0 +1,91 @@
+import re
+
+# 发给模型的商品表：每行一个商品，列之间用制表符分隔，第一列是分片内的行号
+# 相比逐条 JSON，不再重复字段名，也不包含对判断无用的字段（desc 固定为“闲鱼商品”，链接和图片模型用不上）
+COLUMNS = ("price", "want", "reposts", "seller", "location", "title")
+# 表头中的列名（尽量短，模型按表头理解各列含义）
+HEADERS = {
+    "price": "价格",
+    "want": "想要",
+    "reposts": "重复发布",
+    "seller": "卖家",
+    "location": "地区",
+    "title": "标题"
+}
+# 模型只返回行号、理由和评分，标题和价格从原商品取，不需要模型复述
+RESPONSE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "id": {"type": "INTEGER"},
+            "reason": {"type": "STRING"},
+            "score": {"type": "NUMBER"}
+        },
+        "required": ["id", "reason", "score"]
+    }
+}
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def cell(value):
+    """单元格内容：去掉制表符和换行，空值为空字符串"""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return _WHITESPACE.sub(" ", str(value)).strip()
+
+
+def columns_of(chunk):
+    """分片中至少有一个商品有值的列（整列为空的不发送）"""
+    columns = []
+    for column in COLUMNS:
+        if column == "reposts":
+            if any((item.get("reposts") or 1) > 1 for item in chunk):
+                columns.append(column)
+        elif any(cell(item.get(column)) for item in chunk):
+            columns.append(column)
+    return columns
+
+
+def encode_row(item, index, columns=COLUMNS):
+    return "\t".join([str(index + 1)] + [cell(item.get(column)) for column in columns])
+
+
+def encode_batch(chunk):
+    """把一个分片编码为带表头的制表符分隔表格，行号从 1 开始"""
+    columns = columns_of(chunk)
+    lines = ["\t".join(["id"] + [HEADERS[column] for column in columns])]
+    lines.extend(encode_row(item, i, columns) for i, item in enumerate(chunk))
+    return "\n".join(lines)
+
+
+def decode_results(chunk, results):
+    """
+    把模型按行号返回的推荐对应回分片中的商品，返回 {分片内下标: 推荐内容}
+    推荐内容的 title / price 取自原商品（与商品库中的记录完全一致），原商品带 key 时一并带上（合并时按 key 区分商品），
+    行号无效的推荐丢弃
+    """
+    matched = {}
+    for result in results:
+        if not isinstance(result, dict):
+            continue
+        try:
+            index = int(result.get("id")) - 1
+        except (TypeError, ValueError):
+            continue
+        if not 0 <= index < len(chunk):
+            continue
+        item = chunk[index]
+        matched[index] = {
+            "title": item.get("title", ""),
+            "price": str(item.get("price", "")),
+            "url": item.get("url") or "",
+            "reason": result.get("reason", ""),
+            "score": result.get("score", 0)
+        }
+        if item.get("key"):
+            matched[index]["key"] = item["key"]
+    return matched
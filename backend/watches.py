@@ -0,0 +1,299 @@
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# 监控任务最短间隔（秒），防止把闲鱼请求得太频繁
+MIN_INTERVAL = 300
+# 每次运行时间随机浮动的比例（0.1 = 间隔的 ±10%），避免多个监控同时触发
+DEFAULT_JITTER = 0.1
+WEBHOOK_TIMEOUT = 5
+# 等待抓取任务结束的上限（秒）
+RUN_TIMEOUT = 1800
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS watches (
+    id TEXT PRIMARY KEY,
+    keyword TEXT NOT NULL,
+    interval INTEGER NOT NULL,
+    options TEXT,
+    max_price REAL,
+    min_score REAL,
+    webhook TEXT,
+    enabled INTEGER NOT NULL DEFAULT 1,
+    created_at REAL NOT NULL,
+    last_run REAL,
+    next_run REAL NOT NULL,
+    last_job_id TEXT,
+    last_error TEXT
+);
+CREATE TABLE IF NOT EXISTS alerts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    watch_id TEXT NOT NULL,
+    keyword TEXT NOT NULL,
+    type TEXT NOT NULL,
+    item TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_alerts_created ON alerts(created_at);
+"""
+
+WATCH_COLUMNS = ("id", "keyword", "interval", "options", "max_price", "min_score", "webhook",
+                 "enabled", "created_at", "last_run", "next_run", "last_job_id", "last_error")
+
+
+def parse_interval(value):
+    """解析运行间隔：秒数，或 30m / 2h / 1d 这样的写法"""
+    if isinstance(value, (int, float)):
+        seconds = int(value)
+    else:
+        match = re.fullmatch(r"\s*(\d+)\s*([smhd]?)\s*", str(value or ""))
+        if not match:
+            raise ValueError("interval 格式错误，应为秒数或 30m / 2h / 1d")
+        seconds = int(match.group(1)) * {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}[match.group(2)]
+    if seconds < MIN_INTERVAL:
+        raise ValueError(f"interval 不能小于 {MIN_INTERVAL} 秒")
+    return seconds
+
+
+def price_value(item):
+    try:
+        return float(item.get("price"))
+    except (TypeError, ValueError):
+        return None
+
+
+class WatchScheduler:
+    """
+    关键词监控调度器：按间隔（带随机抖动）定时提交增量抓取任务，同时运行的监控数受限
+    每次运行与上次结果对比，新出现或降价且低于目标价的商品、分析评分达到阈值的商品会触发提醒
+    提醒写入数据库，并推送到 webhook（未配置时只打印日志）
+    """
+
+    def __init__(self, path, job_scheduler, analyze_fn=None, max_concurrency=1,
+                 jitter=DEFAULT_JITTER, webhook=None):
+        self.path = path
+        self.job_scheduler = job_scheduler
+        # analyze_fn(listings, keyword=, api_key=) -> 带 score 的推荐列表，用于评分提醒
+        self.analyze_fn = analyze_fn
+        self.max_concurrency = max_concurrency
+        self.jitter = jitter
+        self.webhook = webhook  # 默认 webhook，监控未单独配置时使用
+        self._lock = threading.Lock()
+        self._running = set()
+        # 评分提醒使用的 Gemini API Key 只保存在内存中（{监控编号: Key}），不写入数据库，重启后需要重新注册监控
+        self._api_keys = {}
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="watch")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="watch-scheduler", daemon=True)
+            self._thread.start()
+            print(f"[WATCH] 监控调度器已启动，最多同时运行 {self.max_concurrency} 个监控")
+
+    def shutdown(self):
+        self._stopped.set()
+        self._wake.set()
+        self._executor.shutdown(wait=False)
+
+    def _next_run(self, interval, now=None):
+        offset = random.uniform(-self.jitter, self.jitter) * interval
+        return (now or time.time()) + interval + offset
+
+    def add(self, keyword, interval, options=None, max_price=None, min_score=None, webhook=None, api_key=None):
+        """
+        注册一个监控，第一次运行安排在一小段随机延迟之后
+        api_key 是评分提醒使用的 Gemini API Key（只保存在内存中），不提供时或服务重启后评分提醒使用本地评分
+        """
+        watch_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO watches ({', '.join(WATCH_COLUMNS)}) VALUES ({', '.join('?' * len(WATCH_COLUMNS))})",
+                (watch_id, keyword, interval, json.dumps(options or {}, ensure_ascii=False), max_price,
+                 min_score, webhook, 1, now, None, now + random.uniform(0, 30), None, None)
+            )
+            self._conn.commit()
+            if api_key:
+                self._api_keys[watch_id] = api_key
+        self._wake.set()
+        print(f"[WATCH] 新增监控 {watch_id}，关键词: {keyword}，间隔 {interval} 秒")
+        return self.get(watch_id)
+
+    def remove(self, watch_id):
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM watches WHERE id = ?", (watch_id,))
+            self._conn.commit()
+            self._api_keys.pop(watch_id, None)
+        return cur.rowcount > 0
+
+    def get(self, watch_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM watches WHERE id = ?", (watch_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM watches ORDER BY created_at").fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def _to_dict(self, row, include_key=False):
+        """include_key 为 False 时 API Key 只显示后 4 位（用于接口返回）"""
+        watch = dict(row)
+        api_key = self._api_keys.get(watch["id"])
+        watch["api_key"] = api_key if include_key or not api_key else f"...{api_key[-4:]}"
+        watch["options"] = json.loads(watch["options"] or "{}")
+        watch["enabled"] = bool(watch["enabled"])
+        watch["running"] = watch["id"] in self._running
+        return watch
+
+    def run_now(self, watch_id):
+        """立即运行一次（不影响之后的定时安排）"""
+        with self._lock:
+            cur = self._conn.execute("UPDATE watches SET next_run = ? WHERE id = ?", (time.time(), watch_id))
+            self._conn.commit()
+        self._wake.set()
+        return cur.rowcount > 0
+
+    def alerts(self, since_id=0, limit=100):
+        """
+        since_id 大于 0 时从该编号之后按时间顺序返回（最早的在前，超过 limit 的下次用最后一条的编号继续取），
+        否则返回最近的 limit 条（最新的在前）
+        """
+        with self._lock:
+            if since_id:
+                rows = self._conn.execute(
+                    "SELECT * FROM alerts WHERE id > ? ORDER BY id ASC LIMIT ?", (since_id, limit)
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT * FROM alerts ORDER BY id DESC LIMIT ?", (limit,)
+                ).fetchall()
+        return [dict(row, item=json.loads(row["item"])) for row in rows]
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            now = time.time()
+            with self._lock:
+                due = self._conn.execute(
+                    "SELECT * FROM watches WHERE enabled = 1 AND next_run <= ? ORDER BY next_run", (now,)
+                ).fetchall()
+            for row in due:
+                with self._lock:
+                    # 并发上限：正在运行的监控已满时留到下一轮
+                    if row["id"] in self._running or len(self._running) >= self.max_concurrency:
+                        continue
+                    self._running.add(row["id"])
+                    self._conn.execute(
+                        "UPDATE watches SET next_run = ? WHERE id = ?",
+                        (self._next_run(row["interval"], now), row["id"])
+                    )
+                    self._conn.commit()
+                self._executor.submit(self._run, self._to_dict(row, include_key=True))
+            self._wake.wait(self._wait_time())
+            self._wake.clear()
+
+    def _wait_time(self):
+        """
+        下一轮之前等待的秒数：并发已满时一直等到有监控运行结束（_run 结束时设置 _wake），
+        否则等到下一个未在运行的监控到期（最多 30 秒）；返回 None 表示不设超时
+        """
+        with self._lock:
+            if len(self._running) >= self.max_concurrency:
+                return None
+            running = list(self._running)
+            next_due = self._conn.execute(
+                f"SELECT MIN(next_run) FROM watches WHERE enabled = 1 AND id NOT IN ({', '.join('?' * len(running))})",
+                running
+            ).fetchone()[0]
+        return 30 if next_due is None else min(30, max(1, next_due - time.time()))
+
+    def _run(self, watch):
+        print(f"[WATCH] 运行监控 {watch['id']}，关键词: {watch['keyword']}")
+        error = None
+        job = None
+        try:
+            options = dict(watch["options"])
+            options["incremental"] = True
+            job = self.job_scheduler.submit(watch["keyword"], options)
+            deadline = time.time() + RUN_TIMEOUT
+            after = 0
+            while job.running and time.time() < deadline:
+                events, _ = job.wait_events(after, timeout=15)
+                after += len(events)
+            if job.running:
+                raise Exception("抓取任务超时")
+            if job.status == "error":
+                raise Exception(job.error)
+            self._check(watch, job)
+        except Exception as e:
+            error = str(e)
+            print(f"[WATCH] 监控 {watch['id']} 运行失败: {error}")
+        finally:
+            with self._lock:
+                self._running.discard(watch["id"])
+                self._conn.execute(
+                    "UPDATE watches SET last_run = ?, last_job_id = ?, last_error = ? WHERE id = ?",
+                    (time.time(), job.id if job else None, error, watch["id"])
+                )
+                self._conn.commit()
+            self._wake.set()
+
+    def _check(self, watch, job):
+        """对比上次结果，找出需要提醒的商品"""
+        delta = job.delta or {"new": list(job.data), "price_drops": []}
+        changed = delta["new"] + delta["price_drops"]
+        print(f"[WATCH] 监控 {watch['id']}：新商品 {len(delta['new'])} 个，降价 {len(delta['price_drops'])} 个")
+
+        if watch["max_price"] is not None:
+            for item in changed:
+                price = price_value(item)
+                if price is not None and price <= watch["max_price"]:
+                    self._alert(watch, "price_drop" if "previous_price" in item else "below_price", item)
+
+        if watch["min_score"] is not None and changed and self.analyze_fn is not None:
+            for result in self.analyze_fn(changed, keyword=watch["keyword"], api_key=watch.get("api_key")):
+                try:
+                    score = float(result.get("score", 0))
+                except (TypeError, ValueError):
+                    continue
+                if score >= watch["min_score"]:
+                    self._alert(watch, "high_score", result)
+
+    def _alert(self, watch, alert_type, item):
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO alerts (watch_id, keyword, type, item, created_at) VALUES (?, ?, ?, ?, ?)",
+                (watch["id"], watch["keyword"], alert_type, json.dumps(item, ensure_ascii=False), now)
+            )
+            self._conn.commit()
+        alert = {"id": cur.lastrowid, "watch_id": watch["id"], "keyword": watch["keyword"],
+                 "type": alert_type, "item": item, "created_at": now}
+        print(f"[ALERT] {watch['keyword']} [{alert_type}] {item.get('title', '')[:30]} - ¥{item.get('price')}")
+
+        webhook = watch["webhook"] or self.webhook
+        if webhook:
+            try:
+                # 后端进程设置了访问 Gemini 用的全局代理，推送到本地 webhook 时不使用
+                with requests.Session() as session:
+                    session.trust_env = False
+                    session.post(webhook, json=alert, timeout=WEBHOOK_TIMEOUT)
+            except Exception as e:
+                print(f"[ALERT] webhook 推送失败: {e}")
+        return alert
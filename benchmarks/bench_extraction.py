@@ -0,0 +1,222 @@
+# 提取性能基准：在录制的搜索页面上离线运行爬虫的提取流程（crawl_keyword，与 run_crawler 相同），
+# 报告每秒提取商品数、每个商品的浏览器往返次数、各阶段耗时，以及与基准结果相比的准确率
+#
+# 用法：python benchmarks/bench_extraction.py [--modes auto,dom] [--repeat 3] [--output result.json] [--min-recall 0.95]
+# 样本用 python benchmarks/replay.py record <关键词> 录制；--min-recall 未达到时以非 0 退出码结束（供 CI 使用），
+# 只判定校对过（verified 为 true）的基准结果。仓库中不附带样本（录制结果含真实商品数据），样本目录为空时
+# 打印提示并以 0 退出，CI 中可以直接运行；需要样本必须存在时加 --require-fixtures
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# 使用空的登录状态，登录检测的开销不受本机是否登录影响
+os.environ.setdefault("CRAWLER_STATE_FILE", os.path.join(tempfile.gettempdir(), "bench_browser_state.json"))
+
+from replay import FIXTURES_DIR, HarServer, ProtocolCounter, fixture_paths
+
+# Playwright 和爬虫模块在确认有样本后才导入，没有样本时不需要安装 Playwright 也能直接跳过
+
+
+def load_golden(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def accuracy(results, golden_items):
+    """
+    与基准结果比较：recall = 基准中被提取到的比例，precision = 提取结果中属于基准的比例，
+    price / title = 匹配上的商品中价格、标题一致的比例
+    """
+    from dom_extract import item_identity, same_price
+
+    expected = {item_identity(item): item for item in golden_items}
+    extracted = {item_identity(item): item for item in results}
+    matched = [key for key in extracted if key in expected]
+    prices = sum(1 for key in matched if same_price(extracted[key].get("price"), expected[key].get("price")))
+    titles = sum(1 for key in matched if extracted[key].get("title", "").strip() == expected[key].get("title", "").strip())
+    return {
+        "recall": len(matched) / len(expected) if expected else 1.0,
+        "precision": len(matched) / len(extracted) if extracted else 0.0,
+        "price": prices / len(matched) if matched else 0.0,
+        "title": titles / len(matched) if matched else 0.0
+    }
+
+
+class PhaseTimer:
+    """
+    用爬虫的生命周期事件划分阶段：load = 导航到首页商品就绪（含登录检测），
+    pages = 每页的提取耗时（含翻页等待），finish = 最后一页之后的收尾
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.marks = []
+        self.finished = {}
+
+    def on_event(self, event_type, **data):
+        if event_type in ("page_loaded", "page_done"):
+            self.marks.append((event_type, time.time()))
+        elif event_type == "crawl_finished":
+            self.finished = data
+            self.marks.append((event_type, time.time()))
+
+    def phases(self, ended):
+        phases = {"ready_ms": self.finished.get("ready_ms"), "load_ms": None, "pages_ms": [], "finish_ms": None}
+        last = self.started
+        for event_type, at in self.marks:
+            elapsed = round((at - last) * 1000, 1)
+            if event_type == "page_loaded":
+                phases["load_ms"] = elapsed
+            elif event_type == "page_done":
+                phases["pages_ms"].append(elapsed)
+            else:
+                phases["finish_ms"] = elapsed
+            last = at
+        if phases["load_ms"] is not None and phases["ready_ms"] is not None:
+            phases["login_check_ms"] = round(phases["load_ms"] - phases["ready_ms"], 1)
+        phases["total_ms"] = round((ended - self.started) * 1000, 1)
+        return phases
+
+
+def run_once(browser, counter, har_path, golden, extraction, resource_policy):
+    """回放一个样本并运行一次提取，返回本次的测量结果"""
+    from crawler_enhanced import new_context, crawl_keyword
+    from resource_policy import ResourceBlocker
+
+    server = HarServer(har_path)
+    context = new_context(browser)
+    server.attach(context)
+    blocker = ResourceBlocker(context)
+    blocker.use(resource_policy)
+    page = context.new_page()
+    timer = PhaseTimer()
+    calls_before = counter.calls
+    try:
+        results, _ = crawl_keyword(
+            page, context, golden["keyword"], max_items=golden["max_items"], max_pages=golden["max_pages"],
+            on_event=timer.on_event, interactive=False, blocker=blocker, extraction=extraction
+        )
+    finally:
+        ended = time.time()
+        calls = counter.calls - calls_before
+        context.close()
+    phases = timer.phases(ended)
+    count = len(results)
+    return {
+        "items": count,
+        "items_per_sec": round(count / (phases["total_ms"] / 1000), 2) if phases["total_ms"] else 0.0,
+        "protocol_calls": calls if counter.available else None,
+        "calls_per_item": round(calls / count, 2) if counter.available and count else None,
+        "phases": phases,
+        "stop_reason": timer.finished.get("reason"),
+        "replay": server.stats(),
+        "accuracy": accuracy(results, golden["items"])
+    }
+
+
+def summarize(runs):
+    """多次运行取中位数（准确率各次相同，取第一次）"""
+    def median(values):
+        values = [v for v in values if v is not None]
+        return round(statistics.median(values), 2) if values else None
+
+    return {
+        "runs": len(runs),
+        "items": runs[0]["items"],
+        "items_per_sec": median([r["items_per_sec"] for r in runs]),
+        "calls_per_item": median([r["calls_per_item"] for r in runs]),
+        "total_ms": median([r["phases"]["total_ms"] for r in runs]),
+        "ready_ms": median([r["phases"]["ready_ms"] for r in runs]),
+        "login_check_ms": median([r["phases"].get("login_check_ms") for r in runs]),
+        "extract_ms": median([sum(r["phases"]["pages_ms"]) for r in runs]),
+        "accuracy": runs[0]["accuracy"],
+        "replay_misses": max(r["replay"]["misses"] for r in runs),
+        "detail": runs
+    }
+
+
+def print_table(report):
+    header = f"{'样本':<16}{'方式':<6}{'商品':>6}{'商品/秒':>10}{'往返/商品':>10}{'总耗时ms':>10}{'就绪ms':>9}{'提取ms':>9}{'召回':>7}{'价格':>7}"
+    print(header)
+    print("-" * len(header))
+    for row in report:
+        s = row["summary"]
+        print(f"{row['fixture']:<16}{row['extraction']:<6}{s['items']:>6}{s['items_per_sec'] or 0:>10}"
+              f"{s['calls_per_item'] if s['calls_per_item'] is not None else '-':>10}{s['total_ms'] or 0:>10}"
+              f"{s['ready_ms'] or 0:>9}{s['extract_ms'] or 0:>9}"
+              f"{s['accuracy']['recall']:>7.1%}{s['accuracy']['price']:>7.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线回放录制的搜索页面，测量爬虫提取性能")
+    parser.add_argument("--fixtures", default=FIXTURES_DIR, help="样本目录")
+    parser.add_argument("--only", help="只运行这些样本（逗号分隔）")
+    parser.add_argument("--modes", default="auto,dom", help="提取方式（逗号分隔，可选: auto, json, dom）")
+    parser.add_argument("--repeat", type=int, default=3, help="每个样本每种方式运行几次")
+    parser.add_argument("--resource-policy", default="lean", help="请求拦截策略")
+    parser.add_argument("--headful", action="store_true", help="显示浏览器窗口（调试用）")
+    parser.add_argument("--output", help="结果另存为 JSON（用于 CI 中跟踪性能变化）")
+    parser.add_argument("--min-recall", type=float, help="任一校对过的样本召回率低于该值时以非 0 退出码结束")
+    parser.add_argument("--require-fixtures", action="store_true", help="没有样本时以非 0 退出码结束（默认跳过）")
+    args = parser.parse_args()
+
+    names = sorted(os.path.basename(path)[:-len(".har")] for path in glob.glob(os.path.join(args.fixtures, "*.har")))
+    if args.only:
+        names = [name for name in names if name in args.only.split(",")]
+    if not names:
+        print(f"[基准] {args.fixtures} 中没有样本，跳过（先运行 python benchmarks/replay.py record <关键词> 录制）")
+        return 1 if args.require_fixtures else 0
+
+    from playwright.sync_api import sync_playwright
+    from crawler_enhanced import launch_browser
+    from json_capture import EXTRACTION_MODES
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    for mode in modes:
+        if mode not in EXTRACTION_MODES:
+            parser.error(f"未知的提取方式: {mode}")
+
+    counter = ProtocolCounter()
+    if not counter.available:
+        print("[基准] 当前 Playwright 版本无法统计浏览器往返次数")
+
+    report = []
+    with sync_playwright() as p:
+        browser = launch_browser(p, headless=not args.headful)
+        for name in names:
+            har_path, golden_path = fixture_paths(name, args.fixtures)
+            golden = load_golden(golden_path)
+            for mode in modes:
+                runs = [run_once(browser, counter, har_path, golden, mode, args.resource_policy)
+                        for _ in range(max(1, args.repeat))]
+                report.append({"fixture": name, "extraction": mode, "verified": bool(golden.get("verified")),
+                               "summary": summarize(runs)})
+        browser.close()
+
+    print()
+    print_table(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"generated_at": time.strftime("%Y-%m-%d %H:%M:%S"), "results": report}, f,
+                      ensure_ascii=False, indent=2)
+        print(f"\n[基准] 结果已保存到 {args.output}")
+
+    if args.min_recall is not None:
+        for name in sorted({row["fixture"] for row in report if not row["verified"]}):
+            print(f"[基准] {name} 的基准结果未校对（verified 不是 true），召回率只报告不判定")
+        failed = [row for row in report
+                  if row["verified"] and row["summary"]["accuracy"]["recall"] < args.min_recall]
+        for row in failed:
+            print(f"[基准] {row['fixture']} ({row['extraction']}) 召回率 {row['summary']['accuracy']['recall']:.1%} "
+                  f"低于 {args.min_recall:.0%}")
+        if failed:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
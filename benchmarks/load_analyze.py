@@ -0,0 +1,215 @@
+# 端到端压测：并发执行 /api/search → 等待抓取完成 → /api/analyze 的完整流程，
+# 报告各阶段延迟的 p50/p95/p99、吞吐量和 Gemini 重试次数，用于确定并发数、验证限流重试逻辑
+#
+# 离线运行（不需要网络、API Key 和代理）：
+#   1. python benchmarks/mock_gemini.py --port 8090 --error-rate 0.05
+#   2. GEMINI_BASE_URL=http://127.0.0.1:8090 CRAWLER_MODE=fixture ANALYSIS_CACHE_TTL=0 python backend/app.py
+#      （fixture 模式直接返回 CRAWLER_FIXTURE 中的商品；ANALYSIS_CACHE_TTL=0 使每次分析都请求模型）
+#   3. python benchmarks/load_analyze.py --flows 40 --concurrency 8 --keys k1,k2 --mock-url http://127.0.0.1:8090
+import argparse
+import json
+import math
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+FINISHED_STATUSES = ("done", "error")
+
+
+def percentile(values, pct):
+    """最近秩法百分位数，没有数据时返回 None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return round(ordered[rank - 1], 1)
+
+
+def latency_summary(values):
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": round(max(values), 1) if values else None
+    }
+
+
+class LoadDriver:
+    def __init__(self, base_url, keys, keyword, max_items, top_n, poll_interval, timeout):
+        self.base_url = base_url.rstrip("/")
+        self.keys = keys
+        self.keyword = keyword
+        self.max_items = max_items
+        self.top_n = top_n
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+    def _post(self, session, path, payload):
+        response = session.post(f"{self.base_url}{path}", json=payload, timeout=self.timeout)
+        return response.status_code, response.json()
+
+    def wait_for_job(self, session, job_id):
+        deadline = time.time() + self.timeout
+        while time.time() < deadline:
+            status = session.get(f"{self.base_url}/api/status/{job_id}", timeout=self.timeout).json()
+            if status.get("status") in FINISHED_STATUSES:
+                return status
+            time.sleep(self.poll_interval)
+        raise TimeoutError(f"任务 {job_id} 超过 {self.timeout} 秒未完成")
+
+    def run_flow(self, index):
+        """执行一次完整流程，返回各阶段耗时（毫秒）和结果；API Key 按流程序号轮流使用"""
+        api_key = self.keys[index % len(self.keys)]
+        result = {"flow": index, "key": f"...{api_key[-4:]}", "ok": False}
+        started = time.time()
+        with requests.Session() as session:
+            try:
+                code, payload = self._post(session, "/api/search", {
+                    "keyword": self.keyword, "api_key": api_key, "max_items": self.max_items
+                })
+                if code != 200 or not payload.get("success"):
+                    result["error"] = f"search {code}: {payload.get('message')}"
+                    return result
+                status = self.wait_for_job(session, payload["job_id"])
+                result["search_ms"] = (time.time() - started) * 1000
+                if status.get("status") != "done":
+                    result["error"] = f"crawl: {status.get('error')}"
+                    return result
+
+                analyze_started = time.time()
+                code, payload = self._post(session, "/api/analyze", {
+                    "job_id": status["job_id"], "api_key": api_key, "top_n": self.top_n, "mode": "full"
+                })
+                result["analyze_ms"] = (time.time() - analyze_started) * 1000
+                result["total_ms"] = (time.time() - started) * 1000
+                stats = payload.get("stats") or {}
+                result["chunks"] = stats.get("chunks")
+                result["failed_chunks"] = stats.get("failed_chunks")
+                result["cache_hits"] = stats.get("cache_hits")
+                if code != 200 or not payload.get("success"):
+                    result["error"] = f"analyze {code}: {payload.get('message')}"
+                    return result
+                result["recommended"] = len(payload.get("data") or [])
+                result["ok"] = True
+            except Exception as e:
+                result["error"] = str(e)
+        return result
+
+    def quota(self):
+        """后端各 Key 的累计请求数和限流次数（按 Key 后 4 位）"""
+        try:
+            data = requests.get(f"{self.base_url}/api/quota", timeout=10).json()
+        except Exception:
+            return {}
+        return {item["key"]: item for item in data.get("keys", [])}
+
+
+def mock_request(mock_url, method, path):
+    if not mock_url:
+        return None
+    try:
+        return requests.request(method, f"{mock_url.rstrip('/')}{path}", timeout=10).json()
+    except Exception as e:
+        print(f"[压测] 读取模拟服务 {path} 失败: {e}")
+        return None
+
+
+def retry_counts(before, after, mock_stats):
+    """
+    重试次数：后端配额管理器记录的限流次数（按 Key 汇总前后差值）；
+    连接了模拟服务时，另外给出模拟服务实际收到的请求数和返回的 429 数
+    """
+    rate_limited = sum(
+        item.get("total_rate_limited", 0) - before.get(key, {}).get("total_rate_limited", 0)
+        for key, item in after.items()
+    )
+    requests_sent = sum(
+        item.get("total_requests", 0) - before.get(key, {}).get("total_requests", 0)
+        for key, item in after.items()
+    )
+    counts = {"backend_requests": requests_sent, "backend_rate_limited": rate_limited}
+    if mock_stats is not None:
+        counts.update({
+            "mock_requests": mock_stats["requests"],
+            "mock_succeeded": mock_stats["succeeded"],
+            "mock_429": mock_stats["rate_limited"],
+            "retries": mock_stats["requests"] - mock_stats["succeeded"]
+        })
+    return counts
+
+
+def print_report(report):
+    print()
+    print(f"流程 {report['flows']} 个，成功 {report['succeeded']} 个，失败 {report['failed']} 个，"
+          f"并发 {report['concurrency']}，总耗时 {report['wall_s']} 秒，吞吐量 {report['throughput']} 个/秒")
+    print(f"{'阶段':<10}{'次数':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name in ("search", "analyze", "total"):
+        s = report["latency"][name]
+        print(f"{name:<10}{s['count']:>6}{s['p50'] or 0:>10}{s['p95'] or 0:>10}{s['p99'] or 0:>10}{s['max'] or 0:>10}")
+    print("重试: " + ", ".join(f"{k}={v}" for k, v in report["retries"].items()))
+    for error, count in report["errors"].items():
+        print(f"[失败] {count} 次: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并发执行搜索 + 分析流程，测量延迟、吞吐量和重试次数")
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000", help="后端地址")
+    parser.add_argument("--flows", type=int, default=20, help="流程总数")
+    parser.add_argument("--concurrency", type=int, default=4, help="同时执行的流程数")
+    parser.add_argument("--keys", default="mock-key-0001", help="API Key（逗号分隔，按流程轮流使用）")
+    parser.add_argument("--keyword", default="iPhone")
+    parser.add_argument("--max-items", type=int, default=50)
+    parser.add_argument("--top-n", type=int, default=20)
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="查询抓取状态的间隔（秒）")
+    parser.add_argument("--timeout", type=float, default=600, help="单个请求或抓取的超时（秒）")
+    parser.add_argument("--mock-url", help="模拟 Gemini 服务地址（压测前清零统计，结束后读取请求数和 429 数）")
+    parser.add_argument("--output", help="结果另存为 JSON")
+    args = parser.parse_args()
+
+    keys = [key.strip() for key in args.keys.split(",") if key.strip()]
+    driver = LoadDriver(args.base_url, keys, args.keyword, args.max_items, args.top_n,
+                        args.poll_interval, args.timeout)
+    mock_request(args.mock_url, "POST", "/reset")
+    quota_before = driver.quota()
+
+    print(f"[压测] {args.flows} 个流程，并发 {args.concurrency}，后端 {args.base_url}")
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as executor:
+        results = list(executor.map(driver.run_flow, range(args.flows)))
+    wall = time.time() - started
+
+    succeeded = [r for r in results if r["ok"]]
+    errors = {}
+    for r in results:
+        if not r["ok"]:
+            errors[r.get("error", "unknown")] = errors.get(r.get("error", "unknown"), 0) + 1
+    report = {
+        "flows": args.flows,
+        "concurrency": args.concurrency,
+        "keys": len(keys),
+        "succeeded": len(succeeded),
+        "failed": args.flows - len(succeeded),
+        "wall_s": round(wall, 2),
+        "throughput": round(len(succeeded) / wall, 3) if wall else 0.0,
+        "latency": {
+            "search": latency_summary([r["search_ms"] for r in results if "search_ms" in r]),
+            "analyze": latency_summary([r["analyze_ms"] for r in succeeded]),
+            "total": latency_summary([r["total_ms"] for r in succeeded])
+        },
+        "retries": retry_counts(quota_before, driver.quota(), mock_request(args.mock_url, "GET", "/stats")),
+        "errors": errors,
+        "detail": results
+    }
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n[压测] 结果已保存到 {args.output}")
+    return 0 if succeeded else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
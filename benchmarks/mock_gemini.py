@@ -0,0 +1,250 @@
+# 本地模拟 Gemini 服务：实现 generateContent 接口，可配置响应延迟、429 限流注入和固定的输出，
+# 后端设置 GEMINI_BASE_URL=http://127.0.0.1:8090 后不需要真实的 API Key、代理和网络即可测试分析流程
+#
+# 用法：python benchmarks/mock_gemini.py --port 8090 --latency-ms 800 --jitter-ms 300 --error-rate 0.05 --rpm 30
+#   GET /stats 查看请求数、限流次数和延迟；POST /reset 清零统计
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 请求路径：/v1beta/models/<模型>:generateContent
+GENERATE_PATH = re.compile(r"^/[^/]+/models/([^/:]+):generateContent$")
+# 商品表中的数据行：以行号开头、制表符分隔（见 backend/prompt_codec.py）
+ROW_PATTERN = re.compile(r"^\s*(\d+)\t", re.MULTILINE)
+
+
+class MockConfig:
+    def __init__(self, latency_ms=800, jitter_ms=300, error_rate=0.0, rpm=0, retry_after=2.0,
+                 pick_rate=0.1, responses=None, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rpm = rpm
+        self.retry_after = retry_after
+        self.pick_rate = pick_rate
+        self.responses = responses or []
+        self.random = random.Random(seed)
+
+
+class MockState:
+    """统计和按 Key 的 RPM 限流窗口（多个请求线程共用）"""
+
+    def __init__(self, config):
+        self.config = config
+        self._lock = threading.Lock()
+        self._windows = {}
+        self._canned = 0
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.succeeded = 0
+            self.injected_429 = 0
+            self.rpm_429 = 0
+            self.per_key = {}
+            self.latencies = []
+            self.started = time.time()
+
+    def admit(self, api_key):
+        """记录一次请求，返回应返回的限流原因（injected / rpm），放行时返回 None"""
+        with self._lock:
+            self.requests += 1
+            self.per_key[api_key] = self.per_key.get(api_key, 0) + 1
+            if self.config.random.random() < self.config.error_rate:
+                self.injected_429 += 1
+                return "injected"
+            if self.config.rpm:
+                now = time.time()
+                window = self._windows.setdefault(api_key, deque())
+                while window and now - window[0] >= 60:
+                    window.popleft()
+                if len(window) >= self.config.rpm:
+                    self.rpm_429 += 1
+                    return "rpm"
+                window.append(now)
+            return None
+
+    def delay(self):
+        with self._lock:
+            jitter = self.config.random.uniform(-self.config.jitter_ms, self.config.jitter_ms)
+        return max(0.0, self.config.latency_ms + jitter) / 1000
+
+    def finish(self, latency):
+        with self._lock:
+            self.succeeded += 1
+            self.latencies.append(latency)
+
+    def next_canned(self):
+        with self._lock:
+            text = self.config.responses[self._canned % len(self.config.responses)]
+            self._canned += 1
+            return text
+
+    def pick(self, row_ids):
+        with self._lock:
+            return [row_id for row_id in row_ids if self.config.random.random() < self.config.pick_rate]
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            elapsed = time.time() - self.started
+            return {
+                "requests": self.requests,
+                "succeeded": self.succeeded,
+                "rate_limited": self.injected_429 + self.rpm_429,
+                "injected_429": self.injected_429,
+                "rpm_429": self.rpm_429,
+                "per_key": dict(self.per_key),
+                "requests_per_sec": round(self.requests / elapsed, 2) if elapsed else 0.0,
+                "latency_ms_p50": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None
+            }
+
+
+def prompt_text(body):
+    """取出请求中所有文本片段（google-genai 把 contents 字符串转为 [{"role": "user", "parts": [{"text": ...}]}]）"""
+    texts = []
+    for content in body.get("contents") or []:
+        for part in content.get("parts") or []:
+            if isinstance(part, dict) and part.get("text"):
+                texts.append(part["text"])
+    return "\n".join(texts)
+
+
+def generate_results(state, prompt):
+    """按提示词中的商品表行号生成推荐：随机挑选一部分行（比例 pick_rate），返回模型格式的 JSON 文本"""
+    row_ids = [int(match) for match in ROW_PATTERN.findall(prompt)]
+    results = [
+        {"id": row_id, "reason": "模拟推荐：价格低于同类商品", "score": round(8.5 + (row_id % 15) / 10, 1)}
+        for row_id in state.pick(row_ids)
+    ]
+    return json.dumps(results, ensure_ascii=False)
+
+
+def rate_limit_body(retry_after):
+    return {
+        "error": {
+            "code": 429,
+            "message": "Resource has been exhausted (e.g. check quota).",
+            "status": "RESOURCE_EXHAUSTED",
+            "details": [
+                {"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": f"{retry_after:g}s"}
+            ]
+        }
+    }
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, payload, headers=None):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.startswith("/stats"):
+                self._send(200, state.stats())
+            else:
+                self._send(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            path = self.path.split("?", 1)[0]
+            if path == "/reset":
+                state.reset()
+                self._send(200, {"ok": True})
+                return
+            match = GENERATE_PATH.match(path)
+            if not match:
+                self._send(404, {"error": {"code": 404, "message": f"Unsupported path {path}", "status": "NOT_FOUND"}})
+                return
+            try:
+                body = json.loads(raw or b"{}")
+            except ValueError:
+                self._send(400, {"error": {"code": 400, "message": "Invalid JSON", "status": "INVALID_ARGUMENT"}})
+                return
+
+            api_key = self.headers.get("x-goog-api-key") or "anonymous"
+            started = time.time()
+            if state.admit(api_key) is not None:
+                retry_after = state.config.retry_after
+                self._send(429, rate_limit_body(retry_after), {"Retry-After": f"{retry_after:g}"})
+                return
+
+            time.sleep(state.delay())
+            prompt = prompt_text(body)
+            text = state.next_canned() if state.config.responses else generate_results(state, prompt)
+            prompt_tokens = len(prompt) // 2 + 1
+            output_tokens = len(text) // 2 + 1
+            self._send(200, {
+                "candidates": [{
+                    "content": {"role": "model", "parts": [{"text": text}]},
+                    "finishReason": "STOP",
+                    "index": 0
+                }],
+                "usageMetadata": {
+                    "promptTokenCount": prompt_tokens,
+                    "candidatesTokenCount": output_tokens,
+                    "totalTokenCount": prompt_tokens + output_tokens
+                },
+                "modelVersion": match.group(1)
+            })
+            state.finish(time.time() - started)
+
+    return Handler
+
+
+def load_responses(path):
+    """固定输出文件：JSON 数组，每个元素是一次响应的文本（字符串）或推荐列表，按顺序循环使用"""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return [item if isinstance(item, str) else json.dumps(item, ensure_ascii=False) for item in data]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟 Gemini generateContent 接口")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=800, help="每次成功响应的平均延迟（毫秒）")
+    parser.add_argument("--jitter-ms", type=float, default=300, help="延迟的随机浮动范围（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="随机返回 429 的比例（0~1）")
+    parser.add_argument("--rpm", type=int, default=0, help="每个 Key 每分钟的请求上限，超过时返回 429（0 为不限）")
+    parser.add_argument("--retry-after", type=float, default=2.0, help="429 响应中建议的等待秒数")
+    parser.add_argument("--pick-rate", type=float, default=0.1, help="每行商品被推荐的概率")
+    parser.add_argument("--responses", help="固定输出文件（JSON 数组），指定后不再按商品表生成")
+    parser.add_argument("--seed", type=int, help="随机种子（结果可重复）")
+    args = parser.parse_args()
+
+    config = MockConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate, rpm=args.rpm,
+        retry_after=args.retry_after, pick_rate=args.pick_rate,
+        responses=load_responses(args.responses) if args.responses else None, seed=args.seed
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(MockState(config)))
+    print(f"[MOCK] 模拟 Gemini 服务: http://{args.host}:{args.port}（后端设置 GEMINI_BASE_URL 指向该地址）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
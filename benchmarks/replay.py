@@ -0,0 +1,245 @@
+# 录制/回放：把一次真实的搜索抓取（页面 HTML 和所有网络响应）录制为 HAR，之后离线回放，
+# 基准测试不再访问真实网站，结果可重复
+#
+# 录制：python benchmarks/replay.py record iPhone --name iphone --max-pages 3
+#   生成 benchmarks/fixtures/iphone.har（已去掉登录 cookie，可以提交）和 iphone.golden.json（本次抓取结果）
+#   golden 中的 verified 为 false：对照页面逐条校对标题和价格、删掉不该出现的商品后改为 true，
+#   只有校对过的基准结果才参与 bench_extraction.py --min-recall 的判定
+import argparse
+import base64
+import inspect
+import json
+import os
+import sys
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+
+# 让基准测试可以直接导入项目根目录下的爬虫模块
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+# 每次请求都会变化的查询参数（时间戳、签名、JSONP 回调名），匹配录制的响应时忽略
+VOLATILE_PARAMS = {"t", "_", "sign", "callback", "jsv", "timestamp", "spm", "spm_id_from"}
+# 回放时不能照搬的响应头（录制的正文已经解压）
+DROP_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+# 录制结果中要去掉的登录凭据：请求头，以及响应中下发这些 cookie 的 set-cookie
+CREDENTIAL_HEADERS = {"cookie", "authorization"}
+SESSION_COOKIES = {"unb", "tracknick", "_nk_", "cookie2", "cookie17", "sgcookie", "csg", "lgc", "_tb_token_", "sn"}
+
+
+def fixture_paths(name, fixtures_dir=FIXTURES_DIR):
+    """一个录制样本的 (HAR 路径, 基准结果路径)"""
+    return os.path.join(fixtures_dir, f"{name}.har"), os.path.join(fixtures_dir, f"{name}.golden.json")
+
+
+def normalize_url(url):
+    """去掉易变的查询参数并排序，作为匹配录制响应的键"""
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in VOLATILE_PARAMS)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+
+
+def normalize_body(body):
+    """POST 正文中同样去掉易变参数（mtop 接口的 data 参数里是搜索条件和页码）"""
+    if not body:
+        return ""
+    try:
+        pairs = parse_qsl(body, keep_blank_values=True, strict_parsing=True)
+    except ValueError:
+        return body
+    return urlencode(sorted((k, v) for k, v in pairs if k not in VOLATILE_PARAMS))
+
+
+def sanitize_har(har_path):
+    """去掉 HAR 中的登录凭据（请求的 Cookie / Authorization 头和登录 cookie 的 set-cookie），返回去掉的条数"""
+    with open(har_path, encoding="utf-8") as f:
+        har = json.load(f)
+    removed = 0
+    for entry in har["log"]["entries"]:
+        request, response = entry["request"], entry["response"]
+        headers = [h for h in request.get("headers", []) if h["name"].lower() not in CREDENTIAL_HEADERS]
+        removed += len(request.get("headers", [])) - len(headers) + len(request.get("cookies", []))
+        request["headers"], request["cookies"] = headers, []
+        headers = [
+            h for h in response.get("headers", [])
+            if not (h["name"].lower() == "set-cookie" and h["value"].split("=", 1)[0].strip() in SESSION_COOKIES)
+        ]
+        cookies = [c for c in response.get("cookies", []) if c.get("name") not in SESSION_COOKIES]
+        removed += len(response.get("headers", [])) - len(headers) + len(response.get("cookies", [])) - len(cookies)
+        response["headers"], response["cookies"] = headers, cookies
+    with open(har_path, "w", encoding="utf-8") as f:
+        json.dump(har, f, ensure_ascii=False)
+    return removed
+
+
+class HarServer:
+    """
+    HAR 回放服务：挂在浏览器上下文的路由上，按 (方法, 规范化 URL, 规范化正文) 返回录制的响应
+    同一个请求录制了多次（如令牌过期后重试）时按录制顺序依次返回，用完后重复最后一次；
+    没有完全匹配时，按同一路径下录制的先后顺序返回（翻页请求的正文可能与录制时不同）；
+    完全没有录制的请求直接中止，回放过程不会访问网络
+    """
+
+    def __init__(self, har_path):
+        with open(har_path, encoding="utf-8") as f:
+            entries = json.load(f)["log"]["entries"]
+        self.exact = {}
+        self.by_path = {}
+        self._cursor = {}
+        for entry in entries:
+            request = entry["request"]
+            body = (request.get("postData") or {}).get("text", "")
+            key = (request["method"], normalize_url(request["url"]), normalize_body(body))
+            self.exact.setdefault(key, []).append(entry["response"])
+            self.by_path.setdefault(self._path_key(request["method"], request["url"]), []).append(entry["response"])
+        self.hits = 0
+        self.fallbacks = 0
+        self.misses = 0
+
+    @staticmethod
+    def _path_key(method, url):
+        parts = urlsplit(url)
+        return method, parts.netloc, parts.path
+
+    def _next(self, key, candidates):
+        index = self._cursor.get(key, 0)
+        self._cursor[key] = index + 1
+        return candidates[min(index, len(candidates) - 1)]
+
+    def lookup(self, method, url, body):
+        key = (method, normalize_url(url), normalize_body(body))
+        if key in self.exact:
+            self.hits += 1
+            return self._next(key, self.exact[key])
+        path_key = self._path_key(method, url)
+        if path_key in self.by_path:
+            self.fallbacks += 1
+            return self._next(path_key, self.by_path[path_key])
+        self.misses += 1
+        return None
+
+    def attach(self, context):
+        context.route("**/*", self._handle)
+
+    def _handle(self, route):
+        request = route.request
+        try:
+            body = request.post_data or ""
+        except Exception:
+            body = ""
+        response = self.lookup(request.method, request.url, body)
+        if response is None or response.get("status", 0) <= 0:
+            route.abort("internetdisconnected")
+            return
+        content = response.get("content") or {}
+        text = content.get("text") or ""
+        payload = base64.b64decode(text) if content.get("encoding") == "base64" else text.encode("utf-8")
+        headers = {}
+        for header in response.get("headers", []):
+            name = header["name"]
+            if name.lower() in DROP_HEADERS or name.startswith(":"):
+                continue
+            # 重复的响应头合并（多个 set-cookie 用换行分隔）
+            separator = "\n" if name.lower() == "set-cookie" else ", "
+            headers[name] = headers[name] + separator + header["value"] if name in headers else header["value"]
+        route.fulfill(status=response["status"], headers=headers, body=payload)
+
+    def stats(self):
+        return {"hits": self.hits, "fallbacks": self.fallbacks, "misses": self.misses}
+
+
+class ProtocolCounter:
+    """
+    统计 Playwright 客户端发给浏览器驱动的调用次数（每次 evaluate / locator 查询 / goto 等都是一次往返，
+    对应至少一条 CDP 命令），用来衡量提取一个商品需要多少次浏览器往返
+    依赖 Playwright 内部的 Channel 实现，版本不兼容时 available 为 False，调用次数不统计
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.available = False
+        try:
+            from playwright._impl._connection import Channel
+        except ImportError:
+            return
+        names = ["_inner_send"] if hasattr(Channel, "_inner_send") else ["send", "send_return_as_dict"]
+        names.append("send_no_reply")
+        for name in names:
+            original = getattr(Channel, name, None)
+            if original is None:
+                continue
+            setattr(Channel, name, self._wrap(original))
+            self.available = True
+
+    def _wrap(self, original):
+        counter = self
+
+        if inspect.iscoroutinefunction(original):
+            async def wrapper(channel, *args, **kwargs):
+                counter.calls += 1
+                return await original(channel, *args, **kwargs)
+        else:
+            def wrapper(channel, *args, **kwargs):
+                counter.calls += 1
+                return original(channel, *args, **kwargs)
+        return wrapper
+
+
+def record(keyword, name=None, max_items=200, max_pages=3, fixtures_dir=FIXTURES_DIR):
+    """
+    在有界面的浏览器中真实抓取一次（需要时可以登录），录制 HAR（去掉登录凭据）并把抓取结果保存为基准结果
+    基准结果标记为未校对（verified: false），手工校对后再改为 true
+    """
+    from playwright.sync_api import sync_playwright
+    from crawler_enhanced import launch_browser, new_context, crawl_keyword
+
+    name = name or keyword
+    os.makedirs(fixtures_dir, exist_ok=True)
+    har_path, golden_path = fixture_paths(name, fixtures_dir)
+    with sync_playwright() as p:
+        browser = launch_browser(p, headless=False)
+        context = new_context(browser, record_har_path=har_path, record_har_content="embed")
+        page = context.new_page()
+        results, login_required = crawl_keyword(page, context, keyword, max_items=max_items, max_pages=max_pages)
+        context.close()  # 关闭上下文时写出 HAR
+        browser.close()
+    if login_required:
+        print("[警告] 录制时仍未登录，回放结果可能不完整")
+    print(f"[录制] 已从 HAR 中去掉 {sanitize_har(har_path)} 项登录凭据")
+
+    golden = {
+        "keyword": keyword,
+        "max_items": max_items,
+        "max_pages": max_pages,
+        "recorded_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "verified": False,
+        "items": [
+            {"url": item.get("url", ""), "title": item.get("title", ""), "price": item.get("price", "")}
+            for item in results
+        ]
+    }
+    with open(golden_path, "w", encoding="utf-8") as f:
+        json.dump(golden, f, ensure_ascii=False, indent=2)
+    print(f"[录制] {len(results)} 个商品，HAR: {har_path}，基准结果: {golden_path}（校对后把 verified 改为 true）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="录制搜索页面，供离线基准测试回放")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rec = sub.add_parser("record", help="真实抓取一次并录制为 HAR")
+    rec.add_argument("keyword")
+    rec.add_argument("--name", help="样本名称（默认与关键词相同）")
+    rec.add_argument("--max-items", type=int, default=200)
+    rec.add_argument("--max-pages", type=int, default=3)
+    rec.add_argument("--fixtures", default=FIXTURES_DIR, help="样本目录")
+    args = parser.parse_args()
+    if args.command == "record":
+        record(args.keyword, args.name, args.max_items, args.max_pages, args.fixtures)
+
+
+if __name__ == "__main__":
+    main()
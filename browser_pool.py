@@ -0,0 +1,344 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from urllib.parse import urlparse
+from playwright.sync_api import sync_playwright
+
+from crawler_enhanced import launch_browser, new_context, crawl_keyword
+from resource_policy import ResourceBlocker, default_policy_name, headless_enabled
+from session_store import get_session_store
+
+# 预热时访问的首页（建立连接、加载缓存和登录cookie）
+WARMUP_URL = "https://www.goofish.com/"
+
+
+class DomainRateLimiter:
+    """
+    按域名限速：同一域名两次导航之间至少间隔 min_interval 秒（所有工作线程共享）
+    采用预约时间片的方式，先到先得
+    """
+
+    def __init__(self, min_interval=2.0):
+        self.min_interval = min_interval
+        self._next_allowed = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, url):
+        """阻塞直到允许访问该URL所在的域名"""
+        domain = urlparse(url).netloc or url
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next_allowed.get(domain, 0))
+            self._next_allowed[domain] = slot + self.min_interval
+        wait = slot - now
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class CrawlTask:
+    """一次抓取任务"""
+
+    def __init__(self, keyword, options=None):
+        self.keyword = keyword
+        self.options = options or {}  # 传给 crawl_keyword 的参数，如 max_items / max_pages
+        self.future = Future()
+        self.created_at = time.time()
+
+
+class PoolWorker(threading.Thread):
+    """
+    浏览器池中的一个工作线程
+    Playwright 同步API的对象只能在创建它的线程中使用，所以每个工作线程持有自己的浏览器和上下文
+    """
+
+    def __init__(self, pool, index):
+        super().__init__(name=f"browser-pool-{index}", daemon=True)
+        self.pool = pool
+        self.index = index
+        self.busy = False
+        self.ready = False
+        self.keyword = None
+        self.pages_served = 0  # 当前上下文已访问的结果页数
+        self.recycled = 0
+        self.browser = None
+        self.context = None
+        self.page = None
+        self.blocker = None
+        self.session_version = None  # 当前上下文加载的登录状态版本
+
+    def _open_context(self):
+        """创建并预热一个已登录的上下文（预热时按默认策略拦截图片等资源）"""
+        session = get_session_store()
+        self.session_version = session.version
+        self.context = new_context(self.browser)
+        self.blocker = ResourceBlocker(self.context)
+        self.blocker.use(default_policy_name(self.pool.headless))
+        self.page = self.context.new_page()
+        self.pages_served = 0
+        try:
+            self.pool.rate_limiter.acquire(WARMUP_URL)
+            self.page.goto(WARMUP_URL, timeout=30000, wait_until="domcontentloaded")
+            print(f"[POOL] 工作线程 {self.index} 上下文已预热")
+        except Exception as e:
+            print(f"[POOL] 工作线程 {self.index} 预热失败: {e}")
+
+    def _close_context(self):
+        """关闭当前上下文（回收前先保存登录状态）"""
+        if self.context is None:
+            return
+        try:
+            get_session_store().save(self.context)
+        except:
+            pass
+        try:
+            self.context.close()
+        except:
+            pass
+        self.context = None
+        self.page = None
+        self.blocker = None
+
+    def _recycle(self, reason):
+        print(f"[POOL] 回收工作线程 {self.index} 的上下文: {reason}")
+        self._close_context()
+        self.recycled += 1
+        self.pool._count_recycle()
+
+    def _ensure_browser(self, p):
+        """浏览器崩溃或断开时重新启动"""
+        if self.browser is not None and self.browser.is_connected():
+            return
+        if self.browser is not None:
+            print(f"[POOL] 工作线程 {self.index} 浏览器已断开，重新启动")
+        self.context = None
+        self.page = None
+        self.blocker = None
+        self.browser = launch_browser(p, headless=self.pool.headless)
+
+    def run(self):
+        try:
+            self._serve()
+        except Exception as e:
+            print(f"[POOL] 工作线程 {self.index} 异常退出: {e}")
+            self.pool._worker_failed(self, e)
+
+    def _serve(self):
+        with sync_playwright() as p:
+            try:
+                self._ensure_browser(p)
+                self._open_context()
+            except Exception as e:
+                print(f"[POOL] 工作线程 {self.index} 启动浏览器失败: {e}")
+                raise
+            self.ready = True
+            self.pool._worker_ready()
+
+            while True:
+                task = self.pool._tasks.get()
+                if task is None:
+                    break
+                if not task.future.set_running_or_notify_cancel():
+                    continue
+
+                self.busy = True
+                self.keyword = task.keyword
+                try:
+                    self._ensure_browser(p)
+                    # 其他工作线程（或 --login）更新了登录状态时换用新上下文，所有线程共用同一个会话
+                    if self.context is not None and self.session_version != get_session_store().version:
+                        self._recycle("登录状态已更新")
+                    if self.context is None or self.page is None or self.page.is_closed():
+                        self._open_context()
+
+                    # 每个任务可以指定自己的拦截策略，未指定时使用默认策略
+                    options = dict(task.options)
+                    self.blocker.use(options.pop("resource_policy", None) or default_policy_name(self.pool.headless))
+                    # 从 crawl_finished 事件取本次实际访问的结果页数（未发出时按 1 页计）
+                    visited = {"pages": 1}
+                    task_on_event = options.pop("on_event", None)
+
+                    def on_event(event_type, **data):
+                        if event_type == "crawl_finished":
+                            visited["pages"] = max(1, data.get("pages") or 1)
+                        if task_on_event is not None:
+                            task_on_event(event_type, **data)
+
+                    results, login_required = crawl_keyword(
+                        self.page, self.context, task.keyword,
+                        rate_limiter=self.pool.rate_limiter, interactive=not self.pool.headless,
+                        blocker=self.blocker, on_event=on_event, **options
+                    )
+                    self.pages_served += visited["pages"]
+                    self.pool._count_pages(visited["pages"])
+                    task.future.set_result(results)
+
+                    # 登录完成后保存状态，供其他工作线程下次建上下文时使用（未登录的状态不会覆盖有效的登录状态）
+                    if not login_required:
+                        try:
+                            if get_session_store().save(self.context):
+                                self.session_version = get_session_store().version
+                        except:
+                            pass
+
+                    if self.pages_served >= self.pool.max_pages_per_context:
+                        self._recycle(f"已处理 {self.pages_served} 个页面")
+                except Exception as e:
+                    print(f"[POOL] 工作线程 {self.index} 抓取失败: {e}")
+                    if not task.future.done():
+                        task.future.set_exception(e)
+                    self._recycle("抓取异常")
+                finally:
+                    self.busy = False
+                    self.keyword = None
+
+            self._close_context()
+            try:
+                if self.browser is not None and self.browser.is_connected():
+                    self.browser.close()
+            except:
+                pass
+
+
+class BrowserPool:
+    """
+    常驻浏览器池：预先启动 N 个已登录的上下文，后端直接在进程内派发关键词
+    避免每次搜索都冷启动 Python 解释器和 Chromium
+    """
+
+    def __init__(self, size=2, max_pages_per_context=20, min_interval=2.0, headless=False):
+        self.size = size
+        self.headless = headless  # 无界面模式：需要登录时任务直接结束，提示先用 --login 登录
+        self.max_pages_per_context = max_pages_per_context
+        self.rate_limiter = DomainRateLimiter(min_interval)
+        self._tasks = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._ready = 0
+        self._failed = 0
+        self._pages = 0
+        self._recycles = 0
+        self._started = False
+
+    def start(self):
+        """启动所有工作线程（预热在后台进行，不阻塞调用方）"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for i in range(self.size):
+            worker = PoolWorker(self, i)
+            self._workers.append(worker)
+            worker.start()
+        print(f"[POOL] 浏览器池已启动，大小: {self.size}，每个上下文最多处理 {self.max_pages_per_context} 个页面，"
+              f"{'无界面' if self.headless else '有界面'}模式")
+
+    def submit(self, keyword, **options):
+        """
+        提交一个关键词，返回 concurrent.futures.Future，结果为商品列表
+        options 原样传给 crawl_keyword（如 on_item / on_event / cancel）；Future.cancel() 只能取消排队中的任务，
+        已开始的抓取要通过 cancel 事件在翻页间停止
+        """
+        if not self._started:
+            self.start()
+        task = CrawlTask(keyword, options)
+        self._tasks.put(task)
+        # 所有工作线程都已启动失败时没有线程会取走任务，直接结束
+        with self._lock:
+            all_failed = self._failed >= self.size
+        if all_failed:
+            self._fail_pending("浏览器池没有可用的工作线程（浏览器启动失败）")
+        return task.future
+
+    def shutdown(self):
+        """停止所有工作线程"""
+        for _ in self._workers:
+            self._tasks.put(None)
+        for worker in self._workers:
+            worker.join(timeout=10)
+        self._workers = []
+        self._ready = 0
+        self._failed = 0
+        self._started = False
+
+    def stats(self):
+        """浏览器池占用情况"""
+        busy = [w for w in self._workers if w.busy]
+        with self._lock:
+            return {
+                "size": self.size,
+                "headless": self.headless,
+                "ready": self._ready,
+                "failed": self._failed,
+                "busy": len(busy),
+                "idle": max(self._ready - len(busy), 0),
+                "queued": self._tasks.qsize(),
+                "pages_served": self._pages,
+                "recycled": self._recycles,
+                "workers": [
+                    {
+                        "index": w.index,
+                        "alive": w.is_alive(),
+                        "busy": w.busy,
+                        "keyword": w.keyword,
+                        "pages_served": w.pages_served,
+                        "recycled": w.recycled
+                    }
+                    for w in self._workers
+                ]
+            }
+
+    def _worker_ready(self):
+        with self._lock:
+            self._ready += 1
+
+    def _worker_failed(self, worker, error):
+        """工作线程退出：全部工作线程都退出后，排队中的任务直接以失败结束，不再无限等待"""
+        with self._lock:
+            if worker.ready:
+                worker.ready = False
+                self._ready -= 1
+            self._failed += 1
+            all_failed = self._failed >= self.size
+        if all_failed:
+            print("[POOL] 所有工作线程都已退出，排队中的任务将失败")
+            self._fail_pending(f"浏览器池没有可用的工作线程: {error}")
+
+    def _fail_pending(self, message):
+        """取出队列中所有排队的任务并以 message 失败结束"""
+        while True:
+            try:
+                task = self._tasks.get_nowait()
+            except queue.Empty:
+                return
+            if task is not None and task.future.set_running_or_notify_cancel():
+                task.future.set_exception(Exception(message))
+
+    def _count_pages(self, count):
+        with self._lock:
+            self._pages += count
+
+    def _count_recycle(self):
+        with self._lock:
+            self._recycles += 1
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """获取全局浏览器池（首次调用时创建，大小可通过环境变量配置）"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool(
+                size=int(os.environ.get("CRAWLER_POOL_SIZE", "2")),
+                max_pages_per_context=int(os.environ.get("CRAWLER_MAX_PAGES", "20")),
+                min_interval=float(os.environ.get("CRAWLER_MIN_INTERVAL", "2")),
+                headless=headless_enabled()
+            )
+            _pool.start()
+        return _pool
@@ -4,7 +4,7 @@ import time
 import re
 from playwright.sync_api import sync_playwright
 
-def run_crawler(keyword):
+def run_crawler(keyword, ndjson=False):
     results = []
     print(f"--- [START] Crawler: {keyword} ---")
     
@@ -65,6 +65,9 @@ def run_crawler(keyword):
                     if title not in seen_titles:
                         seen_titles.add(title)
                         results.append({"title": title, "price": price, "desc": "Visual"})
+                        if ndjson:
+                            # 实时输出，读取方无需等待浏览器关闭
+                            print(json.dumps({"event": "item", "data": results[-1]}, ensure_ascii=False), flush=True)
                 except:
                     continue
 
@@ -74,6 +77,8 @@ def run_crawler(keyword):
         
         finally:
             print(f"[INFO] Scraped: {len(results)}")
+            if ndjson:
+                print(json.dumps({"event": "done", "count": len(results)}), flush=True)
             
             if len(results) == 0 or keep_browser_open:
                 print("\n[PAUSED] Window open for debugging.")
@@ -92,5 +97,6 @@ def run_crawler(keyword):
         json.dump(results, f, ensure_ascii=False)
 
 if __name__ == "__main__":
-    kw = sys.argv[1] if len(sys.argv) > 1 else "Bicycle"
-    run_crawler(kw)
+    args = [a for a in sys.argv[1:] if a != "--ndjson"]
+    kw = args[0] if args else "Bicycle"
+    run_crawler(kw, ndjson="--ndjson" in sys.argv)
@@ -2,8 +2,15 @@ import sys
 import os
 import json
 import time
-import re
 from playwright.sync_api import sync_playwright
+from page_ready import (
+    wait_for_page_ready, wait_for_goods, scroll_until_stable, click_next_page, wait_for_page_change
+)
+from dom_extract import extract_cards, normalize_card, item_identity, same_price
+from near_dup import NearDupIndex
+from resource_policy import ResourceBlocker, POLICIES, default_policy_name, headless_enabled
+from json_capture import SearchCapture, EXTRACTION_MODES, DEFAULT_EXTRACTION
+from session_store import LOGIN_PROBE_JS, STATE_FILE, get_session_store, login_key, session_info
 
 # 设置输出编码为UTF-8，避免Windows GBK编码问题
 if sys.platform == 'win32':
@@ -11,9 +18,409 @@ if sys.platform == 'win32':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
-def run_crawler(keyword):
+# 配置（使用绝对路径，后端在 backend/ 目录下进程内调用时也能找到文件）
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_FILE = os.path.join(BASE_DIR, "temp_data.json")
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+VIEWPORT = {"width": 1400, "height": 900}
+MAX_ITEMS = 50  # 默认每次搜索最多提取的商品数
+KNOWN_STOP_RUN = 10  # 增量抓取：连续遇到这么多个已知且价格未变的商品就停止翻页
+HOME_URL = "https://www.goofish.com/"
+
+
+def launch_browser(p, headless=False):
+    """
+    启动浏览器：强制直连，不使用代理
+    headless: 无界面模式（服务器部署）；默认显示浏览器窗口，方便登录
+    """
+    return p.chromium.launch(
+        headless=headless,
+        args=['--no-proxy-server']
+    )
+
+
+def new_context(browser, **options):
+    """
+    创建浏览器上下文，优先加载已保存的登录状态（所有工作线程共用内存中的同一份状态，不重复读文件）
+    options: 其他 browser.new_context 参数（如录制 HAR 的 record_har_path）
+    """
+    context = None
+    state = get_session_store().storage_state()
+    try:
+        if state is not None:
+            context = browser.new_context(
+                storage_state=state,
+                user_agent=USER_AGENT,
+                viewport=VIEWPORT,
+                **options
+            )
+            print("[INFO] 已加载保存的登录状态")
+    except:
+        pass
+
+    # 如果没有登录状态，创建新context
+    if context is None:
+        context = browser.new_context(
+            user_agent=USER_AGENT,
+            viewport=VIEWPORT,
+            **options
+        )
+    return context
+
+
+def detect_login_required(page):
+    """页面上是否有可见的登录入口：一次 page.evaluate 完成，不逐个选择器等待可见"""
+    try:
+        return bool(page.evaluate(LOGIN_PROBE_JS))
+    except Exception as e:
+        print(f"[DEBUG] 登录检测异常: {e}")
+        return False
+
+
+def wait_for_login(page, context, on_event=None, interactive=True):
+    """
+    检查是否需要登录，需要时等待用户在浏览器窗口中完成登录
+    保存的登录 cookie 有效时直接跳过检测；否则用一次页面检测判断是否出现登录入口
+    on_event: 生命周期事件回调，检测到需要登录和登录完成时通知
+    interactive: 无界面模式下为 False，检测到需要登录时不等待，直接返回
+    返回 True 表示仍未登录
+    """
+    session = get_session_store()
+    status = session.status()
+    if status["valid"]:
+        expires = time.strftime("%Y-%m-%d %H:%M", time.localtime(status["expires_at"])) if status["expires_at"] else "会话结束"
+        print(f"[INFO] 登录状态有效（有效期至 {expires}），跳过登录检测")
+        return False
+
+    print("[检查] 检查登录状态...")
+    if not detect_login_required(page):
+        print("[INFO] 未检测到登录需求，可能已登录或无需登录")
+        return False
+
+    if on_event is not None:
+        on_event("login_required", interactive=interactive)
+
+    if not interactive:
+        print("[登录] 检测到需要登录，但当前为无界面模式")
+        print("[提示] 请先运行 python crawler_enhanced.py --login，在弹出的浏览器窗口中完成登录")
+        return True
+
+    print("\n" + "="*50)
+    print("[登录] 检测到需要登录！")
+    print("="*50)
+    print("[步骤] 操作步骤：")
+    print("  1. 在浏览器窗口中点击登录按钮")
+    print("  2. 完成登录（扫码或输入账号密码）")
+    print("  3. 登录成功后，关闭浏览器窗口或等待自动继续")
+    print("="*50)
+    print("[等待] 等待登录中...（最多等待5分钟，您可以随时关闭窗口）")
+    print()
+
+    # 等待用户登录（最多等待5分钟）：每秒只读取一次 cookie（不序列化整个页面），
+    # 登录 cookie 出现即视为登录成功；每 5 秒再做一次页面检测，兼容登录 cookie 名称变化的情况
+    login_success = False
+    login_required = True
+    # 会话已被标记失效时，旧的登录 cookie 仍留在上下文中，要等到登录 cookie 变化才算重新登录
+    stale_key = session.version if status["invalid_reason"] else None
+    for i in range(300):  # 5分钟 = 300秒
+        time.sleep(1)
+        try:
+            # 检查浏览器窗口是否被关闭
+            if page.is_closed():
+                print("[成功] 浏览器窗口已关闭，假设登录完成")
+                login_success = True
+                login_required = False
+                break
+            cookies = {"cookies": context.cookies()}
+            if session_info(cookies)["valid"] and login_key(cookies) != stale_key:
+                print("[成功] 已检测到登录 cookie，登录成功！")
+                login_success = True
+            elif i % 5 == 4 and not detect_login_required(page):
+                print("[成功] 登录入口已消失，可能已登录成功！")
+                login_success = True
+            if login_success:
+                login_required = False
+                session.save(context, force=True)
+                break
+        except Exception:
+            # 如果页面出错，继续等待
+            pass
+
+        # 每30秒提示一次
+        if i > 0 and i % 30 == 0:
+            remaining = (300 - i) // 60
+            print(f"[等待] 仍在等待登录...（剩余约{remaining}分钟）")
+
+    if not login_success and login_required:
+        print("[警告] 登录等待超时，继续尝试爬取...")
+    if on_event is not None:
+        on_event("login_done", success=login_success)
+    return login_required
+
+
+def emit_ndjson(item):
+    """以 NDJSON 形式把一个商品写到标准输出（供后端逐行读取）"""
+    print(json.dumps({"event": "item", "data": item}, ensure_ascii=False), flush=True)
+
+
+def emit_event(event_type, **data):
+    """以 NDJSON 形式把一个生命周期事件写到标准输出"""
+    event = {"event": event_type}
+    event.update(data)
+    print(json.dumps(event, ensure_ascii=False), flush=True)
+
+
+def page_cards(page, capture, extraction, limit, target_count=None):
+    """
+    本页的商品，返回 (商品列表, 来源)
+    优先使用搜索接口的数据（来源 json，已是完整的商品记录）；没有收到接口数据时，
+    auto 模式退回到页面提取（来源 dom，原始卡片，需要 normalize_card 整理）
+    """
+    if capture is not None:
+        items = capture.drain()
+        if items or extraction == "json":
+            return items, "json"
+        print("[接口] 没有收到搜索接口数据，改用页面提取")
+    if extraction != "dom":
+        scroll_until_stable(page, target_count=target_count)
+    return extract_cards(page, limit), "dom"
+
+
+def collect_items(raw_cards, dedup, seen, results, max_items, on_item=None,
+                  known=None, known_run=0, known_stop=KNOWN_STOP_RUN, normalized=False, on_update=None):
+    """
+    把一页的原始卡片整理、去重后追加到 results，返回 (本页新增的商品数, 连续已知商品数)
+    dedup: 近似重复索引（NearDupIndex），标题略有改动的重复发布只保留第一条，并累加其 reposts（重复发布次数）
+    seen: 本次抓取已处理过的商品身份（跨页共用），同一商品重复出现直接跳过，不算重复发布
+    on_item: 每提取到一个新商品就回调一次，用于实时推送结果
+    on_update: 已经发出的商品又合并了一次重复发布时回调 on_update(位置, 商品)，位置是该商品在 results 中的下标
+               （on_item 可能已经把商品序列化输出或写入商品库，之后的 reposts 变化要单独通知）
+    known: 增量抓取时上次见过的商品 {商品身份: 价格}；连续 known_stop 个已知且价格未变的商品后停止提取
+    normalized: 商品已经是整理好的记录（来自搜索接口），不再经过 normalize_card
+    """
+    added = 0
+    for raw in raw_cards:
+        if len(results) >= max_items:
+            break
+        if known is not None and known_run >= known_stop:
+            break
+        item = raw if normalized else normalize_card(raw)
+        if item is None:
+            continue
+
+        # 去重（跨页增量去重）：同一商品只算一次，近似重复的帖子并入第一次出现的商品
+        identity = item_identity(item)
+        if identity in seen:
+            continue
+        seen.add(identity)
+        cluster_id, is_new = dedup.add(item)
+        if not is_new:
+            first = dedup.clusters[cluster_id]["item"]
+            first["reposts"] += 1
+            if on_update is not None:
+                # 每个新簇都会追加到 results，簇编号就是代表商品在 results 中的位置
+                on_update(cluster_id, first)
+            continue
+
+        item["reposts"] = 1
+        results.append(item)
+        added += 1
+        if on_item is not None:
+            on_item(item)
+        if len(results) <= 5:  # 只打印前5个
+            print(f"[调试] 提取商品 {len(results)}: {item['title'][:30]}... - ¥{item['price']}")
+        if known is not None:
+            if identity in known and same_price(known[identity], item["price"]):
+                known_run += 1
+            else:
+                known_run = 0
+    return added, known_run
+
+
+def crawl_keyword(page, context, keyword, rate_limiter=None, max_items=MAX_ITEMS, max_pages=1,
+                  on_item=None, on_event=None, known=None, known_stop=KNOWN_STOP_RUN,
+                  interactive=True, blocker=None, extraction=DEFAULT_EXTRACTION, cancel=None):
+    """
+    在已打开的页面上完成一次搜索抓取（供命令行和浏览器池共用）
+    rate_limiter: 可选的按域名限速器，多个标签页并发抓取时共享
+    max_items: 最多提取的商品数；max_pages: 最多翻几页
+    on_item: 每提取到一个新商品的回调
+    on_event: 生命周期事件回调 on_event(事件类型, **数据)，如 login_required / page_loaded / page_done；
+              已发出的商品合并了重复发布时发出 item_updated（index 为商品的序号，从 0 开始，reposts 为新的次数）
+    known: 增量抓取，上次见过的商品 {商品身份: 价格}；连续遇到 known_stop 个已知且未变化的商品后停止滚动和翻页
+    interactive: 能否等待用户在浏览器窗口中登录（无界面模式下为 False）
+    blocker: 上下文上的请求拦截器（ResourceBlocker），调用方已切换好本次的策略，结束时汇报拦截统计
+    extraction: 提取方式，auto（默认，优先解析搜索接口的 JSON 响应，没有时退回页面提取）/ json / dom
+    cancel: 可选的 threading.Event，调用方放弃等待（如超时）时设置，每页开始前检查，设置后停止抓取（reason 为 cancelled）
+    结束时发出 crawl_finished 事件，reason 说明停止原因（no_next_page / no_new_items / page_unchanged 表示结果已全部抓完），
+    ready_ms 为首页从开始导航到商品就绪的毫秒数，pages 为实际提取过的结果页数
+    返回 (results, login_required)
+    """
+    # 访问闲鱼搜索页面
+    target_url = f"https://www.goofish.com/search?q={keyword}"
+    if rate_limiter is not None:
+        rate_limiter.acquire(target_url)
+    if extraction not in EXTRACTION_MODES:
+        raise ValueError(f"未知的提取方式: {extraction}")
+    capture = SearchCapture(page) if extraction != "dom" else None
+    print(f"[访问] {target_url}")
+    started = time.time()
+    page.goto(target_url, timeout=60000, wait_until="domcontentloaded")
+
+    # 等待页面就绪（商品出现、网络空闲、DOM静止），代替固定等待
+    goods_loaded, _ = wait_for_page_ready(page)
+    ready_ms = int((time.time() - started) * 1000)
+    print(f"[访问] 页面就绪耗时 {ready_ms} ms")
+
+    login_required = wait_for_login(page, context, on_event, interactive=interactive)
+
+    # 等待商品列表加载（登录后页面可能刷新）
+    if not goods_loaded:
+        print("[检查] 等待商品列表加载...")
+        goods_loaded, _ = wait_for_page_ready(page)
+    if goods_loaded:
+        print("[成功] 商品列表已加载")
+        if on_event is not None:
+            on_event("page_loaded", page=1, ready_ms=ready_ms)
+    else:
+        print("[警告] 未检测到商品列表，可能原因：")
+        print("  - 需要登录")
+        print("  - 页面结构变化")
+        print("  - 网络问题")
+
+        # 如果没加载到商品，给用户更多时间（商品一出现就继续）
+        print("[等待] 最多等待30秒，请检查是否需要登录...")
+        wait_for_goods(page, timeout=30)
+
+    results = []
+    dedup = NearDupIndex()
+    seen = set()
+
+    def on_update(index, item):
+        if on_event is not None:
+            on_event("item_updated", index=index, reposts=item["reposts"])
+    known_run = 0
+    reason = "max_pages"
+    sources = {"json": 0, "dom": 0}
+    for page_no in range(1, max_pages + 1):
+        if cancel is not None and cancel.is_set():
+            print("[取消] 调用方已取消抓取，停止翻页")
+            reason = "cancelled"
+            break
+        # 页面提取时先滚动页面加载更多商品，没有新商品或数量足够时停止
+        if extraction == "dom":
+            print(f"[滚动] 第 {page_no} 页：滚动页面加载商品...")
+            scroll_until_stable(page, target_count=max_items - len(results))
+
+        # 提取商品数据：接口响应直接解析，页面提取用一次 page.evaluate 取回所有卡片
+        print("[提取] 开始提取商品数据...")
+        raw_cards, source = page_cards(page, capture, extraction, max_items, max_items - len(results))
+        sources[source] += 1
+        print(f"[调试] 第 {page_no} 页从{'搜索接口' if source == 'json' else '页面'}取得 {len(raw_cards)} 个商品")
+        # 接口明确表示没有下一页时不再点击翻页
+        has_next = not (source == "json" and capture.has_next is False)
+
+        # 预取下一页：当前页不够凑满目标数量时先触发翻页，浏览器加载下一页的同时在本地解析当前页
+        prefetched = False
+        signature = None
+        if page_no < max_pages and has_next and raw_cards and len(results) + len(raw_cards) < max_items:
+            if rate_limiter is not None:
+                rate_limiter.acquire(target_url)
+            signature = click_next_page(page)
+            prefetched = True
+
+        added, known_run = collect_items(
+            raw_cards, dedup, seen, results, max_items, on_item,
+            known=known, known_run=known_run, known_stop=known_stop, normalized=source == "json",
+            on_update=on_update
+        )
+        print(f"[提取] 第 {page_no} 页新增 {added} 个商品，累计 {len(results)} 个")
+        if on_event is not None:
+            on_event("page_done", page=page_no, added=added, count=len(results))
+
+        if len(results) >= max_items:
+            print(f"[提取] 已达到目标数量 {max_items}")
+            reason = "max_items"
+            break
+        if known is not None and known_run >= known_stop:
+            print(f"[增量] 连续 {known_run} 个商品与上次相同，停止抓取")
+            reason = "known_items"
+            break
+        if page_no >= max_pages:
+            break
+        if added == 0:
+            print("[翻页] 本页没有新商品，停止翻页")
+            reason = "no_new_items"
+            break
+        if not prefetched and has_next:
+            if rate_limiter is not None:
+                rate_limiter.acquire(target_url)
+            signature = click_next_page(page)
+        if signature is None:
+            print("[翻页] 没有下一页")
+            reason = "no_next_page"
+            break
+        if not wait_for_page_change(page, signature):
+            print("[翻页] 翻页后没有加载出新商品，停止翻页")
+            reason = "page_unchanged"
+            break
+        print(f"[翻页] 已进入第 {page_no + 1} 页")
+
+    print(f"[成功] 成功提取 {len(results)} 个商品")
+    finish = {"reason": reason, "count": len(results), "ready_ms": ready_ms, "pages": sum(sources.values())}
+    finish["extraction"] = {"mode": extraction, "json_pages": sources["json"], "dom_pages": sources["dom"]}
+    if capture is not None:
+        finish["extraction"].update(capture.stats())
+        capture.close()
+        if capture.session_expired:
+            get_session_store().invalidate("搜索接口返回会话过期")
+    if blocker is not None:
+        finish["resources"] = blocker.stats()
+        print(f"[拦截] 策略 {blocker.policy.name}：屏蔽 {finish['resources']['blocked_requests']} 个请求，"
+              f"约节省 {finish['resources']['estimated_bytes_saved'] // 1024} KB")
+    if on_event is not None:
+        on_event("crawl_finished", **finish)
+
+    # 如果没提取到数据，保存页面截图和HTML用于调试
+    if len(results) == 0:
+        print("[警告] 未提取到任何商品数据")
+        try:
+            screenshot_path = os.path.join(BASE_DIR, "debug_screenshot.png")
+            page.screenshot(path=screenshot_path)
+            print(f"[调试] 已保存页面截图到: {screenshot_path}")
+        except:
+            pass
+
+    return results, login_required
+
+
+def login():
+    """在有界面的浏览器中打开闲鱼首页，等待用户登录并保存登录状态（供无界面模式使用）"""
+    with sync_playwright() as p:
+        browser = launch_browser(p, headless=False)
+        context = new_context(browser)
+        page = context.new_page()
+        page.goto(HOME_URL, timeout=60000, wait_until="domcontentloaded")
+        wait_for_page_ready(page)
+        if not wait_for_login(page, context):
+            try:
+                get_session_store().save(context)
+                print(f"[保存] 登录状态已保存到: {STATE_FILE}")
+            except Exception as e:
+                print(f"[警告] 保存登录状态失败: {e}")
+        browser.close()
+
+
+def run_crawler(keyword, max_items=MAX_ITEMS, max_pages=1, ndjson=False, known=None,
+                headless=False, resource_policy=None, extraction=DEFAULT_EXTRACTION):
     """
     增强版爬虫：支持登录状态保持
+    ndjson: 为 True 时每提取到一个商品就以 NDJSON 写到标准输出，抓取结束时输出 done 事件；
+            结果只通过标准输出返回，不写 temp_data.json（后端并发启动的多个爬虫进程不会互相覆盖）
+    known: 增量抓取，上次见过的商品 {商品身份: 价格}，遇到连续的已知商品后提前停止
+    headless: 无界面模式；需要登录时不等待，提示先用 --login 登录
+    resource_policy: 请求拦截策略（none / lean / strict），默认无界面模式为 lean、有界面模式为 none
+    extraction: 提取方式（auto / json / dom）
     """
     results = []
     print(f"--- [START] 增强爬虫启动: {keyword} ---")
@@ -22,294 +429,37 @@ def run_crawler(keyword):
     login_required = False
 
     with sync_playwright() as p:
-        # 浏览器配置：强制直连，不使用代理
-        browser = p.chromium.launch(
-            headless=False,  # 显示浏览器窗口，方便登录
-            args=['--no-proxy-server']
-        )
-        
-        # 尝试加载已保存的登录状态
-        context = None
-        try:
-            if os.path.exists("browser_state.json"):
-                context = browser.new_context(
-                    storage_state="browser_state.json",
-                    user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                    viewport={"width": 1400, "height": 900}
-                )
-                print("[INFO] 已加载保存的登录状态")
-        except:
-            pass
-        
-        # 如果没有登录状态，创建新context
-        if context is None:
-            context = browser.new_context(
-                user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                viewport={"width": 1400, "height": 900}
-            )
-        
+        browser = launch_browser(p, headless=headless)
+        context = new_context(browser)
+        blocker = ResourceBlocker(context)
+        blocker.use(resource_policy or default_policy_name(headless))
         page = context.new_page()
         
         try:
-            # 访问闲鱼搜索页面
-            target_url = f"https://www.goofish.com/search?q={keyword}"
-            print(f"[访问] {target_url}")
-            page.goto(target_url, timeout=60000, wait_until="domcontentloaded")
-            
-            print("[等待] 等待页面加载（10秒）...")
-            time.sleep(10)  # 给页面更多时间加载
-            
-            # 检查是否需要登录 - 使用多种方式检测
-            print("[检查] 检查登录状态...")
-            login_detected = False
-            
-            # 方法1: 检查登录按钮
-            try:
-                login_selectors = [
-                    "text=登录",
-                    "text=立即登录",
-                    "a:has-text('登录')",
-                    ".login-btn",
-                    "[class*='login']"
-                ]
-                
-                for selector in login_selectors:
-                    try:
-                        login_btn = page.locator(selector).first
-                        if login_btn.is_visible(timeout=2000):
-                            print(f"[登录] 检测到登录按钮: {selector}")
-                            login_detected = True
-                            login_required = True
-                            keep_browser_open = True
-                            break
-                    except:
-                        continue
-            except Exception as e:
-                print(f"[DEBUG] 登录按钮检测异常: {e}")
-            
-            # 方法2: 检查页面内容是否显示需要登录
-            try:
-                page_content = page.content()
-                if "登录" in page_content and ("立即登录" in page_content or "请登录" in page_content):
-                    # 再检查是否真的需要登录（可能只是页面上的文字）
-                    if not login_detected:
-                        print("[登录] 页面内容显示可能需要登录")
-                        # 给用户一些时间手动检查
-                        login_required = True
-                        keep_browser_open = True
-            except:
-                pass
-            
-            # 如果检测到需要登录，等待用户登录
-            if login_required:
-                print("\n" + "="*50)
-                print("[登录] 检测到需要登录！")
-                print("="*50)
-                print("[步骤] 操作步骤：")
-                print("  1. 在浏览器窗口中点击登录按钮")
-                print("  2. 完成登录（扫码或输入账号密码）")
-                print("  3. 登录成功后，关闭浏览器窗口或等待自动继续")
-                print("="*50)
-                print("[等待] 等待登录中...（最多等待5分钟，您可以随时关闭窗口）")
-                print()
-                
-                # 等待用户登录（最多等待5分钟）
-                login_success = False
-                for i in range(300):  # 5分钟 = 300秒
-                    time.sleep(1)
-                    try:
-                        # 检查页面是否已登录（登录按钮消失）
-                        page_content = page.content()
-                        # 检查是否有用户信息或登录按钮消失
-                        if "登录" not in page_content or page.locator("text=登录").count() == 0:
-                            # 再次确认：尝试查找用户相关元素
-                            try:
-                                # 如果找不到登录按钮，可能已登录
-                                if page.locator("text=登录").count() == 0:
-                                    print("[成功] 登录按钮已消失，可能已登录成功！")
-                                    login_success = True
-                                    login_required = False
-                                    # 保存登录状态
-                                    try:
-                                        context.storage_state(path="browser_state.json")
-                                        print("[成功] 登录状态已保存")
-                                    except:
-                                        pass
-                                    break
-                            except:
-                                pass
-                        
-                        # 检查浏览器窗口是否被关闭
-                        if page.is_closed():
-                            print("[成功] 浏览器窗口已关闭，假设登录完成")
-                            login_success = True
-                            login_required = False
-                            break
-                    except Exception as e:
-                        # 如果页面出错，继续等待
-                        pass
-                    
-                    # 每30秒提示一次
-                    if i > 0 and i % 30 == 0:
-                        remaining = (300 - i) // 60
-                        print(f"[等待] 仍在等待登录...（剩余约{remaining}分钟）")
-                
-                if not login_success and login_required:
-                    print("[警告] 登录等待超时，继续尝试爬取...")
-            else:
-                print("[INFO] 未检测到登录需求，可能已登录或无需登录")
-            
-            # 等待商品列表加载
-            print("[检查] 等待商品列表加载...")
-            goods_loaded = False
-            try:
-                page.wait_for_selector(r"text=/¥\s*\d+/", timeout=15000)
-                print("[成功] 商品列表已加载")
-                goods_loaded = True
-            except:
-                print("[警告] 未检测到商品列表，可能原因：")
-                print("  - 需要登录")
-                print("  - 页面结构变化")
-                print("  - 网络问题")
-                keep_browser_open = True
-                
-                # 如果没加载到商品，给用户更多时间
-                if not goods_loaded:
-                    print("[等待] 等待30秒，请检查是否需要登录...")
-                    time.sleep(30)
-            
-            # 滚动页面加载更多商品
-            print("[滚动] 滚动页面加载商品...")
-            for i in range(5):
-                page.evaluate("window.scrollBy(0, document.body.scrollHeight/2)")
-                time.sleep(1.5)
-            
-            # 提取商品数据
-            print("[提取] 开始提取商品数据...")
-            
-            # 尝试多种选择器来查找商品
-            price_elements = []
-            try:
-                # 方法1: 使用价格文本
-                price_elements = page.locator(r"text=/¥\s*\d+/").all()
-                print(f"[调试] 方法1找到 {len(price_elements)} 个价格元素")
-            except Exception as e:
-                print(f"[调试] 方法1失败: {e}")
-            
-            # 如果方法1没找到，尝试其他方法
-            if len(price_elements) == 0:
-                try:
-                    # 方法2: 查找包含价格的元素
-                    price_elements = page.locator("[class*='price'], [class*='Price']").all()
-                    print(f"[调试] 方法2找到 {len(price_elements)} 个价格元素")
-                except:
-                    pass
-            
-            if len(price_elements) == 0:
-                # 方法3: 尝试查找商品卡片
-                try:
-                    cards = page.locator("[class*='item'], [class*='card'], [class*='goods']").all()
-                    print(f"[调试] 方法3找到 {len(cards)} 个商品卡片")
-                    if len(cards) > 0:
-                        price_elements = cards
-                except:
-                    pass
-            
-            # 如果还是没找到，尝试获取页面所有文本内容进行分析
-            if len(price_elements) == 0:
-                print("[调试] 尝试从页面内容中提取...")
-                try:
-                    page_text = page.inner_text("body")
-                    # 查找所有价格模式
-                    prices = re.findall(r'[¥￥]\s*([\d\.]+)', page_text)
-                    print(f"[调试] 从页面文本中找到 {len(prices)} 个价格")
-                    if len(prices) > 0:
-                        # 尝试提取商品信息
-                        # 这里可以进一步优化
-                        pass
-                except Exception as e:
-                    print(f"[调试] 页面文本提取失败: {e}")
-            
-            seen_titles = set()
-            extracted_count = 0
-            
-            for idx, price_el in enumerate(price_elements[:50]):  # 最多提取50个商品
-                try:
-                    # 尝试多种方式获取商品信息
-                    card_text = None
-                    
-                    # 方法1: 向上查找父元素
-                    try:
-                        card_text = price_el.locator("..").locator("..").inner_text()
-                    except:
-                        try:
-                            card_text = price_el.locator("..").inner_text()
-                        except:
-                            card_text = price_el.inner_text()
-                    
-                    if not card_text or len(card_text.strip()) < 5:
-                        continue
-                    
-                    # 提取价格
-                    price_match = re.search(r'[¥￥]\s*([\d\.]+)', card_text)
-                    if not price_match:
-                        continue
-                    price = price_match.group(1)
-                    
-                    # 提取标题（最长的文本行，排除价格行）
-                    lines = [l.strip() for l in card_text.split('\n') if len(l.strip()) > 4]
-                    # 过滤掉包含价格、付款、已售等关键词的行
-                    lines = [l for l in lines if not any(kw in l for kw in ["¥", "￥", "人付款", "已售", "浏览", "想要"])] 
-                    
-                    if not lines:
-                        continue
-                    
-                    title = max(lines, key=len)
-                    
-                    # 进一步过滤无效标题
-                    if len(title) < 5 or any(kw in title for kw in ["¥", "￥", "人付款", "已售", "浏览", "想要", "立即"]):
-                        continue
-                    
-                    # 去重
-                    if title not in seen_titles:
-                        seen_titles.add(title)
-                        results.append({
-                            "title": title,
-                            "price": price,
-                            "desc": "闲鱼商品"
-                        })
-                        extracted_count += 1
-                        if extracted_count <= 5:  # 只打印前5个
-                            print(f"[调试] 提取商品 {extracted_count}: {title[:30]}... - ¥{price}")
-                except Exception as e:
-                    if idx < 3:  # 只打印前3个错误
-                        print(f"[调试] 提取第 {idx+1} 个商品时出错: {e}")
-                    continue
-            
-            print(f"[成功] 成功提取 {len(results)} 个商品")
-            
-            # 如果没提取到数据，保存页面截图和HTML用于调试
-            if len(results) == 0:
-                print("[警告] 未提取到任何商品数据")
-                try:
-                    screenshot_path = os.path.join(os.path.dirname(__file__), "debug_screenshot.png")
-                    page.screenshot(path=screenshot_path)
-                    print(f"[调试] 已保存页面截图到: {screenshot_path}")
-                except:
-                    pass
+            results, login_required = crawl_keyword(
+                page, context, keyword, max_items=max_items, max_pages=max_pages,
+                on_item=emit_ndjson if ndjson else None,
+                on_event=emit_event if ndjson else None,
+                known=known, interactive=not headless, blocker=blocker, extraction=extraction
+            )
+            keep_browser_open = login_required
 
         except Exception as e:
             print(f"[错误] 爬虫错误: {e}")
             keep_browser_open = True
         
         finally:
-            # 保存数据（无论是否有结果都要保存）
-            data_file = os.path.join(os.path.dirname(__file__), "temp_data.json")
-            print(f"[保存] 保存数据到: {data_file}")
+            # 通知读取方数据已经完整，不必等待浏览器关闭
+            if ndjson:
+                print(json.dumps({"event": "done", "count": len(results)}), flush=True)
+
+            # 保存数据（无论是否有结果都要保存）；NDJSON 模式下结果已经写到标准输出，不再写共用的数据文件
             print(f"[统计] 提取到 {len(results)} 个商品")
-            with open(data_file, "w", encoding="utf-8") as f:
-                json.dump(results, f, ensure_ascii=False)
-            print(f"[成功] 数据已保存到 {data_file}")
+            if not ndjson:
+                print(f"[保存] 保存数据到: {DATA_FILE}")
+                with open(DATA_FILE, "w", encoding="utf-8") as f:
+                    json.dump(results, f, ensure_ascii=False)
+                print(f"[成功] 数据已保存到 {DATA_FILE}")
             
             # 如果结果为空，给用户提示
             if len(results) == 0:
@@ -320,8 +470,8 @@ def run_crawler(keyword):
                 print("  3. 网络连接问题")
                 print("  4. 搜索关键词无结果")
             
-            # 如果还需要登录，再等待一下
-            if login_required and keep_browser_open:
+            # 如果还需要登录，再等待一下（无界面模式下无法登录，不等待）
+            if login_required and keep_browser_open and not headless:
                 print("\n[暂停] 浏览器窗口保持打开，等待登录...")
                 print("[提示] 登录后可以关闭浏览器窗口，程序会自动保存登录状态并继续")
                 print("[提示] 或者等待5分钟后程序会自动继续")
@@ -339,14 +489,14 @@ def run_crawler(keyword):
             # 关闭浏览器前，再尝试保存登录状态
             if not login_required:
                 try:
-                    context.storage_state(path="browser_state.json")
-                    print("[保存] 已保存登录状态")
+                    get_session_store().save(context)
                 except:
                     pass
             
             # 关闭浏览器
             print("\n[关闭] 准备关闭浏览器...")
-            time.sleep(2)  # 给一点时间让用户看到消息
+            if not headless:
+                time.sleep(2)  # 给一点时间让用户看到消息
             try:
                 if browser.is_connected():
                     browser.close()
@@ -355,7 +505,26 @@ def run_crawler(keyword):
                 print(f"[警告] 关闭浏览器时出错: {e}")
 
 if __name__ == "__main__":
-    import os
-    keyword = sys.argv[1] if len(sys.argv) > 1 else "iPhone"
-    run_crawler(keyword)
-
+    import argparse
+    parser = argparse.ArgumentParser(description="闲鱼商品爬虫")
+    parser.add_argument("keyword", nargs="?", default="iPhone", help="搜索关键词")
+    parser.add_argument("--max-items", type=int, default=MAX_ITEMS, help="最多提取的商品数")
+    parser.add_argument("--max-pages", type=int, default=1, help="最多翻几页")
+    parser.add_argument("--ndjson", action="store_true", help="实时以 NDJSON 输出每个商品")
+    parser.add_argument("--known", help="增量抓取：上次见过的商品文件（JSON，{商品身份: 价格}）")
+    parser.add_argument("--headless", action="store_true", default=headless_enabled(),
+                        help="无界面模式（默认取环境变量 CRAWLER_HEADLESS）")
+    parser.add_argument("--resource-policy", choices=sorted(POLICIES), help="请求拦截策略")
+    parser.add_argument("--extraction", choices=EXTRACTION_MODES, default=DEFAULT_EXTRACTION,
+                        help="提取方式：auto（优先搜索接口）/ json / dom")
+    parser.add_argument("--login", action="store_true", help="只打开浏览器完成登录并保存登录状态")
+    args = parser.parse_args()
+    if args.login:
+        login()
+        sys.exit(0)
+    known = None
+    if args.known:
+        with open(args.known, encoding="utf-8") as f:
+            known = json.load(f)
+    run_crawler(args.keyword, max_items=args.max_items, max_pages=args.max_pages, ndjson=args.ndjson, known=known,
+                headless=args.headless, resource_policy=args.resource_policy, extraction=args.extraction)
@@ -0,0 +1,138 @@
+# 单次 page.evaluate 提取：在浏览器内遍历商品卡片，一次返回所有商品的结构化数据
+# 避免对每个元素逐个调用 locator().inner_text()（每次调用都是一次 CDP 往返）
+import re
+
+# 标题中不应出现的关键词（价格行、销量行、按钮等）
+TITLE_BLACKLIST = ["¥", "￥", "人付款", "已售", "浏览", "想要"]
+PRICE_PATTERN = re.compile(r'[¥￥]\s*([\d\.]+)')
+ITEM_ID_PATTERN = re.compile(r'[?&]id=(\d+)')
+
+EXTRACT_JS = """(limit) => {
+    const textOf = (el) => ((el && (el.innerText || el.textContent)) || '').trim();
+    const pick = (card, selectors) => {
+        for (const sel of selectors) {
+            const t = textOf(card.querySelector(sel));
+            if (t) return t;
+        }
+        return '';
+    };
+
+    // 优先按商品链接定位卡片，找不到时退回到价格元素向上两层
+    let cards = Array.from(document.querySelectorAll('a[href*="item?id="]'));
+    if (cards.length === 0) {
+        cards = Array.from(document.querySelectorAll("[class*='price'], [class*='Price']"))
+            .map(el => (el.parentElement && el.parentElement.parentElement) || el.parentElement || el);
+    }
+
+    const seen = new Set();
+    const items = [];
+    for (const card of cards) {
+        if (items.length >= limit) break;
+        if (seen.has(card)) continue;
+        seen.add(card);
+
+        const text = textOf(card);
+        if (text.length < 5) continue;
+
+        const priceText = pick(card, ["[class*='price']", "[class*='Price']"]).replace(/\\s+/g, '');
+        const priceMatch = priceText.match(/[¥￥]([\\d.]+)/) || text.match(/[¥￥]\\s*([\\d.]+)/);
+        const wantMatch = text.match(/(\\d+)\\s*人想要/);
+        const link = card.href ? card : card.querySelector('a[href]');
+        const img = card.querySelector('img');
+
+        items.push({
+            title: pick(card, ["[class*='title']", "[class*='Title']"]),
+            price: priceMatch ? priceMatch[1] : '',
+            want: wantMatch ? parseInt(wantMatch[1], 10) : null,
+            seller: pick(card, ["[class*='seller']", "[class*='nick']", "[class*='user']"]),
+            location: pick(card, ["[class*='area']", "[class*='location']", "[class*='Location']"]),
+            url: link ? link.href : '',
+            image: img ? (img.currentSrc || img.src || img.getAttribute('data-src') || '') : '',
+            text: text
+        });
+    }
+    return items;
+}"""
+
+
+def parse_card_text(card_text):
+    """
+    备用解析：从卡片文本中用正则和标题启发式提取 (title, price)
+    解析失败返回 None
+    """
+    if not card_text or len(card_text.strip()) < 5:
+        return None
+
+    # 提取价格
+    price_match = PRICE_PATTERN.search(card_text)
+    if not price_match:
+        return None
+    price = price_match.group(1)
+
+    # 提取标题（最长的文本行，排除价格行）
+    lines = [l.strip() for l in card_text.split('\n') if len(l.strip()) > 4]
+    # 过滤掉包含价格、付款、已售等关键词的行
+    lines = [l for l in lines if not any(kw in l for kw in TITLE_BLACKLIST)]
+    if not lines:
+        return None
+
+    title = max(lines, key=len)
+    return title, price
+
+
+def is_valid_title(title):
+    """过滤无效标题"""
+    return bool(title) and len(title) >= 5 and not any(kw in title for kw in TITLE_BLACKLIST + ["立即"])
+
+
+def normalize_card(raw):
+    """把浏览器返回的原始卡片整理成商品字典，页面结构不符合预期时退回到文本解析"""
+    title = (raw.get("title") or "").strip()
+    price = raw.get("price") or ""
+
+    if not is_valid_title(title) or not price:
+        parsed = parse_card_text(raw.get("text", ""))
+        if parsed is None:
+            return None
+        if not is_valid_title(title):
+            title = parsed[0]
+        if not price:
+            price = parsed[1]
+
+    if not is_valid_title(title):
+        return None
+
+    return {
+        "title": title,
+        "price": price,
+        "want": raw.get("want"),
+        "seller": raw.get("seller") or "",
+        "location": raw.get("location") or "",
+        "url": raw.get("url") or "",
+        "image": raw.get("image") or ""
+    }
+
+
+def item_identity(item):
+    """商品身份：优先用链接中的商品ID，其次是链接本身，都没有时用标题（增量抓取据此判断是否见过）"""
+    url = item.get("url") or ""
+    match = ITEM_ID_PATTERN.search(url)
+    if match:
+        return match.group(1)
+    return url or item.get("title", "")
+
+
+def same_price(a, b):
+    try:
+        return abs(float(a) - float(b)) < 0.005
+    except (TypeError, ValueError):
+        return str(a) == str(b)
+
+
+def extract_cards(page, limit=50):
+    """一次 page.evaluate 取回页面上的所有商品卡片（原始数据）"""
+    try:
+        return page.evaluate(EXTRACT_JS, limit)
+    except Exception as e:
+        print(f"[提取] 页面内提取失败: {e}")
+        return []
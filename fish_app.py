@@ -6,6 +6,7 @@ import time
 import subprocess
 import requests 
 from google import genai
+from backend.gemini_quota import backoff_delay, is_rate_limit_error, parse_retry_after
 
 # --- 1. 环境变量配置 (双重保险) ---
 os.environ["http_proxy"] = "http://127.0.0.1:7890"
@@ -133,12 +134,13 @@ if api_key:
                              st.warning("这就只剩一种可能：你的 FlClash 依然是【规则模式】。")
                              st.markdown("### ⚡️ 请立即去 FlClash 切换为【全局 / Global】模式")
                              st.stop()
-                        elif "429" in err_str:
-                            st.warning("配额耗尽，等待重试...")
-                            time.sleep(5)
+                        elif is_rate_limit_error(err_str) and attempt < max_retries - 1:
+                            delay = backoff_delay(attempt, parse_retry_after(err_str))
+                            st.warning(f"配额耗尽，{delay:.0f} 秒后重试...")
+                            time.sleep(delay)
                         elif attempt < max_retries - 1:
                             st.warning("连接波动，重试中...")
-                            time.sleep(2)
+                            time.sleep(backoff_delay(attempt))
                         else:
                             st.error("分析失败")
                             st.exception(e)
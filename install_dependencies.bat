@@ -22,15 +22,15 @@ python -m pip install --upgrade pip
 echo.
 
 echo [3/4] 安装Python依赖包...
-echo 正在安装：flask, flask-cors, playwright, google-genai, requests
+echo 正在安装：requirements.txt 中的依赖（flask, flask-cors, playwright, google-genai, requests, numpy 等）
 echo.
-python -m pip install flask flask-cors playwright google-genai requests --upgrade
+python -m pip install -r requirements.txt --upgrade
 if errorlevel 1 (
     echo.
     echo ❌ 依赖安装失败
     echo.
     echo 💡 如果遇到网络问题，可以尝试使用国内镜像：
-    echo    pip install -i https://pypi.tuna.tsinghua.edu.cn/simple flask flask-cors playwright google-genai requests
+    echo    pip install -i https://pypi.tuna.tsinghua.edu.cn/simple -r requirements.txt
     echo.
     pause
     exit /b 1
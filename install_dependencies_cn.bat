@@ -22,9 +22,9 @@ python -m pip install --upgrade pip -i https://pypi.tuna.tsinghua.edu.cn/simple
 echo.
 
 echo [3/4] 安装Python依赖包（使用清华镜像）...
-echo 正在安装：flask, flask-cors, playwright, google-genai, requests
+echo 正在安装：requirements.txt 中的依赖（flask, flask-cors, playwright, google-genai, requests, numpy 等）
 echo.
-python -m pip install -i https://pypi.tuna.tsinghua.edu.cn/simple flask flask-cors playwright google-genai requests --upgrade
+python -m pip install -i https://pypi.tuna.tsinghua.edu.cn/simple -r requirements.txt --upgrade
 if errorlevel 1 (
     echo.
     echo ❌ 依赖安装失败
@@ -0,0 +1,143 @@
+# 接口抓取：搜索页的商品列表来自 mtop 搜索接口，监听页面响应直接解析 JSON，
+# 得到商品ID、卖家ID、发布时间等完整字段，不需要逐个解析渲染后的卡片文本
+# 接口没有返回数据（结构变化、被风控拦截）时，爬虫退回到 dom_extract 的页面提取
+import json
+import os
+import time
+
+SEARCH_API = "mtop.taobao.idlemtopsearch.pc.search"
+ITEM_URL = "https://www.goofish.com/item?id={}"
+# 提取方式：auto = 优先接口，没有数据时退回页面提取；json = 只用接口；dom = 只用页面提取
+EXTRACTION_MODES = ("auto", "json", "dom")
+DEFAULT_EXTRACTION = os.environ.get("CRAWLER_EXTRACTION", "auto")
+# 接口返回这些错误码说明登录会话已失效（令牌过期 TOKEN_EXOIRED 由页面脚本自动刷新，不算失效）
+SESSION_EXPIRED_CODES = ("FAIL_SYS_SESSION_EXPIRED", "FAIL_SYS_ILLEGAL_ACCESS")
+
+
+def _dig(data, *path):
+    for key in path:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+def _int(value):
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_price_parts(parts):
+    """价格在接口中是若干文本片段（如 [{"text": "¥"}, {"text": "1299"}]），拼接后只保留数字部分"""
+    if isinstance(parts, list):
+        text = "".join(str(part.get("text", "")) for part in parts if isinstance(part, dict))
+    else:
+        text = str(parts or "")
+    text = text.replace("当前价", "").replace("¥", "").replace("￥", "").replace(",", "").strip()
+    return text
+
+
+def parse_search_item(entry):
+    """解析搜索接口 resultList 中的一个商品，结构不符合预期时返回 None"""
+    main = _dig(entry, "data", "item", "main") or {}
+    content = main.get("exContent") or {}
+    args = _dig(main, "clickParam", "args") or {}
+
+    item_id = str(content.get("itemId") or args.get("item_id") or args.get("id") or "").strip()
+    title = str(content.get("title") or _dig(content, "detailParams", "title") or "").strip()
+    price = parse_price_parts(content.get("price")) or str(args.get("price") or "").strip()
+    if not item_id or not title or not price:
+        return None
+
+    published = _int(args.get("publishTime"))
+    return {
+        "item_id": item_id,
+        "title": title,
+        "price": price,
+        "want": _int(args.get("wantNum")),
+        "seller": str(content.get("userNickName") or _dig(content, "detailParams", "userNick") or ""),
+        "seller_id": str(args.get("seller_id") or args.get("sellerId") or "") or None,
+        "location": str(content.get("area") or ""),
+        "url": ITEM_URL.format(item_id),
+        "image": str(content.get("picUrl") or ""),
+        "published_at": published / 1000 if published and published > 1e12 else published
+    }
+
+
+def load_payload(text):
+    """响应正文转为 JSON；H5 接口有时以 JSONP（callback({...})）形式返回"""
+    text = text.strip()
+    if not text.startswith("{"):
+        text = text[text.find("(") + 1:text.rfind(")")]
+    return json.loads(text)
+
+
+def parse_search_payload(payload):
+    """解析一次搜索接口响应，返回 (商品列表, 是否还有下一页)"""
+    data = (payload or {}).get("data") or {}
+    items = []
+    for entry in data.get("resultList") or []:
+        item = parse_search_item(entry)
+        if item is not None:
+            items.append(item)
+    has_next = _dig(data, "resultInfo", "hasNextPage")
+    return items, has_next
+
+
+class SearchCapture:
+    """
+    监听页面的搜索接口响应：响应到达时只记下 Response 对象，drain() 时再读取和解析，
+    事件回调中不做阻塞调用
+    """
+
+    def __init__(self, page):
+        self.page = page
+        self._pending = []
+        self.responses = 0
+        self.failures = 0
+        self.has_next = None
+        self.session_expired = False
+        self.parse_ms = 0.0
+        page.on("response", self._on_response)
+
+    def _on_response(self, response):
+        if SEARCH_API in response.url and response.status == 200:
+            self._pending.append(response)
+
+    def drain(self):
+        """解析到目前为止收到的搜索接口响应，按到达顺序返回其中的商品"""
+        pending, self._pending = self._pending, []
+        items = []
+        started = time.time()
+        for response in pending:
+            try:
+                payload = load_payload(response.text())
+            except Exception as e:
+                self.failures += 1
+                print(f"[接口] 解析搜索接口响应失败: {e}")
+                continue
+            ret = payload.get("ret") or []
+            if ret and not any(str(code).startswith("SUCCESS") for code in ret):
+                self.failures += 1
+                print(f"[接口] 搜索接口返回错误: {ret}")
+                if any(str(code).startswith(SESSION_EXPIRED_CODES) for code in ret):
+                    self.session_expired = True
+                continue
+            page_items, has_next = parse_search_payload(payload)
+            self.responses += 1
+            if has_next is not None:
+                self.has_next = has_next
+            items.extend(page_items)
+        self.parse_ms += (time.time() - started) * 1000
+        return items
+
+    def close(self):
+        try:
+            self.page.remove_listener("response", self._on_response)
+        except Exception:
+            pass
+
+    def stats(self):
+        return {"responses": self.responses, "failures": self.failures, "parse_ms": round(self.parse_ms, 1)}
@@ -0,0 +1,122 @@
+# 近似重复检测：标题字符 n-gram 的 SimHash + 价格档位，LSH 分段索引，查找候选不需要和所有商品逐一比较
+# 商家常把同一件商品改几个字重复发布，这些帖子会被归为同一簇，簇的大小（重复发布次数）也可以作为商家信号
+import hashlib
+import math
+import re
+
+SIMHASH_BITS = 64
+# 汉明距离不超过这个值视为近似重复：标题较短，只差一个型号数字（小米13 / 小米14）距离就只有 6 左右，
+# 阈值只容许标点、表情、个别字的改动；型号词还要求完全一致（见 model_tokens）
+# 64 位分成 MAX_DISTANCE + 1 段（每段 16 位），近似重复的两条至少有一段完全相同（抽屉原理），
+# 每段约 1/65536 的无关商品会落进同一个桶，查找候选是亚线性的
+MAX_DISTANCE = 3
+BANDS = MAX_DISTANCE + 1
+BAND_BITS = SIMHASH_BITS // BANDS
+SHINGLE_SIZE = 2
+# 价格档位：相邻档位相差约 15%，查找时同时看相邻档位
+PRICE_BUCKET_RATIO = 1.15
+
+_NON_WORD = re.compile(r"[\s\W_]+", re.UNICODE)
+# 型号/规格词：含数字的字母数字串（13、14pro、128g、rtx4090、1000xm4）
+_MODEL_TOKEN = re.compile(r"[a-z]*\d+[a-z0-9]*")
+
+
+def normalize_title(title):
+    """去掉空白、标点和表情，转小写"""
+    return _NON_WORD.sub("", str(title or "")).lower()
+
+
+def model_tokens(title):
+    """标题中的型号/规格词（排序后以空格连接）；两条商品的型号词不同就不算重复，不论标题多相似"""
+    text = _NON_WORD.sub(" ", str(title or "").lower())
+    return " ".join(sorted(set(_MODEL_TOKEN.findall(text))))
+
+
+def shingles(title, size=SHINGLE_SIZE):
+    text = normalize_title(title)
+    if len(text) <= size:
+        return [text] if text else []
+    return [text[i:i + size] for i in range(len(text) - size + 1)]
+
+
+def simhash(title):
+    """标题的 64 位 SimHash"""
+    weights = [0] * SIMHASH_BITS
+    for shingle in shingles(title):
+        h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    value = 0
+    for bit in range(SIMHASH_BITS):
+        if weights[bit] > 0:
+            value |= 1 << bit
+    return value
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def bands(value):
+    """SimHash 分段，返回 [(段号, 段值)]"""
+    mask = (1 << BAND_BITS) - 1
+    return [(i, value >> (i * BAND_BITS) & mask) for i in range(BANDS)]
+
+
+def price_bucket(price):
+    """价格档位（对数刻度），价格无法解析时为 -1"""
+    try:
+        price = float(price)
+    except (TypeError, ValueError):
+        return -1
+    if price <= 0:
+        return -1
+    return int(math.log(price) / math.log(PRICE_BUCKET_RATIO))
+
+
+def nearby_buckets(bucket):
+    return [bucket] if bucket < 0 else [bucket - 1, bucket, bucket + 1]
+
+
+class NearDupIndex:
+    """
+    内存中的近似重复索引（单次抓取、单次分析内使用；跨抓取的索引保存在商品库中）
+    add(item) 返回 (簇编号, 是否新簇)；每个簇保留第一次出现的商品作为代表，并记录重复发布次数
+    """
+
+    def __init__(self, max_distance=MAX_DISTANCE):
+        self.max_distance = max_distance
+        self._buckets = {}  # (段号, 段值, 价格档位) -> [簇编号]
+        self.clusters = []  # [{"simhash", "bucket", "models", "item", "count"}]
+
+    def find(self, item, value=None):
+        """查找与商品近似重复的簇（SimHash 相近且型号词相同），没有时返回 None"""
+        value = simhash(item.get("title")) if value is None else value
+        bucket = price_bucket(item.get("price"))
+        models = model_tokens(item.get("title"))
+        checked = set()
+        for band in bands(value):
+            for b in nearby_buckets(bucket):
+                for cluster_id in self._buckets.get(band + (b,), ()):
+                    if cluster_id in checked:
+                        continue
+                    checked.add(cluster_id)
+                    cluster = self.clusters[cluster_id]
+                    if cluster["models"] == models and hamming(cluster["simhash"], value) <= self.max_distance:
+                        return cluster_id
+        return None
+
+    def add(self, item):
+        value = simhash(item.get("title"))
+        cluster_id = self.find(item, value)
+        if cluster_id is not None:
+            self.clusters[cluster_id]["count"] += 1
+            return cluster_id, False
+        bucket = price_bucket(item.get("price"))
+        cluster_id = len(self.clusters)
+        self.clusters.append({
+            "simhash": value, "bucket": bucket, "models": model_tokens(item.get("title")), "item": item, "count": 1
+        })
+        for band in bands(value):
+            self._buckets.setdefault(band + (bucket,), []).append(cluster_id)
+        return cluster_id, True
@@ -0,0 +1,166 @@
+# 页面就绪检测：用网络空闲、DOM变化静止、滚动后出现新商品等事件代替固定的 time.sleep
+# 所有等待都有上限（秒），页面准备好后立即返回
+import os
+import time
+
+# 默认等待上限（秒），可通过环境变量调整
+NETWORK_IDLE_TIMEOUT = float(os.environ.get("CRAWLER_NETWORK_IDLE_TIMEOUT", "5"))
+DOM_QUIET_MS = 500         # 连续多久没有 DOM 变化视为静止（毫秒）
+DOM_QUIET_TIMEOUT = float(os.environ.get("CRAWLER_DOM_QUIET_TIMEOUT", "5"))
+GOODS_TIMEOUT = float(os.environ.get("CRAWLER_GOODS_TIMEOUT", "15"))  # 等待第一批商品出现
+SCROLL_ROUND_TIMEOUT = float(os.environ.get("CRAWLER_SCROLL_TIMEOUT", "3"))  # 每次滚动后等待新商品出现
+MAX_SCROLL_ROUNDS = int(os.environ.get("CRAWLER_MAX_SCROLLS", "10"))
+
+# 商品卡片计数：优先按商品链接计数，找不到时退回到价格元素
+COUNT_CARDS_JS = """() => {
+    const links = document.querySelectorAll('a[href*="item?id="]');
+    if (links.length > 0) return links.length;
+    return document.querySelectorAll("[class*='price'], [class*='Price']").length;
+}"""
+
+# 在页面内监听 DOM 变化，静止 quietMs 毫秒后返回 true，超过 timeoutMs 返回 false
+DOM_QUIET_JS = """([quietMs, timeoutMs]) => new Promise(resolve => {
+    let timer = null;
+    let hard = null;
+    const observer = new MutationObserver(() => {
+        clearTimeout(timer);
+        timer = setTimeout(() => done(true), quietMs);
+    });
+    const done = (quiet) => {
+        observer.disconnect();
+        clearTimeout(timer);
+        clearTimeout(hard);
+        resolve(quiet);
+    };
+    observer.observe(document.body, {childList: true, subtree: true, characterData: true});
+    timer = setTimeout(() => done(true), quietMs);
+    hard = setTimeout(() => done(false), timeoutMs);
+})"""
+
+
+def wait_for_network_idle(page, timeout=NETWORK_IDLE_TIMEOUT):
+    """等待网络空闲，超时不报错，返回是否达到空闲"""
+    try:
+        page.wait_for_load_state("networkidle", timeout=timeout * 1000)
+        return True
+    except:
+        return False
+
+
+def wait_for_dom_quiet(page, quiet_ms=DOM_QUIET_MS, timeout=DOM_QUIET_TIMEOUT):
+    """等待 DOM 停止变化，返回是否在上限内达到静止"""
+    try:
+        return bool(page.evaluate(DOM_QUIET_JS, [quiet_ms, timeout * 1000]))
+    except:
+        return False
+
+
+def count_cards(page):
+    """当前页面上的商品数量"""
+    try:
+        return page.evaluate(COUNT_CARDS_JS)
+    except:
+        return 0
+
+
+def wait_for_goods(page, timeout=GOODS_TIMEOUT):
+    """等待商品价格出现在页面上，返回是否出现"""
+    try:
+        page.wait_for_selector(r"text=/¥\s*\d+/", timeout=timeout * 1000)
+        return True
+    except:
+        return False
+
+
+def wait_for_page_ready(page, goods_timeout=GOODS_TIMEOUT, network_timeout=NETWORK_IDLE_TIMEOUT,
+                        quiet_timeout=DOM_QUIET_TIMEOUT):
+    """
+    等待搜索页就绪：商品出现 -> 网络空闲 -> DOM 静止
+    返回 (goods_loaded, 耗时秒数)
+    """
+    start = time.time()
+    goods_loaded = wait_for_goods(page, goods_timeout)
+    if goods_loaded:
+        wait_for_network_idle(page, network_timeout)
+        wait_for_dom_quiet(page, timeout=quiet_timeout)
+    elapsed = time.time() - start
+    print(f"[就绪] 商品{'已' if goods_loaded else '未'}加载，耗时 {elapsed:.1f} 秒")
+    return goods_loaded, elapsed
+
+
+def wait_for_new_cards(page, before, timeout=SCROLL_ROUND_TIMEOUT):
+    """等待商品数量超过 before，返回是否出现了新商品"""
+    try:
+        page.wait_for_function(
+            f"(before) => ({COUNT_CARDS_JS})() > before",
+            arg=before,
+            timeout=timeout * 1000
+        )
+        return True
+    except:
+        return False
+
+
+def scroll_until_stable(page, target_count=None, max_rounds=MAX_SCROLL_ROUNDS,
+                        round_timeout=SCROLL_ROUND_TIMEOUT):
+    """
+    滚动加载商品：没有新商品出现或达到目标数量时立即停止
+    返回最终的商品数量
+    """
+    count = count_cards(page)
+    for i in range(max_rounds):
+        if target_count and count >= target_count:
+            print(f"[滚动] 已达到目标数量 {target_count}，停止滚动")
+            break
+        page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+        if not wait_for_new_cards(page, count, round_timeout):
+            print(f"[滚动] 第 {i + 1} 次滚动后没有新商品，停止滚动")
+            break
+        wait_for_dom_quiet(page, timeout=round_timeout)
+        count = count_cards(page)
+        print(f"[滚动] 第 {i + 1} 次滚动后共 {count} 个商品")
+    return count
+
+
+# 点击“下一页”：返回点击前第一个商品的链接（用于判断翻页完成），没有下一页时返回 null
+NEXT_PAGE_JS = """() => {
+    const first = document.querySelector('a[href*="item?id="]');
+    const signature = first ? first.href : '';
+    const usable = (el) => el && !/disabled/i.test(el.className || '') && !el.hasAttribute('disabled');
+    let button = Array.from(document.querySelectorAll(
+        "[class*='pagination'] [class*='next'], [class*='pagination'] [class*='arrow-right']"
+    )).find(usable);
+    if (!button) {
+        button = Array.from(document.querySelectorAll('button, a, span'))
+            .find(el => (el.innerText || '').trim() === '下一页' && usable(el));
+    }
+    if (!button) return null;
+    button.click();
+    return signature;
+}"""
+
+PAGE_CHANGED_JS = """(signature) => {
+    const first = document.querySelector('a[href*="item?id="]');
+    return !!first && first.href !== signature;
+}"""
+
+
+def click_next_page(page):
+    """
+    点击下一页（只触发翻页，不等待加载完成，调用方可以趁加载时处理当前页数据）
+    返回翻页前的页面签名，没有下一页时返回 None
+    """
+    try:
+        return page.evaluate(NEXT_PAGE_JS)
+    except:
+        return None
+
+
+def wait_for_page_change(page, signature, timeout=GOODS_TIMEOUT):
+    """等待翻页后的新商品出现，返回是否翻页成功"""
+    try:
+        page.wait_for_function(PAGE_CHANGED_JS, arg=signature, timeout=timeout * 1000)
+    except:
+        return False
+    wait_for_dom_quiet(page)
+    return True
@@ -0,0 +1,157 @@
+# 请求拦截：按资源策略屏蔽图片、视频、字体和统计脚本，减少抓取时下载的字节数和渲染时间
+# 商品数据只来自页面文本和接口，图片等资源对提取没有用处；登录、验证码相关的请求始终放行
+import os
+from urllib.parse import urlparse
+
+# 统计/埋点脚本和上报接口（按域名或路径片段匹配）
+TRACKER_PATTERNS = [
+    "mmstat.com",
+    "alilog",
+    "aplus",
+    "arms-retcode",
+    "retcode.taobao.com",
+    "fourier.taobao.com",
+    "log.taobao.com",
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "hm.baidu.com",
+    "cnzz.com",
+    "umeng.com",
+]
+# 始终放行：登录、扫码、滑块验证码（被屏蔽会导致无法登录或被风控拦截），CRAWLER_RESOURCE_ALLOW 可追加（逗号分隔）
+ALLOWLIST = [
+    "passport.",
+    "login.",
+    "havanalogin",
+    "qrlogin",
+    "captcha",
+    "nocaptcha",
+    "punish",
+    "baxia",
+    "AWSC",
+] + [pattern.strip() for pattern in os.environ.get("CRAWLER_RESOURCE_ALLOW", "").split(",") if pattern.strip()]
+# 估算节省的字节数时各类资源的平均大小（被屏蔽的请求没有响应，无法得到实际大小）
+ESTIMATED_BYTES = {
+    "image": 30 * 1024,
+    "media": 500 * 1024,
+    "font": 60 * 1024,
+    "stylesheet": 20 * 1024,
+    "tracker": 15 * 1024,
+}
+
+
+class ResourcePolicy:
+    """一组屏蔽规则：屏蔽的资源类型、是否屏蔽统计脚本，以及额外放行的 URL 片段"""
+
+    def __init__(self, name, block_types=(), block_trackers=False, allow=()):
+        self.name = name
+        self.block_types = frozenset(block_types)
+        self.block_trackers = block_trackers
+        self.allow = list(ALLOWLIST) + list(allow)
+
+    @property
+    def blocks_anything(self):
+        return bool(self.block_types) or self.block_trackers
+
+    def allowed(self, url, frame_url=""):
+        return any(pattern in url or pattern in frame_url for pattern in self.allow)
+
+    def block_reason(self, url, resource_type, frame_url=""):
+        """应屏蔽时返回原因（资源类型或 tracker），放行时返回 None"""
+        if self.allowed(url, frame_url):
+            return None
+        if resource_type in self.block_types:
+            return resource_type
+        if self.block_trackers:
+            host = urlparse(url).netloc
+            if any(pattern in host or pattern in url for pattern in TRACKER_PATTERNS):
+                return "tracker"
+        return None
+
+
+POLICIES = {
+    # 不拦截（有界面登录时默认使用，页面与正常浏览一致）
+    "none": ResourcePolicy("none"),
+    # 屏蔽图片、视频、字体和统计脚本（无界面模式默认使用）
+    "lean": ResourcePolicy("lean", block_types=("image", "media", "font"), block_trackers=True),
+    # 在 lean 的基础上再屏蔽样式表（最省流量，但页面布局可能影响滚动加载，出现问题时改用 lean）
+    "strict": ResourcePolicy("strict", block_types=("image", "media", "font", "stylesheet"), block_trackers=True),
+}
+
+
+def headless_enabled():
+    """CRAWLER_HEADLESS=1 时以无界面模式运行浏览器（服务器部署），登录需要先用 --login 在有界面的浏览器中完成"""
+    return os.environ.get("CRAWLER_HEADLESS", "0").lower() in ("1", "true", "yes")
+
+
+def default_policy_name(headless):
+    """CRAWLER_RESOURCE_POLICY 指定默认策略；未指定时无界面模式用 lean，有界面模式用 none"""
+    return os.environ.get("CRAWLER_RESOURCE_POLICY") or ("lean" if headless else "none")
+
+
+def get_policy(name):
+    if name not in POLICIES:
+        raise ValueError(f"未知的资源策略: {name}（可选: {', '.join(POLICIES)}）")
+    return POLICIES[name]
+
+
+class ResourceBlocker:
+    """
+    挂在浏览器上下文上的请求拦截器，每次抓取前用 use() 切换策略并清零统计
+    策略不屏蔽任何请求时取消拦截（开启拦截后 Playwright 会停用 HTTP 缓存）
+    放行的请求交给上下文上的其他路由处理（如基准测试的 HAR 回放），没有其他路由时正常发出
+    """
+
+    def __init__(self, context):
+        self.context = context
+        self.policy = POLICIES["none"]
+        self._routed = False
+        self.reset()
+        context.on("response", self._on_response)
+
+    def use(self, name):
+        self.policy = get_policy(name)
+        if self.policy.blocks_anything and not self._routed:
+            self.context.route("**/*", self._handle)
+            self._routed = True
+        elif not self.policy.blocks_anything and self._routed:
+            self.context.unroute("**/*", self._handle)
+            self._routed = False
+        self.reset()
+
+    def reset(self):
+        self.blocked = {}
+        self.loaded_requests = 0
+        self.loaded_bytes = 0
+
+    def _handle(self, route):
+        request = route.request
+        try:
+            frame_url = request.frame.url
+        except Exception:
+            frame_url = ""
+        reason = self.policy.block_reason(request.url, request.resource_type, frame_url)
+        if reason is None:
+            route.fallback()
+            return
+        self.blocked[reason] = self.blocked.get(reason, 0) + 1
+        route.abort("blockedbyclient")
+
+    def _on_response(self, response):
+        self.loaded_requests += 1
+        try:
+            self.loaded_bytes += int(response.headers.get("content-length") or 0)
+        except (TypeError, ValueError):
+            pass
+
+    def stats(self):
+        """本次抓取的拦截统计：各类被屏蔽的请求数、估算节省的字节数、实际加载的请求数和字节数（按 Content-Length）"""
+        return {
+            "policy": self.policy.name,
+            "blocked": dict(self.blocked),
+            "blocked_requests": sum(self.blocked.values()),
+            "estimated_bytes_saved": sum(ESTIMATED_BYTES.get(reason, 0) * count for reason, count in self.blocked.items()),
+            "loaded_requests": self.loaded_requests,
+            "loaded_bytes": self.loaded_bytes
+        }
@@ -0,0 +1,184 @@
+# 登录状态管理：所有爬虫工作线程共用一份已验证的登录状态（browser_state.json）
+# 验证只看保存的 cookie（登录 cookie 是否存在、是否过期），不需要打开页面逐个检测登录按钮；
+# 写入时先写临时文件再原子替换，并发的抓取不会读到写了一半的文件，未登录的状态也不会覆盖有效的登录状态
+import json
+import os
+import tempfile
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# CRAWLER_STATE_FILE 可指定其他位置（如基准测试使用空的登录状态，结果不受本机登录情况影响）
+STATE_FILE = os.environ.get("CRAWLER_STATE_FILE") or os.path.join(BASE_DIR, "browser_state.json")
+# 登录后才会下发的 cookie（unb 为用户ID，tracknick 为昵称），任意一个存在即视为已登录
+LOGIN_COOKIES = ("unb", "tracknick")
+SESSION_DOMAINS = ("goofish.com", "taobao.com")
+
+# 页面内的登录检测：一次 page.evaluate 判断页面上是否有可见的登录入口（代替逐个选择器等待可见）
+LOGIN_PROBE_JS = """() => {
+    const visible = (el) => !!(el && el.offsetParent !== null && el.getClientRects().length);
+    const selectors = [".login-btn", "[class*='login'] a", "[class*='login'] button", "a[href*='login']"];
+    for (const sel of selectors) {
+        if (Array.from(document.querySelectorAll(sel)).some(visible)) return true;
+    }
+    const text = (document.body && document.body.innerText) || '';
+    return text.includes('立即登录') || text.includes('请登录');
+}"""
+
+
+def session_info(state, now=None):
+    """
+    根据保存的 cookie 判断登录状态，返回 {"valid", "expires_at", "user"}
+    expires_at 为登录 cookie 中最早的过期时间（会话 cookie 没有过期时间，为 None）
+    """
+    now = time.time() if now is None else now
+    login_cookies = [
+        cookie for cookie in (state or {}).get("cookies", [])
+        if cookie.get("name") in LOGIN_COOKIES
+        and any(domain in cookie.get("domain", "") for domain in SESSION_DOMAINS)
+        and cookie.get("value")
+    ]
+    expiries = [cookie["expires"] for cookie in login_cookies if (cookie.get("expires") or -1) > 0]
+    alive = [cookie for cookie in login_cookies if (cookie.get("expires") or -1) <= 0 or cookie["expires"] > now]
+    user = next((cookie["value"] for cookie in login_cookies if cookie["name"] == "tracknick"), None)
+    return {
+        "valid": bool(alive),
+        "expires_at": min(expiries) if expiries else None,
+        "user": user
+    }
+
+
+def login_key(state):
+    """登录 cookie 的值：只有重新登录（或切换账号）时才会变化，埋点等其他 cookie 的变化不影响"""
+    return tuple(sorted(
+        (cookie.get("name"), cookie.get("value"))
+        for cookie in (state or {}).get("cookies", [])
+        if cookie.get("name") in LOGIN_COOKIES
+    ))
+
+
+class SessionStore:
+    """
+    登录状态存储：读取后缓存在内存中（文件被其他进程更新时自动重新读取），创建上下文时直接使用内存中的状态
+    """
+
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._state = None
+        self._mtime = None
+        self._info = session_info(None)
+        self._invalid_reason = None
+        self.checked_at = None
+        self.saved_at = None
+
+    def _reload(self):
+        """文件有变化时重新读取（调用方需持有锁）"""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            self._state, self._mtime = None, None
+            self._info = session_info(None)
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[SESSION] 读取登录状态失败: {e}")
+            return
+        self._set_state(state, mtime)
+
+    def _set_state(self, state, mtime):
+        """更新内存中的状态；登录 cookie 变化（重新登录）时清除失效标记"""
+        if login_key(state) != login_key(self._state):
+            self._invalid_reason = None
+        self._state, self._mtime = state, mtime
+        self._info = session_info(state)
+
+    @property
+    def version(self):
+        """当前会话的版本（登录 cookie 的值），重新登录后变化，工作线程据此换用新上下文"""
+        with self._lock:
+            self._reload()
+            return login_key(self._state)
+
+    def storage_state(self):
+        """当前的登录状态（可直接传给 browser.new_context(storage_state=...)），没有时返回 None"""
+        with self._lock:
+            self._reload()
+            return self._state
+
+    def status(self):
+        with self._lock:
+            self._reload()
+            info = dict(self._info)
+            now = time.time()
+            self.checked_at = now
+            if info["expires_at"] is not None and info["expires_at"] <= now:
+                info["valid"] = False
+            if self._invalid_reason:
+                info["valid"] = False
+            info["invalid_reason"] = self._invalid_reason
+            info["exists"] = self._state is not None
+            info["checked_at"] = now
+            info["saved_at"] = self.saved_at
+            return info
+
+    def valid(self):
+        return self.status()["valid"]
+
+    def invalidate(self, reason):
+        """抓取中发现登录已失效（如接口返回会话过期），在重新登录前不再信任保存的 cookie"""
+        with self._lock:
+            if self._invalid_reason is None:
+                print(f"[SESSION] 登录状态失效: {reason}")
+            self._invalid_reason = reason
+
+    def save(self, context, force=False):
+        """
+        保存上下文的登录状态（原子替换文件），返回是否写入
+        新状态未登录而已有有效的登录状态时不覆盖（force 为 True 时除外）
+        """
+        try:
+            state = context.storage_state()
+        except Exception as e:
+            print(f"[SESSION] 读取上下文登录状态失败: {e}")
+            return False
+        info = session_info(state)
+        with self._lock:
+            self._reload()
+            if not force and not info["valid"] and self._info["valid"] and not self._invalid_reason:
+                return False
+            if state == self._state:
+                return False
+            directory = os.path.dirname(self.path) or "."
+            fd, tmp_path = tempfile.mkstemp(prefix=".browser_state.", suffix=".json", dir=directory)
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(state, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+            except Exception:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                raise
+            self._set_state(state, os.path.getmtime(self.path))
+            self.saved_at = time.time()
+        print(f"[SESSION] 登录状态已保存（{'已登录' if info['valid'] else '未登录'}）")
+        return True
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    """进程内共用的登录状态存储"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SessionStore()
+        return _store
@@ -18,7 +18,7 @@ echo ✅ Python环境正常
 
 echo.
 echo [2/3] 检查依赖包...
-python -c "import flask" >nul 2>&1
+python -c "import flask, numpy" >nul 2>&1
 if errorlevel 1 (
     echo ⚠️  正在升级pip...
     python -m pip install --upgrade pip
@@ -32,7 +32,7 @@ if errorlevel 1 (
         echo.
         echo 💡 尝试手动安装：
         echo    pip install --upgrade pip
-        echo    pip install flask flask-cors playwright google-genai requests
+        echo    pip install -r requirements.txt
         echo    playwright install chromium
         echo.
         pause
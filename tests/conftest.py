@@ -0,0 +1,10 @@
+import os
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+
+# 测试直接导入项目根目录下的模块（near_dup 等）和后端模块（listing_store 等）
+for path in (ROOT_DIR, os.path.join(ROOT_DIR, "backend")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
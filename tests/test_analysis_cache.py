@@ -0,0 +1,47 @@
+import pytest
+
+import analysis_cache
+from analysis_cache import AnalysisCache, fingerprint
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(analysis_cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_fingerprint_normalizes_title_and_price():
+    item = {"title": "  iPhone 13   128G ", "price": "2999"}
+    same = {"title": "iphone 13 128g", "price": 2999.0, "want": 10, "seller": "别人"}
+    assert fingerprint(item, "gemini-2.5-flash", "v1") == fingerprint(same, "gemini-2.5-flash", "v1")
+    assert fingerprint(item, "gemini-2.5-flash", "v1") != fingerprint({**item, "price": "2899"}, "gemini-2.5-flash", "v1")
+    assert fingerprint(item, "gemini-2.5-flash", "v1") != fingerprint(item, "gemini-2.5-pro", "v1")
+    assert fingerprint(item, "gemini-2.5-flash", "v1") != fingerprint(item, "gemini-2.5-flash", "v2")
+
+
+def test_hits_misses_and_ttl(tmp_path, clock):
+    cache = AnalysisCache(str(tmp_path / "cache.db"), ttl=100)
+    cache.put_many({"a": {"score": 8}, "b": None})
+    # 未被推荐（None）也算命中
+    assert cache.get_many(["a", "b", "c"]) == {"a": {"score": 8}, "b": None}
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 1
+
+    clock[0] += 101
+    assert cache.get_many(["a", "b"]) == {}
+    cache.put_many({"c": None})
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["evictions"] == 2
+
+
+def test_lru_eviction(tmp_path, clock):
+    cache = AnalysisCache(str(tmp_path / "cache.db"), max_entries=2)
+    cache.put_many({"a": {"score": 1}})
+    clock[0] += 1
+    cache.put_many({"b": {"score": 2}})
+    clock[0] += 1
+    cache.get_many(["a"])  # a 最近使用过，b 最久未使用
+    clock[0] += 1
+    cache.put_many({"c": {"score": 3}})
+    assert set(cache.get_many(["a", "b", "c"])) == {"a", "c"}
+    assert cache.stats()["evictions"] == 1
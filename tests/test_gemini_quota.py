@@ -0,0 +1,98 @@
+import time
+
+import pytest
+
+import gemini_quota
+from gemini_quota import BACKOFF_MAX, QuotaManager, TokenBucket, backoff_delay, parse_retry_after
+
+
+@pytest.mark.parametrize("error, expected", [
+    ("429 RESOURCE_EXHAUSTED {'details': [{'retryDelay': '17s'}]}", 17.0),
+    ('"retryDelay": "2.5s"', 2.5),
+    ("Quota exceeded. Please retry in 33.1s.", 33.1),
+    ("Retry-After: 12", 12.0),
+    ("500 INTERNAL", None),
+])
+def test_parse_retry_after(error, expected):
+    assert parse_retry_after(error) == expected
+
+
+def test_backoff_delay_bounds():
+    for attempt in range(10):
+        delay = backoff_delay(attempt)
+        full = min(BACKOFF_MAX, gemini_quota.BACKOFF_BASE * 2 ** attempt)
+        assert full / 2 <= delay <= full
+    assert backoff_delay(0, retry_after=10) >= 10
+
+
+def test_token_bucket_refill():
+    bucket = TokenBucket(60)
+    start = bucket.updated
+    bucket.take(60)
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+
+    bucket.refill(start + 2)
+    assert bucket.tokens == pytest.approx(2.0)
+    assert bucket.wait_time(2) == 0.0
+    # 补充不超过容量，速率减半时容量也减半
+    bucket.refill(start + 600)
+    assert bucket.tokens == pytest.approx(60.0)
+    bucket.refill(start + 601, factor=0.5)
+    assert bucket.tokens == pytest.approx(30.0)
+    # 超过桶容量的请求等桶满即可放行
+    assert bucket.wait_time(100, factor=0.5) == 0.0
+
+
+def test_jobs_take_turns():
+    quota = QuotaManager(rpm=100, tpm=100000)
+    a1 = quota._enqueue("key-1", "a")
+    a2 = quota._enqueue("key-1", "a")
+    b1 = quota._enqueue("key-1", "b")
+
+    assert quota._try_acquire("key-1", "a", a1, 10) == 0.0
+    # 任务 a 放行一次后轮到 b
+    assert quota._try_acquire("key-1", "a", a2, 10) > 0
+    assert quota._try_acquire("key-1", "b", b1, 10) == 0.0
+    assert quota._try_acquire("key-1", "a", a2, 10) == 0.0
+    usage = quota.utilization()["keys"][0]
+    assert usage["requests_last_minute"] == 3
+    assert usage["tokens_last_minute"] == 30
+    assert usage["waiting"] == 0
+
+
+def test_cancel_removes_waiting_job():
+    quota = QuotaManager(rpm=100, tpm=100000)
+    a1 = quota._enqueue("key-1", "a")
+    b1 = quota._enqueue("key-1", "b")
+    quota._cancel("key-1", "a", a1)
+    assert quota._try_acquire("key-1", "b", b1, 10) == 0.0
+
+
+def test_rate_limit_backoff_and_recovery():
+    quota = QuotaManager(rpm=100, tpm=100000)
+    delay = quota.report_rate_limit("key-1", retry_after=5)
+    assert delay >= 5
+    state = quota._keys["key-1"]
+    assert state.rate_factor == 0.5
+    assert state.blocked_until >= time.monotonic() + 4
+
+    ticket = quota._enqueue("key-1", "a")
+    assert quota._try_acquire("key-1", "a", ticket, 10) >= 4
+    quota._cancel("key-1", "a", ticket)
+
+    for _ in range(20):
+        quota.report_rate_limit("key-1")
+    assert state.rate_factor == gemini_quota.MIN_RATE_FACTOR
+
+    quota.report_success("key-1")
+    assert state.rate_limited == 0
+    assert state.rate_factor == pytest.approx(gemini_quota.MIN_RATE_FACTOR + gemini_quota.RATE_RECOVERY_STEP)
+
+
+def test_record_corrects_estimate():
+    quota = QuotaManager(rpm=100, tpm=1000)
+    quota.acquire("key-1", 300)
+    quota.record("key-1", 300, 100)
+    state = quota._keys["key-1"]
+    assert state.token_bucket.tokens == pytest.approx(900, abs=1)
+    assert quota.utilization()["keys"][0]["tokens_last_minute"] == 100
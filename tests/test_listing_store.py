@@ -0,0 +1,145 @@
+import sqlite3
+
+from listing_store import LSH_VERSION, ListingStore
+from near_dup import BANDS
+
+
+def make_item(item_id, title, price, **extra):
+    item = {"title": title, "price": price, "url": f"https://www.goofish.com/item?id={item_id}"}
+    item.update(extra)
+    return item
+
+
+def crawl(store, crawl_id, keyword, items, status="done"):
+    store.start_crawl(crawl_id, keyword)
+    store.save_items(crawl_id, items)
+    store.finish_crawl(crawl_id, status)
+
+
+def test_save_and_query(tmp_path):
+    store = ListingStore(str(tmp_path / "listings.db"))
+    crawl(store, "c1", "iphone", [
+        make_item(1, "iPhone 13 128G 国行", "2999"),
+        make_item(2, "iPhone 13 Pro 256G", "4599"),
+    ])
+    crawl(store, "c2", "switch", [make_item(3, "Switch OLED 日版", "1800")])
+
+    assert store.count() == 3
+    assert store.count(keyword="iphone") == 2
+    cheap = store.query(keyword="iphone", max_price=3000)
+    assert [item["item_id"] for item in cheap] == ["1"]
+    assert cheap[0]["price"] == "2999"
+    assert [item["item_id"] for item in store.crawl_items("c1")] == ["1", "2"]
+    assert store.get_crawl("c1")["data_count"] == 2
+
+
+def test_save_updates_last_seen_and_keeps_first_seen(tmp_path):
+    store = ListingStore(str(tmp_path / "listings.db"))
+    crawl(store, "c1", "iphone", [make_item(1, "iPhone 13 128G", "2999")])
+    first = store.query()[0]
+    crawl(store, "c2", "iphone", [make_item(1, "iPhone 13 128G", "2899")])
+    again = store.query()
+    assert len(again) == 1
+    assert again[0]["first_seen"] == first["first_seen"]
+    assert again[0]["last_seen"] >= first["last_seen"]
+    assert again[0]["price"] == "2899"
+
+
+def test_migrates_old_database(tmp_path):
+    """旧版本数据库缺少的列在启动时补上，旧的分段索引按当前规则重建"""
+    path = str(tmp_path / "listings.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE listings (
+            key TEXT PRIMARY KEY, item_id TEXT, url TEXT, title TEXT NOT NULL, price REAL, price_text TEXT,
+            want INTEGER, seller TEXT, location TEXT, image TEXT, first_seen REAL NOT NULL, last_seen REAL NOT NULL
+        );
+        CREATE TABLE clusters (
+            id TEXT PRIMARY KEY, simhash INTEGER NOT NULL, bucket INTEGER NOT NULL,
+            size INTEGER NOT NULL DEFAULT 0, reposts INTEGER NOT NULL DEFAULT 1, first_seen REAL NOT NULL
+        );
+        CREATE TABLE cluster_bands (band INTEGER NOT NULL, value INTEGER NOT NULL, bucket INTEGER NOT NULL,
+                                    cluster_id TEXT NOT NULL);
+        INSERT INTO listings (key, item_id, title, price, price_text, first_seen, last_seen)
+            VALUES ('id:1', '1', 'iPhone 13 128G', 2999, '2999', 1, 1);
+        INSERT INTO clusters (id, simhash, bucket, size, first_seen) VALUES ('id:1', 12345, 57, 1, 1);
+        INSERT INTO cluster_bands VALUES (0, 1, 57, 'id:1');
+    """)
+    conn.commit()
+    conn.close()
+
+    store = ListingStore(path)
+    conn = sqlite3.connect(path)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(listings)")}
+    assert {"cluster_id", "reposts", "seller_id", "published_at"} <= columns
+    assert conn.execute("SELECT models FROM clusters WHERE id = 'id:1'").fetchone()[0] == "128g 13"
+    assert conn.execute("SELECT COUNT(*) FROM cluster_bands WHERE cluster_id = 'id:1'").fetchone()[0] == BANDS
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == LSH_VERSION
+    conn.close()
+
+    item = store.query()[0]
+    assert item["title"] == "iPhone 13 128G"
+    assert item["reposts"] == 1
+
+
+def test_crawl_delta(tmp_path):
+    store = ListingStore(str(tmp_path / "listings.db"))
+    crawl(store, "c1", "iphone", [make_item(1, "iPhone 13 128G", "3000"), make_item(2, "iPhone 12 64G", "2000")])
+    crawl(store, "c2", "iphone", [make_item(1, "iPhone 13 128G", "2800"), make_item(3, "iPhone 14 256G", "4500")])
+
+    delta = store.crawl_delta("c2", complete=True)
+    assert [item["item_id"] for item in delta["new"]] == ["3"]
+    assert [(item["item_id"], item["price"], item["previous_price"]) for item in delta["price_drops"]] == [
+        ("1", "2800", "3000")
+    ]
+    assert [item["item_id"] for item in delta["removed"]] == ["2"]
+
+    # 不完整的抓取无法判断商品是否下架
+    assert store.crawl_delta("c2")["removed"] == []
+    assert store.crawl_delta("missing") is None
+
+
+def test_crawl_delta_ignores_other_keywords_and_price_rises(tmp_path):
+    store = ListingStore(str(tmp_path / "listings.db"))
+    crawl(store, "c1", "iphone", [make_item(1, "iPhone 13 128G", "3000")])
+    crawl(store, "c2", "苹果", [make_item(1, "iPhone 13 128G", "2500")])
+    crawl(store, "c3", "iphone", [make_item(1, "iPhone 13 128G", "3100")])
+
+    assert [item["item_id"] for item in store.crawl_delta("c2")["new"]] == ["1"]
+    delta = store.crawl_delta("c3")
+    assert delta["new"] == [] and delta["price_drops"] == []
+
+
+def test_near_duplicates_collapse_to_cheapest(tmp_path):
+    store = ListingStore(str(tmp_path / "listings.db"))
+    crawl(store, "c1", "iphone", [
+        make_item(1, "iPhone 13 128G 国行 电池95", "3000"),
+        make_item(2, "iPhone 13 128G 国行 电池95！", "2950"),
+        make_item(3, "iPhone 14 128G 国行 电池95", "3000"),
+    ])
+    # 另一次抓取中再次发布的同一商品归入已有的簇
+    crawl(store, "c2", "iphone", [make_item(4, "iPhone 13 128G，国行，电池95", "2980")])
+
+    assert store.count() == 4
+    assert store.count(collapse=True) == 2
+    collapsed = {item["item_id"]: item for item in store.query(collapse=True, order="price")}
+    assert set(collapsed) == {"2", "3"}
+    assert collapsed["2"]["reposts"] == 3
+    assert collapsed["3"]["reposts"] == 1
+    assert {item["cluster_id"] for item in store.query() if item["item_id"] != "3"} == {collapsed["2"]["cluster_id"]}
+
+
+def test_update_reposts(tmp_path):
+    store = ListingStore(str(tmp_path / "listings.db"))
+    item = make_item(1, "iPhone 13 128G", "3000")
+    crawl(store, "c1", "iphone", [item])
+    assert item["reposts"] == 1
+
+    item["reposts"] = 4
+    store.update_reposts([item])
+    assert item["reposts"] == 4
+    assert store.query()[0]["reposts"] == 4
+    # 重复发布次数只增不减
+    item["reposts"] = 2
+    store.update_reposts([item])
+    assert store.query()[0]["reposts"] == 4
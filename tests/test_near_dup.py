@@ -0,0 +1,45 @@
+from near_dup import MAX_DISTANCE, NearDupIndex, hamming, model_tokens, price_bucket, simhash
+
+
+def test_punctuation_and_spacing_do_not_change_simhash():
+    assert simhash("iPhone 13 128G 国行") == simhash("iphone13，128g！国行")
+
+
+def test_model_tokens():
+    assert model_tokens("小米13 Pro 12+256G") == "12 13 256g"
+    assert model_tokens("索尼耳机 WH-1000XM4") == "1000xm4"
+    assert model_tokens("九成新自行车") == ""
+
+
+def test_price_bucket():
+    assert price_bucket("abc") == -1
+    assert price_bucket(0) == -1
+    assert abs(price_bucket(1000) - price_bucket(1100)) <= 1
+    assert abs(price_bucket(1000) - price_bucket(2000)) > 1
+
+
+def test_index_groups_reposts():
+    index = NearDupIndex()
+    assert index.add({"title": "iPhone 13 128G 国行 电池95", "price": "3000"}) == (0, True)
+    assert index.add({"title": "iPhone 13 128G 国行，电池95！", "price": "2950"}) == (0, False)
+    assert index.clusters[0]["count"] == 2
+
+
+def test_index_keeps_different_models_and_prices_apart():
+    index = NearDupIndex()
+    index.add({"title": "小米13 12+256G 黑色", "price": "2500"})
+    # 只差型号数字：汉明距离可能很小，但型号词不同
+    assert index.add({"title": "小米14 12+256G 黑色", "price": "2500"})[1]
+    # 标题相同、价格相差一倍
+    assert index.add({"title": "小米13 12+256G 黑色", "price": "5000"})[1]
+    assert len(index.clusters) == 3
+
+
+def test_distance_threshold():
+    first = {"title": "任天堂 Switch OLED 日版 白色 带两个手柄", "price": "1800"}
+    second = {"title": "任天堂 Switch OLED 日版 白色 带两个手柄 送卡带", "price": "1800"}
+    distance = hamming(simhash(first["title"]), simhash(second["title"]))
+    assert distance > MAX_DISTANCE
+    index = NearDupIndex()
+    index.add(first)
+    assert index.add(second) == (1, True)
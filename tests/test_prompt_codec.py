@@ -0,0 +1,43 @@
+from prompt_codec import COLUMNS, HEADERS, columns_of, decode_results, encode_batch
+
+
+def test_round_trip_with_tabs_and_newlines():
+    chunk = [
+        {"key": "id:1", "title": "iPhone 13\t128G\n国行 电池95", "price": "2999", "want": 5, "seller": "小王",
+         "location": "上海", "url": "https://www.goofish.com/item?id=1"},
+        {"key": "id:2", "title": "iPhone 12\r\n\t64G  ", "price": 1999.0, "want": None, "seller": "a\tb",
+         "location": "", "url": ""},
+    ]
+    lines = encode_batch(chunk).split("\n")
+    assert len(lines) == len(chunk) + 1
+    header = lines[0].split("\t")
+    assert header == ["id", HEADERS["price"], HEADERS["want"], HEADERS["seller"], HEADERS["location"], HEADERS["title"]]
+    rows = [line.split("\t") for line in lines[1:]]
+    assert all(len(row) == len(header) for row in rows)
+    assert rows[0] == ["1", "2999", "5", "小王", "上海", "iPhone 13 128G 国行 电池95"]
+    assert rows[1] == ["2", "1999", "", "a b", "", "iPhone 12 64G"]
+
+    matched = decode_results(chunk, [{"id": 2, "reason": "价格低", "score": 8}, {"id": "1", "reason": "成色好", "score": 7}])
+    # 标题、价格和链接取自原商品，不受编码时的空白替换影响
+    assert matched[0] == {"title": chunk[0]["title"], "price": "2999", "url": chunk[0]["url"], "reason": "成色好",
+                          "score": 7, "key": "id:1"}
+    assert matched[1]["title"] == chunk[1]["title"]
+    assert matched[1]["price"] == "1999.0"
+    assert matched[1]["key"] == "id:2"
+
+
+def test_decode_drops_invalid_rows():
+    chunk = [{"title": "Switch OLED", "price": "1800"}]
+    results = [{"id": 0}, {"id": 2}, {"id": "x"}, "not a dict", {"reason": "无编号"}, {"id": 1, "score": 6}]
+    matched = decode_results(chunk, results)
+    assert list(matched) == [0]
+    assert matched[0]["score"] == 6
+    assert "key" not in matched[0]
+
+
+def test_columns_skip_empty_and_single_posts():
+    chunk = [{"title": "A", "price": "1", "reposts": 1}, {"title": "B", "price": "2", "seller": ""}]
+    assert columns_of(chunk) == ["price", "title"]
+    chunk.append({"title": "C", "price": "3", "reposts": 3})
+    assert columns_of(chunk) == ["price", "reposts", "title"]
+    assert set(COLUMNS) == set(HEADERS)